@@ -0,0 +1,43 @@
+import argparse
+import time
+import numpy as np
+import modes
+from config.settings import Settings
+
+
+def time_kernel(kernel, fill_ratio, frames, grid_shape, seed):
+    np.random.seed(seed)
+    mode = modes.SandMode(grid_shape=grid_shape, kernel=kernel)
+    grid = np.random.rand(*grid_shape) < fill_ratio
+
+    frame_times = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        grid = mode.update(grid)
+        frame_times.append(time.perf_counter() - start)
+    return 1000 * np.mean(frame_times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.sand',
+                                     description='Compare the row based and per particle sand kernels')
+    parser.add_argument('--fill', type=float, nargs='+', default=[0.05, 0.1, 0.25, 0.5, 0.75])
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--height', type=int, default=Settings.GRID_HEIGHT)
+    parser.add_argument('--width', type=int, default=Settings.GRID_WIDTH)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    grid_shape = (args.height, args.width)
+    print(f"sand on {args.width}x{args.height}, {args.frames} frames per run, mean ms/frame")
+    print(f"{'fill':>6} {'particle':>10} {'rows':>10} {'speedup':>9} {'auto':>10}")
+    for fill_ratio in args.fill:
+        particle_ms = time_kernel('particle', fill_ratio, args.frames, grid_shape, args.seed)
+        rows_ms = time_kernel('rows', fill_ratio, args.frames, grid_shape, args.seed)
+        auto_ms = time_kernel('auto', fill_ratio, args.frames, grid_shape, args.seed)
+        print(f"{fill_ratio:>6.3f} {particle_ms:>10.2f} {rows_ms:>10.2f} {particle_ms / rows_ms:>8.1f}x "
+              f"{auto_ms:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import inspect
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pyglet
+# the renderer draws into a hidden window, which needs no display
+pyglet.options['headless'] = True
+import kernels
+import modes
+from camera import Camera
+from cli import parse_size
+from config.settings import Settings
+from direction import Direction as dir
+from renderer import GridRenderer
+
+DEFAULT_SIZES = ['320x180', '512x512']
+DEFAULT_DENSITIES = [0.1, Settings.INITIAL_LIFE_CHANCE, 0.5]
+
+
+def make_mode(mode_class, grid_shape, backend=None):
+    parameters = inspect.signature(mode_class).parameters
+    arguments = {}
+    if 'grid_shape' in parameters:
+        arguments['grid_shape'] = grid_shape
+    if backend is not None:
+        arguments['backend'] = backend
+    return mode_class(**arguments)
+
+
+def cases(sizes, densities):
+    # (name, grid shape, density, function building a step callable from a grid)
+    for width, height in sizes:
+        shape = (height, width)
+        for density in densities:
+            suffix = f"{width}x{height}/d{density:g}"
+
+            for mode_class in modes.Mode.__subclasses__():
+                if mode_class is modes.CellularAutomataMode:
+                    continue
+                yield f"mode/{mode_class.__name__}/{suffix}", shape, density, \
+                    lambda mode_class=mode_class, shape=shape: make_mode(mode_class, shape).update
+
+            for backend in modes.CellularAutomataMode.Backends:
+                for preset in modes.CellularAutomataMode.Presets:
+                    mode = make_mode(modes.CellularAutomataMode, shape, backend)
+                    mode.load_preset(preset)
+                    # bit planes only hold two states, other rules would time the lookup path twice
+                    if backend != 'convolve' and mode.rule.states > 2:
+                        continue
+                    yield f"ca/{backend}/{preset}/{suffix}", shape, density, lambda mode=mode: mode.update
+
+            if render_window() is not None:
+                yield f"render/texture/{suffix}", shape, density, lambda shape=shape: render_step(shape)
+
+
+_render_window = None
+
+
+def render_window():
+    # a hidden window whose GL context the renderers draw with, None where no context can be created
+    global _render_window
+    if _render_window is None:
+        try:
+            _render_window = pyglet.window.Window(Settings.WINDOW_WIDTH, Settings.WINDOW_HEIGHT, visible=False)
+        except Exception as error:
+            print(f"render cases skipped, no GL context: {error}", file=sys.stderr)
+            _render_window = False
+    return _render_window or None
+
+
+def render_step(shape):
+    # what update_visuals does for a grid that changed everywhere, with the camera of the window:
+    # the visible cells copied into the index buffer of the renderer, then uploaded to its texture
+    camera = Camera(shape, viewport=(Settings.WINDOW_MARGIN[dir.Left], Settings.WINDOW_MARGIN[dir.Bottom],
+                                     Settings.VISUAL_GRID_WIDTH, Settings.VISUAL_GRID_HEIGHT))
+    camera.zoom_to(min(Settings.CELL_WIDTH, camera.fit_zoom()))
+    renderer = GridRenderer(camera)
+
+    def step(grid):
+        renderer.draw_grid(grid)
+        # the upload is only done once the GL has copied the rows
+        pyglet.gl.glFinish()
+        return grid
+
+    return step
+
+
+def time_case(build_step, shape, density, frames, warmup, seed):
+    np.random.seed(seed)
+    grid = np.random.rand(*shape) < density
+    step = build_step()
+
+    for _ in range(warmup):
+        grid = step(grid)
+
+    frame_times = np.empty(frames)
+    for frame in range(frames):
+        start = time.perf_counter()
+        grid = step(grid)
+        frame_times[frame] = time.perf_counter() - start
+
+    milliseconds = frame_times * 1000
+    return {
+        'gens_per_sec': frames / frame_times.sum(),
+        'ms_mean': float(milliseconds.mean()),
+        'ms_p50': float(np.percentile(milliseconds, 50)),
+        'ms_p90': float(np.percentile(milliseconds, 90)),
+        'ms_p99': float(np.percentile(milliseconds, 99)),
+    }
+
+
+def run(args):
+    # strategies are tuned afresh and not saved, so results never depend on earlier runs
+    kernels.autotuner = kernels.Autotuner(path=None)
+    results = {}
+    for name, shape, density, build_step in cases(args.sizes, args.densities):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = time_case(build_step, shape, density, args.frames, args.warmup, args.seed)
+        print(f"{name:<55} {results[name]['gens_per_sec']:>10.1f} gen/s {results[name]['ms_p50']:>9.2f} ms p50")
+
+    report = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'frames': args.frames,
+            'warmup': args.warmup,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    with open(args.out, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"saved {len(results)} results to {args.out}")
+
+
+def compare(args):
+    with open(args.baseline) as file:
+        baseline = json.load(file)['results']
+    with open(args.current) as file:
+        current = json.load(file)['results']
+
+    # a case regresses when its median frame time grows by more than the threshold
+    failures = 0
+    for name in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[name][args.metric], current[name][args.metric]
+        change = (after - before) / before if before else 0.0
+        failed = change > args.threshold
+        failures += failed
+        print(f"{'FAIL' if failed else 'ok':<5} {name:<55} {before:>9.2f} -> {after:>9.2f} ms ({change:+.1%})")
+
+    for name in sorted(baseline.keys() - current.keys()):
+        print(f"{'gone':<5} {name}")
+    for name in sorted(current.keys() - baseline.keys()):
+        print(f"{'new':<5} {name}")
+
+    print(f"{failures} of {len(baseline.keys() & current.keys())} cases slower by more than {args.threshold:.0%}")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite', description='Headless benchmark suite')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='time every mode, preset and the render path')
+    run_parser.add_argument('--out', default='benchmark.json')
+    run_parser.add_argument('--sizes', type=parse_size, nargs='+', default=[parse_size(size) for size in DEFAULT_SIZES],
+                            help='grid sizes as WIDTHxHEIGHT')
+    run_parser.add_argument('--densities', type=float, nargs='+', default=DEFAULT_DENSITIES)
+    run_parser.add_argument('--frames', type=int, default=20)
+    run_parser.add_argument('--warmup', type=int, default=2)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--filter', default='', help='only run cases whose name contains this text')
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='allowed slowdown as a fraction, e.g. 0.1 for 10%%')
+    compare_parser.add_argument('--metric', choices=['ms_mean', 'ms_p50', 'ms_p90', 'ms_p99'], default='ms_p50')
+
+    args = parser.parse_args(argv)
+    match args.command:
+        case 'run':
+            run(args)
+        case 'compare':
+            sys.exit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import numpy as np
+
+
+class BitPackedLife:
+    # cells are stored 64 to a word, cell x of a row lives in bit x % 64 of word x // 64
+    WORD_BITS = 64
+
+    _ONE = np.uint64(1)
+    _HIGH_BIT_SHIFT = np.uint64(WORD_BITS - 1)
+
+    def __init__(self, birth, survival):
+        # birth and survival are the neighbour counts (0 - 8) that create or keep a live cell
+        self.birth = frozenset(birth)
+        self.survival = frozenset(survival)
+
+    @classmethod
+    def from_limits(cls, underpopulation_limit, overpopulation_limit, reproduction_requirement):
+        return cls(birth=[reproduction_requirement],
+                   survival=range(underpopulation_limit, overpopulation_limit + 1))
+
+    @classmethod
+    def pack(cls, grid):
+        height, width = grid.shape
+        words_per_row = -(-width // cls.WORD_BITS)
+        padded = np.zeros((height, words_per_row * cls.WORD_BITS), dtype=bool)
+        padded[:, :width] = grid
+        packed_bytes = np.packbits(padded, axis=1, bitorder='little')
+        return packed_bytes.view(np.dtype('<u8')).astype(np.uint64, copy=False)
+
+    @classmethod
+    def unpack(cls, words, width):
+        packed_bytes = words.astype(np.dtype('<u8'), copy=False).view(np.uint8)
+        return np.unpackbits(packed_bytes, axis=1, count=width, bitorder='little').view(bool)
+
+    @classmethod
+    def padding_mask(cls, width):
+        # mask of the bits in the last word of a row that hold real cells
+        used_bits = width % cls.WORD_BITS
+        if used_bits == 0:
+            return np.uint64(0xFFFFFFFFFFFFFFFF)
+        return np.uint64((1 << used_bits) - 1)
+
+    def step(self, grid):
+        # dying states of generations rules left in the grid count as dead
+        words = self.pack(grid == 1)
+        return self.unpack(self.step_packed(words, grid.shape[1]), grid.shape[1])
+
+    def run_packed(self, words, width, generations):
+        for _ in range(generations):
+            words = self.step_packed(words, width)
+        return words
+
+    def step_packed(self, words, width):
+        one, high = self._ONE, self._HIGH_BIT_SHIFT
+
+        # horizontal neighbours, carrying the edge bit across word boundaries
+        west = words << one
+        west[:, 1:] |= words[:, :-1] >> high
+        east = words >> one
+        east[:, :-1] |= words[:, 1:] << high
+
+        # per row sums as bit planes: three cells (west, centre, east) and two cells (west, east)
+        partial = west ^ east
+        row3_0 = partial ^ words
+        row3_1 = (west & east) | (partial & words)
+        row2_0 = partial
+        row2_1 = west & east
+
+        # rows above and below, zero filled outside the grid
+        up_0, up_1 = np.zeros_like(words), np.zeros_like(words)
+        up_0[:-1], up_1[:-1] = row3_0[1:], row3_1[1:]
+        down_0, down_1 = np.zeros_like(words), np.zeros_like(words)
+        down_0[1:], down_1[1:] = row3_0[:-1], row3_1[:-1]
+
+        # up + down, two bit numbers into three bits
+        a0 = up_0 ^ down_0
+        carry = up_0 & down_0
+        partial = up_1 ^ down_1
+        a1 = partial ^ carry
+        a2 = (up_1 & down_1) | (partial & carry)
+
+        # add the middle row, giving the neighbour count in four bit planes
+        count_0 = a0 ^ row2_0
+        carry = a0 & row2_0
+        partial = a1 ^ row2_1
+        count_1 = partial ^ carry
+        carry = (a1 & row2_1) | (partial & carry)
+        count_2 = a2 ^ carry
+        count_3 = a2 & carry
+
+        planes = (count_0, count_1, count_2, count_3)
+        born = self._count_matches(planes, self.birth, words)
+        survive = self._count_matches(planes, self.survival, words)
+        new_words = (born & ~words) | (survive & words)
+
+        # cells past the right edge of the grid are always dead
+        new_words[:, -1] &= self.padding_mask(width)
+        return new_words
+
+    @staticmethod
+    def _count_matches(planes, counts, like):
+        result = np.zeros_like(like)
+        for count in counts:
+            match = ~np.zeros_like(like)
+            for bit, plane in enumerate(planes):
+                match &= plane if (count >> bit) & 1 else ~plane
+            result |= match
+        return result
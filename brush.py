@@ -0,0 +1,105 @@
+import numpy as np
+from scipy.ndimage import binary_dilation
+from neighbourhoods import Neighbourhood
+
+
+class Brush:
+    # a brush as a boolean mask of the cells it paints, every cell once, centred on (centre_y, centre_x)
+    # strokes are the brush swept along the line between two mouse positions, as one mask
+
+    def __init__(self, mask, centre_y=None, centre_x=None, radius=None):
+        self.mask = np.ascontiguousarray(mask, dtype=bool)
+        self.height, self.width = self.mask.shape
+        self.centre_y = self.height // 2 if centre_y is None else centre_y
+        self.centre_x = self.width // 2 if centre_x is None else centre_x
+        # discs sweep into capsules, which cost the same at any radius
+        self.radius = radius
+
+    @classmethod
+    def from_offsets(cls, offsets):
+        # offsets as rows of (dx, dy), duplicates only set their cell once
+        offsets = np.asarray(offsets)
+        radius = int(np.abs(offsets).max())
+        mask = np.zeros((2 * radius + 1, 2 * radius + 1), dtype=bool)
+        mask[radius + offsets[:, 1], radius + offsets[:, 0]] = True
+        return cls(mask)
+
+    @classmethod
+    def from_neighbourhood(cls, nb):
+        # the cells of a neighbourhoods.Neighbourhood spec around the centre
+        return cls.from_offsets(Neighbourhood.get_offsets(nb))
+
+    @classmethod
+    def disc(cls, radius):
+        y, x = np.ogrid[-radius:radius + 1, -radius:radius + 1]
+        return cls(x * x + y * y <= radius * radius + radius, radius=radius)
+
+    @classmethod
+    def square(cls, radius):
+        return cls(np.ones((2 * radius + 1, 2 * radius + 1), dtype=bool))
+
+    @property
+    def size(self):
+        return int(np.count_nonzero(self.mask))
+
+    def stamp_region(self, grid_shape, x, y):
+        # (top, left, mask) of the brush centred on cell (x, y), clipped to the grid, None when fully outside
+        return self._clip(grid_shape, y - self.centre_y, x - self.centre_x, self.mask)
+
+    def stroke_region(self, grid_shape, x0, y0, x1, y1):
+        # (top, left, mask) of the brush swept from cell (x0, y0) to cell (x1, y1), clipped to the grid
+        if (x0, y0) == (x1, y1):
+            return self.stamp_region(grid_shape, x1, y1)
+
+        if self.radius is not None:
+            return self._capsule_region(grid_shape, x0, y0, x1, y1)
+
+        # the centres along the line, one per step of the longer axis
+        steps = max(abs(x1 - x0), abs(y1 - y0))
+        t = np.arange(steps + 1) / steps
+        xs = np.rint(x0 + (x1 - x0) * t).astype(np.int64)
+        ys = np.rint(y0 + (y1 - y0) * t).astype(np.int64)
+
+        # only centres whose brush reaches the grid matter, the rest of the line is dropped
+        grid_height, grid_width = grid_shape
+        reaches = ((ys - self.centre_y + self.height > 0) & (ys - self.centre_y < grid_height)
+                   & (xs - self.centre_x + self.width > 0) & (xs - self.centre_x < grid_width))
+        xs, ys = xs[reaches], ys[reaches]
+        if not len(xs):
+            return None
+
+        # the centres are marked in a window holding the whole stroke, then every one is grown into the brush
+        top, left = int(ys.min()) - self.centre_y, int(xs.min()) - self.centre_x
+        height = int(ys.max()) - int(ys.min()) + self.height
+        width = int(xs.max()) - int(xs.min()) + self.width
+        centres = np.zeros((height, width), dtype=bool)
+        centres[ys - top, xs - left] = True
+        stroke = binary_dilation(centres, structure=self.mask,
+                                 origin=(self.centre_y - self.height // 2, self.centre_x - self.width // 2))
+        return self._clip(grid_shape, top, left, stroke)
+
+    def _capsule_region(self, grid_shape, x0, y0, x1, y1):
+        # every cell within the radius of the segment, the same test the disc mask uses
+        top, left = min(y0, y1) - self.radius, min(x0, x1) - self.radius
+        bottom, right = max(y0, y1) + self.radius + 1, max(x0, x1) + self.radius + 1
+        clipped = self._clip(grid_shape, top, left, np.empty((bottom - top, right - left), dtype=bool))
+        if clipped is None:
+            return None
+        top, left, window = clipped
+
+        y = np.arange(top, top + window.shape[0])[:, None] - y0
+        x = np.arange(left, left + window.shape[1])[None, :] - x0
+        dx, dy = x1 - x0, y1 - y0
+        # position of the closest point of the segment, 0 at (x0, y0) and 1 at (x1, y1)
+        t = np.clip((x * dx + y * dy) / (dx * dx + dy * dy), 0, 1)
+        distance_x, distance_y = x - t * dx, y - t * dy
+        return top, left, distance_x * distance_x + distance_y * distance_y <= self.radius * (self.radius + 1)
+
+    @staticmethod
+    def _clip(grid_shape, top, left, mask):
+        grid_height, grid_width = grid_shape
+        y0, x0 = max(top, 0), max(left, 0)
+        y1, x1 = min(top + mask.shape[0], grid_height), min(left + mask.shape[1], grid_width)
+        if y0 >= y1 or x0 >= x1:
+            return None
+        return y0, x0, mask[y0 - top:y1 - top, x0 - left:x1 - left]
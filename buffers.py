@@ -0,0 +1,185 @@
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+from config.settings import Settings
+
+
+class GridBuffers:
+    # two preallocated generations of the grid, each inside a border of `halo` cells, and the scratch arrays
+    # a step needs, modes read the front grid and write the back grid, then the two are swapped
+    # "fill" boundaries keep the border dead, "wrap" boundaries copy the opposite edges into it before a step
+
+    Boundaries = ("fill", "wrap")
+
+    def __init__(self, grid_shape, halo=Settings.GRID_HALO, boundary=Settings.BOUNDARY, dtype=np.uint8):
+        if boundary not in self.Boundaries:
+            raise ValueError(f"unknown boundary '{boundary}', expected one of {self.Boundaries}")
+        self.shape = tuple(grid_shape)
+        self.halo = halo
+        self.boundary = boundary
+        height, width = self.shape
+
+        self._padded = [np.zeros((height + 2 * halo, width + 2 * halo), dtype=dtype) for _ in range(2)]
+        # views of the cells inside the border, created once so a grid can be recognised by identity
+        self._grids = [padded[halo:halo + height, halo:halo + width] for padded in self._padded]
+        self._front = 0
+        # counts swaps and edits, whatever was derived from the front grid holds as long as it stays the same
+        self.version = 0
+
+        # live cells of the front grid with its border, and scratch arrays for neighbour counts and table lookups
+        self.alive = np.zeros_like(self._padded[0])
+        # np.take converts any other index type to intp, into a temporary as large as the grid
+        self.index = np.zeros(self.shape, dtype=np.intp)
+        self._scratch = {}
+
+    @property
+    def grid(self):
+        return self._grids[self._front]
+
+    @property
+    def next_grid(self):
+        return self._grids[1 - self._front]
+
+    @property
+    def padded(self):
+        return self._padded[self._front]
+
+    def swap(self):
+        self._front = 1 - self._front
+        self.version += 1
+
+    def edited(self):
+        # the front grid was changed in place
+        self.version += 1
+
+    def store(self, grid):
+        # makes grid the next generation, copied into the back buffer unless a mode already wrote it there
+        if grid is not self.next_grid:
+            np.copyto(self.next_grid, grid, casting='unsafe')
+        self.swap()
+
+    def set_boundary(self, boundary):
+        if boundary not in self.Boundaries:
+            raise ValueError(f"unknown boundary '{boundary}', expected one of {self.Boundaries}")
+        self.boundary = boundary
+        if boundary == "fill":
+            # the border of both buffers has to be dead again
+            for padded in self._padded:
+                padded[:self.halo] = 0
+                padded[-self.halo:] = 0
+                padded[:, :self.halo] = 0
+                padded[:, -self.halo:] = 0
+
+    def refresh_halo(self, padded=None):
+        # copies the opposite edges of the grid into its border, only the border cells are written
+        if self.boundary != "wrap" or not self.halo:
+            return
+        padded = self.padded if padded is None else padded
+        halo, (height, width) = self.halo, self.shape
+        if halo > height or halo > width:
+            # the border is wider than the grid, so the grid repeats in it more than once
+            rows = (np.arange(height + 2 * halo) - halo) % height + halo
+            columns = (np.arange(width + 2 * halo) - halo) % width + halo
+            padded[...] = padded[np.ix_(rows, columns)]
+            return
+        # rows first, then whole columns including the corners the rows just filled
+        padded[:halo, halo:halo + width] = padded[height:height + halo, halo:halo + width]
+        padded[height + halo:, halo:halo + width] = padded[halo:2 * halo, halo:halo + width]
+        padded[:, :halo] = padded[:, width:width + halo]
+        padded[:, width + halo:] = padded[:, halo:2 * halo]
+
+    def scratch(self, name, dtype):
+        # a reusable grid sized array, one per name and dtype
+        key = (name, np.dtype(dtype))
+        array = self._scratch.get(key)
+        if array is None:
+            array = self._scratch[key] = np.zeros(self.shape, dtype=dtype)
+        return array
+
+    def covers(self, compiled):
+        # whether the border is wide enough for a kernel
+        return (compiled.origin_y <= self.halo and compiled.height - 1 - compiled.origin_y <= self.halo
+                and compiled.origin_x <= self.halo and compiled.width - 1 - compiled.origin_x <= self.halo)
+
+    def fits(self, compiled):
+        # whether a kernel can be counted with count, within the border and small enough to sum slice by slice
+        return self.covers(compiled) and compiled.size <= Settings.BUFFERED_KERNEL_ENTRIES
+
+    def count(self, padded, compiled, max_value=1):
+        # neighbours of every grid cell as the weighted sum of shifted views of the padded grid,
+        # with the same kernel orientation as convolve2d, into a reused array
+        weights = compiled.kernel
+        positive = bool((weights >= 0).all())
+        largest = int(np.abs(weights).sum()) * max_value
+        dtype = np.uint8 if positive and largest <= 0xFF else np.uint16 if positive and largest <= 0xFFFF \
+            else np.int32
+        counts = self.scratch('counts', dtype)
+
+        height, width = self.shape
+        first = True
+        for i, j in zip(*np.nonzero(weights)):
+            # kernel entry (i, j) reads the cell origin - i rows and origin - j columns away
+            dy = self.halo + compiled.origin_y - i
+            dx = self.halo + compiled.origin_x - j
+            view = padded[dy:dy + height, dx:dx + width]
+            weight = int(weights[i, j])
+            if weight == 1:
+                if first:
+                    np.copyto(counts, view, casting='unsafe')
+                else:
+                    np.add(counts, view, out=counts, casting='unsafe')
+            else:
+                term = self.scratch('term', dtype)
+                np.multiply(view, weight, out=term, casting='unsafe')
+                if first:
+                    np.copyto(counts, term)
+                else:
+                    np.add(counts, term, out=counts)
+            first = False
+        if first:
+            counts.fill(0)
+        return counts
+
+
+class AllocationCounter:
+    # bytes allocated while stepping, measured with tracemalloc, which numpy reports its array buffers to
+    # the figure for a step is the peak of memory allocated on top of what was held before it
+
+    def __init__(self):
+        self.enabled = False
+        self.last = 0
+        self.total = 0
+        self.steps = 0
+        self._started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.enabled = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.enabled = False
+
+    def reset(self):
+        self.last = self.total = self.steps = 0
+
+    @property
+    def mean(self):
+        return self.total / self.steps if self.steps else 0.0
+
+    @contextmanager
+    def measure(self):
+        if not self.enabled:
+            yield
+            return
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        yield
+        _, peak = tracemalloc.get_traced_memory()
+        self.last = max(peak - before, 0)
+        self.total += self.last
+        self.steps += 1
@@ -0,0 +1,92 @@
+import math
+from config.settings import Settings
+
+
+class Camera:
+    # pan and zoom over the grid, drawn into the viewport rectangle of the window
+    # zoom is in window pixels per cell, (x, y) is the grid position at the bottom left corner of the viewport
+
+    def __init__(self, grid_shape, viewport, zoom=None, min_zoom=Settings.CAMERA_MIN_ZOOM,
+                 max_zoom=Settings.CAMERA_MAX_ZOOM):
+        self.grid_height, self.grid_width = grid_shape
+        self.viewport_x, self.viewport_y, self.viewport_width, self.viewport_height = viewport
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.x = 0.0
+        self.y = 0.0
+        self.zoom = 1.0
+        if zoom is None:
+            self.fit()
+        else:
+            self.zoom_to(zoom)
+
+    def fit_zoom(self):
+        # the zoom showing the whole grid
+        return min(self.viewport_width / self.grid_width, self.viewport_height / self.grid_height)
+
+    def fit(self):
+        self.zoom_to(self.fit_zoom())
+
+    def zoom_to(self, zoom):
+        # zooms around the centre of the viewport
+        self.zoom_at(self.viewport_x + self.viewport_width / 2, self.viewport_y + self.viewport_height / 2,
+                     zoom / self.zoom)
+
+    def zoom_at(self, screen_x, screen_y, factor):
+        # the grid position under (screen_x, screen_y) stays where it is
+        grid_x, grid_y = self.screen_to_grid_float(screen_x, screen_y)
+        self.zoom = min(max(self.zoom * factor, self.min_zoom), self.max_zoom)
+        self.x = grid_x - (screen_x - self.viewport_x) / self.zoom
+        self.y = grid_y - (screen_y - self.viewport_y) / self.zoom
+        self._clamp()
+
+    def pan(self, dx, dy):
+        # moves the grid with the mouse, dx and dy in window pixels
+        self.x -= dx / self.zoom
+        self.y -= dy / self.zoom
+        self._clamp()
+
+    def _clamp(self):
+        # a grid smaller than the viewport is centred, a bigger one always fills it
+        self.x = self._clamp_axis(self.x, self.viewport_width / self.zoom, self.grid_width)
+        self.y = self._clamp_axis(self.y, self.viewport_height / self.zoom, self.grid_height)
+
+    @staticmethod
+    def _clamp_axis(position, visible, size):
+        if visible >= size:
+            return (size - visible) / 2
+        return min(max(position, 0.0), size - visible)
+
+    def screen_to_grid_float(self, screen_x, screen_y):
+        return (self.x + (screen_x - self.viewport_x) / self.zoom,
+                self.y + (screen_y - self.viewport_y) / self.zoom)
+
+    def screen_to_grid(self, screen_x, screen_y):
+        # the cell under a window position, which may lie outside the grid
+        grid_x, grid_y = self.screen_to_grid_float(screen_x, screen_y)
+        return math.floor(grid_x), math.floor(grid_y)
+
+    def grid_to_screen(self, grid_x, grid_y):
+        return (self.viewport_x + (grid_x - self.x) * self.zoom,
+                self.viewport_y + (grid_y - self.y) * self.zoom)
+
+    def level(self, levels):
+        # level of detail to draw, each level halves the cells of the one below,
+        # the coarsest level whose cells still cover at least one window pixel
+        if self.zoom >= 1:
+            return 0
+        return min(math.ceil(math.log2(1 / self.zoom) - 1e-9), levels)
+
+    def visible_region(self, level=0):
+        # (y0, y1, x0, x1) cells of a level inside the viewport, end exclusive
+        scale = 1 << level
+        x0 = max(math.floor(self.x), 0)
+        y0 = max(math.floor(self.y), 0)
+        x1 = min(math.ceil(self.x + self.viewport_width / self.zoom), self.grid_width)
+        y1 = min(math.ceil(self.y + self.viewport_height / self.zoom), self.grid_height)
+        return y0 // scale, -(-y1 // scale), x0 // scale, -(-x1 // scale)
+
+    def view(self, levels):
+        # what has to be drawn, (level, y0, y1, x0, x1)
+        level = self.level(levels)
+        return (level,) + self.visible_region(level)
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class ChangeMask:
+    # cells changed since the last clear, as one reusable boolean mask plus a dirty flag per row
+    # steps and brush strokes OR into it, consumers read it and clear it, nothing is sorted or reallocated
+
+    def __init__(self, grid_shape):
+        self.shape = tuple(grid_shape)
+        self.mask = np.zeros(self.shape, dtype=bool)
+        self.rows = np.zeros(self.shape[0], dtype=bool)
+
+        # per step difference, reused so comparing two grids does not allocate
+        self._step_changes = np.zeros(self.shape, dtype=bool)
+        self._row_changes = np.zeros(self.shape[0], dtype=bool)
+
+    def record_step(self, current_data_grid, new_data_grid):
+        # returns the cells changed by this step alone, valid until the next step is recorded
+        np.not_equal(current_data_grid, new_data_grid, out=self._step_changes)
+        self.record(self._step_changes)
+        return self._step_changes
+
+    @property
+    def step_changes(self):
+        # the cells changed by the last recorded step
+        return self._step_changes
+
+    def record(self, changed):
+        np.logical_or(self.mask, changed, out=self.mask)
+        np.any(changed, axis=1, out=self._row_changes)
+        np.logical_or(self.rows, self._row_changes, out=self.rows)
+
+    def mark_cells(self, ys, xs):
+        self.mask[ys, xs] = True
+        self.rows[ys] = True
+
+    def record_window(self, top, left, changed):
+        # changed is a boolean mask of a window of the grid with its corner at (top, left)
+        height, width = changed.shape
+        window = self.mask[top:top + height, left:left + width]
+        np.logical_or(window, changed, out=window)
+        self.rows[top:top + height] |= changed.any(axis=1)
+
+    def mark_region(self, y0, y1, x0, x1):
+        self.mask[y0:y1, x0:x1] = True
+        self.rows[y0:y1] = True
+
+    def mark_all(self):
+        self.mask[:] = True
+        self.rows[:] = True
+
+    def clear(self):
+        # only the dirty rows hold set cells
+        first, last = self.row_span()
+        if first < last:
+            self.mask[first:last] = False
+            self.rows[first:last] = False
+
+    def any(self):
+        return bool(self.rows.any())
+
+    def row_span(self):
+        # (first, last) rows holding changes with last exclusive, (0, 0) when nothing changed
+        dirty = np.flatnonzero(self.rows)
+        if not len(dirty):
+            return 0, 0
+        return int(dirty[0]), int(dirty[-1]) + 1
+
+    def count(self):
+        return int(np.count_nonzero(self.mask))
+
+    def cells(self):
+        # (y, x) coordinates of the changed cells, in row order
+        return np.argwhere(self.mask)
@@ -0,0 +1,61 @@
+import numpy as np
+from config.settings import Settings
+
+
+class CellChannels:
+    # per cell values kept next to the grid for visualisation, one byte each so they index a palette directly
+    # "age" counts the generations a cell has been alive, "activity" lights up births and deaths and fades,
+    # "velocity" is how fast a sand particle falls
+    # every channel is updated with a few whole grid operations per step, into arrays allocated once
+
+    Names = ("age", "activity", "velocity")
+
+    def __init__(self, grid_shape, activity_decay=Settings.ACTIVITY_DECAY):
+        self.shape = tuple(grid_shape)
+        self.activity_decay = activity_decay
+        self.age = np.zeros(self.shape, dtype=np.uint8)
+        self.activity = np.zeros(self.shape, dtype=np.uint8)
+        self.velocity = np.zeros(self.shape, dtype=np.uint8)
+
+        # masks are kept as bytes, numpy has fast loops for byte arithmetic but not for bytes mixed with booleans
+        self._alive = np.zeros(self.shape, dtype=np.uint8)
+        self._older = np.zeros(self.shape, dtype=np.uint8)
+        self._lit = np.zeros(self.shape, dtype=np.uint8)
+        # a row of the decay, broadcast over the grid, comparing to a scalar is several times slower
+        self._decay = np.full(self.shape[1], activity_decay, dtype=np.uint8)
+        # set while velocity holds values of a mode that has them, so other modes clear it once
+        self._moving = False
+
+    def layer(self, name):
+        if name not in self.Names:
+            raise ValueError(f"unknown channel '{name}', expected one of {self.Names}")
+        return getattr(self, name)
+
+    def update(self, grid, changed, velocities=None):
+        # grid is the new generation, changed the cells that differ from the previous one
+        alive = np.equal(grid, 1, out=self._alive)
+
+        # live cells get a generation older, up to 255, every other cell goes back to 0
+        np.less(self.age, 0xFF, out=self._older)
+        np.add(self.age, self._older, out=self.age)
+        np.multiply(self.age, alive, out=self.age)
+
+        # births and deaths light a cell up fully, then it fades by activity_decay every generation
+        np.maximum(self.activity, self._decay, out=self.activity)
+        np.subtract(self.activity, self._decay, out=self.activity)
+        # 0 - 1 wraps to 0xFF, so changed cells are 0xFF and the rest 0
+        np.negative(changed.view(np.uint8), out=self._lit)
+        np.bitwise_or(self.activity, self._lit, out=self.activity)
+
+        if velocities is not None:
+            np.abs(velocities, out=self.velocity, casting='unsafe')
+            self._moving = True
+        elif self._moving:
+            self.velocity.fill(0)
+            self._moving = False
+
+    def reset(self):
+        self.age.fill(0)
+        self.activity.fill(0)
+        self.velocity.fill(0)
+        self._moving = False
@@ -0,0 +1,364 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+import numpy as np
+import modes
+from config.settings import Settings
+from buffers import GridBuffers
+from channels import CellChannels
+from ensemble import Ensemble
+import export
+import initializers
+from outofcore import OutOfCoreWorld
+from recording import Player
+from rules import Rule
+from server import StreamServer
+from simulation import Simulation
+
+
+def parse_size(size):
+    # sizes are given as WIDTHxHEIGHT, e.g. 4096x4096
+    try:
+        width, height = (int(value) for value in size.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size '{size}', expected WIDTHxHEIGHT")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"invalid size '{size}', dimensions must be positive")
+    return width, height
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m cli', description='Headless cellular automata runner')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='advance a simulation without a window')
+    run.add_argument('--mode', choices=list(Simulation.MODE_NAMES), default='ca')
+    run.add_argument('--preset', choices=list(modes.CellularAutomataMode.Presets), default=None,
+                     help='cellular automata preset, only used by --mode ca')
+    run.add_argument('--rule', default=None,
+                     help='cellular automata rulestring such as B3/S23 or B2/S/C3, overrides --preset')
+    run.add_argument('--backend', choices=modes.CellularAutomataMode.Backends, default='convolve',
+                     help='cellular automata backend, only used by --mode ca')
+    run.add_argument('--steps', type=int, default=1000)
+    run.add_argument('--size', type=parse_size, default=(Settings.GRID_WIDTH, Settings.GRID_HEIGHT),
+                     help='grid size as WIDTHxHEIGHT')
+    run.add_argument('--life-chance', type=float, default=Settings.INITIAL_LIFE_CHANCE)
+    add_initializer_arguments(run)
+    run.add_argument('--boundary', choices=GridBuffers.Boundaries, default=Settings.BOUNDARY,
+                     help='dead cells past the edges, or wrap the grid into a torus')
+    run.add_argument('--track-allocations', action='store_true', help='report the bytes allocated per step')
+    run.add_argument('--tiles', action='store_true', help='only recompute tiles near a change')
+    run.add_argument('--tile-size', type=int, default=Settings.TILE_SIZE)
+    run.add_argument('--workers', type=int, default=0,
+                     help='step local modes in parallel bands with this many workers')
+    run.add_argument('--threads', action='store_true', help='use a thread pool instead of processes for --workers')
+    run.add_argument('--report-every', type=int, default=0,
+                     help='print the generation rate every N generations')
+    run.add_argument('--profile', default=None,
+                     help='time every step and save the timings, as CSV for a .csv path or Chrome trace JSON otherwise')
+    run.add_argument('--detect-cycles', action='store_true', help='report when the grid starts repeating')
+    run.add_argument('--fast-forward', action='store_true',
+                     help='replay a detected cycle instead of stepping, implies --detect-cycles')
+    run.add_argument('--stop-on-cycle', action='store_true',
+                     help='stop as soon as the grid repeats, implies --detect-cycles')
+    run.add_argument('--record', default=None, help='record every generation to this file')
+    run.add_argument('--keyframe-interval', type=int, default=Settings.RECORDING_KEYFRAME_INTERVAL)
+    run.add_argument('--export', default=None,
+                     help='render every generation to a .png pattern such as frame_{index:06d}.png, a .gif, '
+                          'or any other file written by the encoder command')
+    run.add_argument('--export-scale', type=int, default=Settings.EXPORT_SCALE, help='pixels per cell of the export')
+    run.add_argument('--export-every', type=int, default=1, help='only export every N-th generation')
+    run.add_argument('--export-channel', choices=CellChannels.Names, default=None,
+                     help='export a cell channel instead of the cell states')
+    run.add_argument('--export-fps', type=int, default=Settings.EXPORT_FRAME_RATE)
+    run.add_argument('--encoder', default=None,
+                     help='command raw RGBA frames are piped into, with {width}, {height}, {fps} and {path} '
+                          'filled in, ffmpeg by default')
+
+    replay = commands.add_parser('replay', help='inspect a recording and continue the simulation from any frame')
+    replay.add_argument('path')
+    replay.add_argument('--generation', type=int, default=None,
+                        help='seek to the last frame at or before this generation, the last frame by default')
+    replay.add_argument('--steps', type=int, default=0, help='generations to simulate on from the frame')
+
+    world = commands.add_parser('world', help='step a bit packed world kept in memory mapped files')
+    world.add_argument('directory')
+    world.add_argument('--size', type=parse_size, default=None,
+                       help='create a new random world of WIDTHxHEIGHT, otherwise the world in the directory is used')
+    world.add_argument('--life-chance', type=float, default=Settings.INITIAL_LIFE_CHANCE)
+    add_initializer_arguments(world)
+    world.add_argument('--mode', choices=[name for name, mode_class in Simulation.MODE_NAMES.items() if mode_class.local],
+                       default='ca')
+    world.add_argument('--rule', default=None, help='cellular automata rulestring, two state rules only')
+    world.add_argument('--steps', type=int, default=1)
+    world.add_argument('--band-rows', type=int, default=None, help='rows stepped at once, sized from the width by default')
+
+    sweep = commands.add_parser('sweep', help='step many small grids at once over rules and initial densities')
+    sweep.add_argument('--rules', nargs='+', default=list(modes.CellularAutomataMode.Presets),
+                       help='preset names or rulestrings, every preset by default')
+    sweep.add_argument('--life-chances', type=float, nargs='+', default=[Settings.INITIAL_LIFE_CHANCE])
+    sweep.add_argument('--repeats', type=int, default=10, help='random grids per rule and life chance')
+    sweep.add_argument('--size', type=parse_size, default=(64, 64), help='size of every grid as WIDTHxHEIGHT')
+    sweep.add_argument('--steps', type=int, default=500)
+    sweep.add_argument('--seed', type=int, default=None)
+    sweep.add_argument('--out', default=None, help='save the statistics of every member as JSON')
+
+    serve = commands.add_parser('serve', help='stream a simulation to remote viewers over TCP and WebSockets')
+    serve.add_argument('--mode', choices=list(Simulation.MODE_NAMES), default='ca')
+    serve.add_argument('--rule', default=None, help='cellular automata rulestring, only used by --mode ca')
+    serve.add_argument('--size', type=parse_size, default=(Settings.GRID_WIDTH, Settings.GRID_HEIGHT),
+                       help='grid size as WIDTHxHEIGHT')
+    serve.add_argument('--life-chance', type=float, default=Settings.INITIAL_LIFE_CHANCE)
+    add_initializer_arguments(serve)
+    serve.add_argument('--boundary', choices=GridBuffers.Boundaries, default=Settings.BOUNDARY)
+    serve.add_argument('--host', default=Settings.STREAM_HOST)
+    serve.add_argument('--port', type=int, default=Settings.STREAM_PORT)
+    serve.add_argument('--fps', type=float, default=Settings.STREAM_FRAME_RATE,
+                       help='most frames a second sent to a client')
+    return parser
+
+
+def add_initializer_arguments(parser):
+    parser.add_argument('--init', choices=list(initializers.GENERATORS), default='uniform',
+                        help='generator of the initial grid')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the initial grid, random by default')
+    parser.add_argument('--rle', default=None, help='RLE pattern file, implies --init rle')
+
+
+def initializer_params(args):
+    # the generator and its parameters from the command line
+    if args.rle is not None:
+        return 'rle', {'path': args.rle}
+    if args.init in ('uniform', 'noise', 'perlin'):
+        return args.init, {'life_chance': args.life_chance}
+    return args.init, {}
+
+
+def run(args):
+    width, height = args.size
+    simulation = Simulation(grid_height=height, grid_width=width, mode=args.mode, life_chance=args.life_chance,
+                            ca_backend=args.backend, seed=args.seed, boundary=args.boundary)
+    name, params = initializer_params(args)
+    if name != 'uniform':
+        simulation.initialize(name, args.seed, **params)
+    if args.rle is not None:
+        # the rule of the pattern, unless one is given
+        _, rule = initializers.read_rle(args.rle)
+        if rule and args.rule is None and args.preset is None and args.mode == 'ca':
+            simulation.mode.load_rule(rule)
+    if args.preset is not None or args.rule is not None:
+        if args.mode != 'ca':
+            print("--preset and --rule are ignored outside of --mode ca", file=sys.stderr)
+        elif args.rule is not None:
+            simulation.mode.load_rule(args.rule)
+        else:
+            simulation.mode.load_preset(args.preset)
+    if (args.tiles or args.workers) and args.boundary == 'wrap':
+        print("--tiles and --workers are ignored with --boundary wrap", file=sys.stderr)
+    elif args.tiles:
+        simulation.enable_tiles(args.tile_size)
+    if args.workers and args.boundary != 'wrap':
+        simulation.enable_parallel(args.workers, use_processes=not args.threads)
+    if args.profile:
+        simulation.profiler.enabled = True
+    if args.track_allocations:
+        simulation.allocations.start()
+    if args.record:
+        simulation.start_recording(args.record, args.keyframe_interval)
+    if args.export:
+        simulation.start_export(open_exporter(args, simulation))
+    if args.detect_cycles or args.fast_forward or args.stop_on_cycle:
+        simulation.enable_cycle_detection(fast_forward=args.fast_forward, on_cycle=lambda event: print(
+            f"generation {event['generation']}: grid repeats generation {event['first_generation']}, "
+            f"period {event['period']}{'' if event['confirmed'] else ' (too long to confirm)'}"))
+
+    try:
+        rate = simulation.run(args.steps, report_interval=args.report_every, stop_on_cycle=args.stop_on_cycle)
+        population = int(simulation.data_grid.astype(bool).sum())
+    finally:
+        simulation.disable_parallel()
+        simulation.stop_recording()
+        exporter = simulation.exporter
+        simulation.stop_export()
+    print(f"{simulation.generation} generations of {args.mode} on {width}x{height}: {rate:.1f} gen/s, "
+          f"population {population}, seed {simulation.seed}")
+    if simulation.cycles is not None:
+        print(f"cycles: {len(simulation.cycles.events)} found, "
+              f"{simulation.cycles.generations_skipped} generations replayed instead of stepped")
+    if args.track_allocations:
+        simulation.allocations.stop()
+        print(f"allocated {simulation.allocations.mean / 1024:.1f} KiB per step on average, "
+              f"{simulation.allocations.last / 1024:.1f} KiB in the last step")
+    if simulation.tiles is not None:
+        stats = simulation.tile_stats()
+        print(f"tiles: {stats['active']} active, {stats['sleeping']} sleeping of {stats['total']}, "
+              f"{stats['tiles_skipped']} tile steps skipped, {stats['tiles_computed']} computed")
+    if args.profile:
+        simulation.profiler.export(args.profile)
+        print(simulation.profiler.summary_text())
+        print(f"saved profile to {args.profile}")
+    if args.record:
+        print(f"recorded {simulation.generation + 1} frames to {args.record}, {os.path.getsize(args.record)} bytes")
+    if exporter is not None:
+        print(f"exported {exporter.frames_written} frames to {args.export}, {exporter.bytes_written} bytes, "
+              f"waited {exporter.waited:.2f}s for the encoders")
+
+
+def open_exporter(args, simulation):
+    width, height = args.size
+    path = args.export
+    if path.lower().endswith('.png') and '{' not in path:
+        # one file per frame
+        path = path[:-4] + '_{index:06d}.png'
+    image_shape = (height * args.export_scale, width * args.export_scale)
+    command = args.encoder.split() if args.encoder else Settings.EXPORT_ENCODER_COMMAND
+    try:
+        writer = export.open_writer(path, image_shape, args.export_fps, command)
+    except FileNotFoundError:
+        raise SystemExit(f"encoder '{command[0]}' not found, pass another one with --encoder or export to .png or .gif")
+    exporter = export.FrameExporter(writer, scale=args.export_scale, channel=args.export_channel,
+                                    every=args.export_every)
+    if args.mode == 'ca':
+        exporter.palette.set_state_count(simulation.mode.rule.states)
+    return exporter
+
+
+def replay(args):
+    with Player(args.path) as player:
+        height, width = player.shape
+        keyframes = int(player.frames['keyframe'].sum())
+        raw_bytes = len(player) * height * width
+        size = os.path.getsize(args.path)
+        print(f"{len(player)} frames of {width}x{height}, {keyframes} keyframes, "
+              f"{size} bytes ({raw_bytes / max(size, 1):.1f}x smaller than a byte per cell)")
+
+        if args.generation is None:
+            player.seek(len(player) - 1)
+        else:
+            player.seek_generation(args.generation)
+
+        simulation = Simulation(grid_height=height, grid_width=width)
+        meta = player.apply(simulation)
+        population = int(np.count_nonzero(simulation.data_grid))
+        print(f"frame {player.position}, generation {simulation.generation}: population {population}, {meta}")
+
+    if args.steps:
+        rate = simulation.run(args.steps)
+        population = int(np.count_nonzero(simulation.data_grid))
+        print(f"continued {args.steps} generations to {simulation.generation}: {rate:.1f} gen/s, population {population}")
+
+
+def world(args):
+    if args.size is not None:
+        width, height = args.size
+        name, params = initializer_params(args)
+        out_of_core = OutOfCoreWorld.create(args.directory, height, width, args.seed, args.band_rows, name, **params)
+    else:
+        out_of_core = OutOfCoreWorld(args.directory, args.band_rows)
+
+    mode = Simulation.MODE_NAMES[args.mode]()
+    if args.rule is not None:
+        mode.load_rule(args.rule)
+
+    megabyte = 1 << 20
+    print(f"{out_of_core.width}x{out_of_core.height} world, {out_of_core.front.nbytes / megabyte:.1f} MB per generation, "
+          f"bands of {out_of_core.band_rows} rows")
+    try:
+        for _ in range(args.steps):
+            start = time.perf_counter()
+            io = out_of_core.step(mode)
+            elapsed = time.perf_counter() - start
+            print(f"generation {out_of_core.generation}: {elapsed:.2f} s, read {io['bytes_read'] / megabyte:.1f} MB, "
+                  f"wrote {io['bytes_written'] / megabyte:.1f} MB")
+        print(f"population {out_of_core.population()}")
+    finally:
+        out_of_core.close()
+
+
+def sweep(args):
+    width, height = args.size
+    ensemble, members = Ensemble.sweep((height, width), args.rules, args.life_chances, args.repeats, args.seed)
+
+    start = time.perf_counter()
+    ensemble.run(args.steps)
+    elapsed = time.perf_counter() - start
+    print(f"{ensemble.size} grids of {width}x{height}, {ensemble.generation} generations: "
+          f"{ensemble.size * ensemble.generation / max(elapsed, 1e-9):.0f} grid generations/s")
+
+    statistics = ensemble.statistics()
+    for member, (rule, life_chance, repeat) in zip(statistics, members):
+        member.update({'preset': rule, 'life_chance': life_chance, 'repeat': repeat})
+
+    # one line per rule and life chance, averaged over the repeats
+    print(f"{'rule':<16}{'chance':>8}{'settled':>9}{'settled at':>12}{'population':>12}")
+    for rule, life_chance in itertools.product(args.rules, args.life_chances):
+        group = [member for member in statistics if member['preset'] == rule and member['life_chance'] == life_chance]
+        settled = [member['settled_at'] for member in group if member['settled_at'] is not None]
+        settled_at = f"{np.mean(settled):.0f}" if settled else '-'
+        population = np.mean([member['population'] for member in group])
+        print(f"{rule:<16}{life_chance:>8g}{len(settled) / len(group):>9.0%}{settled_at:>12}{population:>12.1f}")
+
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(statistics, file, indent=2)
+        print(f"saved statistics of {len(statistics)} grids to {args.out}")
+
+
+def serve(args):
+    width, height = args.size
+    simulation = Simulation(grid_height=height, grid_width=width, mode=args.mode, life_chance=args.life_chance,
+                            seed=args.seed, boundary=args.boundary)
+    name, params = initializer_params(args)
+    if name != 'uniform':
+        simulation.initialize(name, args.seed, **params)
+    if args.rule is not None and args.mode == 'ca':
+        simulation.mode.load_rule(args.rule)
+    # like the window, tiles skip the quiet parts of the grid and settled grids are fast forwarded
+    if Settings.ACTIVE_TILES and args.boundary == 'fill':
+        simulation.enable_tiles()
+    if Settings.CYCLE_DETECTION:
+        simulation.enable_cycle_detection()
+
+    server = StreamServer(simulation, args.host, args.port, args.fps)
+    print(f"streaming {args.mode} on {width}x{height} at tcp://{args.host}:{args.port} and ws://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    print(f"stopped at generation {simulation.generation}")
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'world' and args.rule is not None:
+        if args.mode != 'ca':
+            parser.error("world: --rule only applies to --mode ca")
+        # out of core worlds store one bit per cell, so rules are checked before any file is created
+        try:
+            rule = Rule.parse(args.rule)
+        except ValueError as error:
+            parser.error(f"world: {error}")
+        if rule.states > 2:
+            parser.error(f"world: --rule {args.rule} has {rule.states} states, worlds only run two state rules")
+    if args.command in ('run', 'serve') and args.boundary == 'wrap' and not Simulation.MODE_NAMES[args.mode].local:
+        parser.error(f"{args.command}: --boundary wrap does not work with --mode {args.mode}")
+    match args.command:
+        case 'run':
+            run(args)
+        case 'replay':
+            replay(args)
+        case 'world':
+            world(args)
+        case 'sweep':
+            sweep(args)
+        case 'serve':
+            serve(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,13 +4,24 @@ class Controls:
     # CELLULAR AUTOMATA MODE ONLY
     NEXT_PRESET = key.P
     SMOOTH = key.RSHIFT
+    HASHLIFE_JUMP = key.J
 
     # ALL MODES
     CLEAR_SCREEN = key.BACKSPACE
     TOGGLE_PAUSE = key.SPACE
     ADVANCE_FRAME = key.ENTER
     SCREENSHOT = key.S
+    TOGGLE_EXPORT = key.G
     MOD_KEY = key.MOD_CTRL
+    TOGGLE_PROFILER = key.F3
+    EXPORT_PROFILE = key.F4
+    TOGGLE_RECORDING = key.R
+    RESET_CAMERA = key.HOME
+    NEXT_CHANNEL = key.V
+
+    # REPLAY ONLY
+    REPLAY_BACK = key.LEFT
+    REPLAY_FORWARD = key.RIGHT
 
     # MODE SELECTION
     CA_MODE = key._1
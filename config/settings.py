@@ -1,9 +1,24 @@
+import os
 from cell_state import CellState
 from direction import Direction as dir
 
 
 class Settings:
-    SCREENSHOT_DIRECTORY = ".\\screenshots\\"
+    SCREENSHOT_DIRECTORY = "screenshots"
+    # {index} counts the screenshots of a session, so several in one second do not overwrite each other
+    SCREENSHOT_NAME = "screenshot_{time:%d%m%Y_%H-%M-%S}_{index:03d}.png"
+
+    # exported images draw every cell as an EXPORT_SCALE x EXPORT_SCALE square
+    EXPORT_SCALE = 2
+    EXPORT_DIRECTORY = "exports"
+    EXPORT_FRAME_RATE = 30
+    EXPORT_COMPRESSION_LEVEL = 6
+    # frames are encoded on EXPORT_WORKERS threads, producers wait once EXPORT_QUEUE_SIZE frames are pending
+    EXPORT_WORKERS = 4
+    EXPORT_QUEUE_SIZE = 16
+    # exports to other formats than PNG and GIF pipe raw RGBA frames into this command
+    EXPORT_ENCODER_COMMAND = ("ffmpeg", "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", "rgba",
+                              "-s", "{width}x{height}", "-r", "{fps}", "-i", "-", "-pix_fmt", "yuv420p", "{path}")
 
     SIMULATION_FRAME_RATE = 30
     SAND_FRAME_RATE = 30
@@ -22,9 +37,11 @@ class Settings:
     GRID_WIDTH = 320
     GRID_SIZE = (GRID_HEIGHT, GRID_WIDTH)
 
-    # visual grid
-    VISUAL_GRID_HEIGHT = CELL_HEIGHT * GRID_HEIGHT
-    VISUAL_GRID_WIDTH = CELL_WIDTH * GRID_WIDTH
+    # visual grid, the viewport the camera draws into, grids bigger than it are panned and zoomed
+    MAX_VISUAL_GRID_HEIGHT = 720
+    MAX_VISUAL_GRID_WIDTH = 1280
+    VISUAL_GRID_HEIGHT = min(CELL_HEIGHT * GRID_HEIGHT, MAX_VISUAL_GRID_HEIGHT)
+    VISUAL_GRID_WIDTH = min(CELL_WIDTH * GRID_WIDTH, MAX_VISUAL_GRID_WIDTH)
 
     # window
     WINDOW_MARGIN = {
@@ -38,6 +55,119 @@ class Settings:
     WINDOW_WIDTH = VISUAL_GRID_WIDTH + WINDOW_MARGIN[dir.Left] + WINDOW_MARGIN[dir.Right]
     INITIAL_LIFE_CHANCE = 0.2
 
+    # camera zoom in window pixels per cell, one scroll step zooms by CAMERA_ZOOM_STEP
+    CAMERA_MAX_ZOOM = 64
+    CAMERA_ZOOM_STEP = 1.25
+    # zoomed out views are drawn from LOD_LEVELS halvings of the grid, "max" or "mean" pooled
+    LOD_LEVELS = 8
+    LOD_POOLING = "max"
+    CAMERA_MIN_ZOOM = 1 / (1 << LOD_LEVELS)
+
+    # active tiles, only tiles near a change are recomputed
+    ACTIVE_TILES = True
+    TILE_SIZE = 32
+    # above this fraction of active tiles the whole grid is stepped in one go
+    TILE_FULL_STEP_FRACTION = 0.6
+
+    # hashlife jumps advance the cellular automata by 2^HASHLIFE_JUMP_EXPONENT generations
+    HASHLIFE_JUMP_EXPONENT = 10
+    # unused nodes are collected, also in the middle of a jump, once there are more than this many
+    HASHLIFE_MAX_NODES = 4_000_000
+
+    # frame profiler, toggled in the window with Controls.TOGGLE_PROFILER
+    PROFILER_ENABLED = False
+    # frames kept per stage for the rolling percentiles
+    PROFILER_WINDOW = 240
+    # stage timings kept for exporting, oldest are dropped first
+    PROFILER_TRACE_CAPACITY = 100_000
+    # frames between refreshes of the overlay text
+    PROFILER_OVERLAY_INTERVAL = 15
+    PROFILE_DIRECTORY = "profiles"
+
+    # recordings store a full frame every RECORDING_KEYFRAME_INTERVAL frames and changes in between
+    RECORDING_KEYFRAME_INTERVAL = 64
+    RECORDING_COMPRESSION_LEVEL = 6
+    RECORDING_DIRECTORY = "recordings"
+    # frames skipped by one press of the replay seek keys
+    REPLAY_SEEK_STEP = 30
+
+    # out of core worlds are stepped in bands of about this many cells
+    OUT_OF_CORE_BAND_CELLS = 4_000_000
+
+    # the simulation steps on a background thread and publishes generations into a ring of this many frames
+    BACKGROUND_SIMULATION = True
+    FRAME_RING_SIZE = 4
+
+    # the stream server sends frames to remote viewers at up to STREAM_FRAME_RATE, as deltas against the last
+    # STREAM_HISTORY frames, clients with more than STREAM_MAX_BUFFER bytes still unsent skip frames
+    STREAM_HOST = "127.0.0.1"
+    STREAM_PORT = 8765
+    STREAM_FRAME_RATE = 30
+    STREAM_HISTORY = 8
+    STREAM_MAX_BUFFER = 1 << 20
+    STREAM_COMPRESSION_LEVEL = 1
+    # commands a client may send a second, in bursts of up to STREAM_COMMAND_BURST
+    STREAM_COMMAND_RATE = 60
+    STREAM_COMMAND_BURST = 120
+    STREAM_MAX_MESSAGE = 1 << 16
+    # seconds to wait for a WebSocket upgrade request before a client is taken for plain TCP
+    STREAM_HANDSHAKE_TIMEOUT = 0.25
+    STREAM_MAX_BRUSH_RADIUS = 32
+
+    # cycle detection, repeated grids are found from a hash updated with the changed cells
+    CYCLE_DETECTION = True
+    # replay a found cycle instead of stepping, until the grid is edited
+    CYCLE_FAST_FORWARD = True
+    # hashes remembered, the longest period that can be detected
+    CYCLE_HISTORY = 4096
+    # longest period confirmed cell by cell and replayed, within CYCLE_FRAME_MEMORY bytes of frames
+    CYCLE_MAX_PERIOD = 256
+    CYCLE_FRAME_MEMORY = 64 * 1024 * 1024
+
+    # ensemble members count as settled when they repeat one of their last ENSEMBLE_MAX_PERIOD generations
+    ENSEMBLE_MAX_PERIOD = 2
+
+    # "fill" treats cells past the edges as dead, "wrap" joins opposite edges into a torus
+    BOUNDARY = "fill"
+    # cells of border around the grid buffers at least, it is widened to the furthest reaching kernel of the modes,
+    # kernels with more than BUFFERED_KERNEL_ENTRIES entries are counted by an allocating strategy
+    GRID_HALO = 2
+    BUFFERED_KERNEL_ENTRIES = 32
+
+    # initial grids are generated in bands of about this many cells
+    INIT_CHUNK_CELLS = 4_000_000
+
+    # neighbour counting strategy from kernels.STRATEGIES, None picks one per mode, grid shape and kernel
+    COUNT_STRATEGY = None
+    # time the strategies on first use and cache the fastest in AUTOTUNE_CACHE, otherwise estimate their cost
+    # the timings belong to the machine, so the cache lives in the cache directory of the user, not the working one
+    AUTOTUNE = True
+    AUTOTUNE_CACHE = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA')
+                                  or os.path.join(os.path.expanduser('~'), '.cache'),
+                                  'cellular-automata', 'autotune.json')
+    AUTOTUNE_REPEATS = 3
+    # smaller grids, such as tiles, use the cost estimate
+    AUTOTUNE_MIN_CELLS = 128 * 128
+    # strategies estimated to cost more than this many times the cheapest are not timed
+    AUTOTUNE_COST_RATIO = 8
+
     # sand mode
     SAND_GRAVITY = 1
     SAND_MAX_Y_VEL = -10
+    # the "auto" sand kernel moves whole rows at once when there are this many particles for every row a
+    # falling particle moves through, and walks the particles one at a time below it
+    SAND_ROWS_MIN_PARTICLES_PER_ROW_STEP = 4
+
+    # per cell channels, drawn instead of the cell states with Controls.NEXT_CHANNEL
+    CELL_CHANNELS = True
+    # activity fades from 255 by this much every generation
+    ACTIVITY_DECAY = 8
+    # palettes of the channels as (value, RGBA color) stops, values in between are blended
+    CHANNEL_GRADIENTS = {
+        'age': ((0, (40, 40, 40, 255)), (1, (255, 255, 170, 255)), (16, (240, 170, 40, 255)),
+                (64, (200, 60, 40, 255)), (255, (90, 20, 110, 255))),
+        'activity': ((0, (0, 0, 0, 255)), (64, (90, 0, 30, 255)), (160, (230, 80, 0, 255)),
+                     (255, (255, 255, 200, 255))),
+        'velocity': ((0, (40, 40, 40, 255)), (1, (30, 60, 160, 255)), (-SAND_MAX_Y_VEL, (140, 230, 255, 255)),
+                     (255, (255, 255, 255, 255))),
+    }
@@ -0,0 +1,137 @@
+from collections import OrderedDict, deque
+import numpy as np
+from config.settings import Settings
+
+
+class CycleDetector:
+    # Zobrist style hash of a grid, updated from the cells changed by each step
+    # a cell in state s > 0 contributes key * (2s - 1) to the hash, dead cells contribute nothing
+
+    def __init__(self, grid_shape, fast_forward=Settings.CYCLE_FAST_FORWARD, on_cycle=None,
+                 history=Settings.CYCLE_HISTORY, max_period=Settings.CYCLE_MAX_PERIOD, seed=0):
+        self.grid_shape = tuple(grid_shape)
+        self._keys = np.random.default_rng(seed).integers(0, np.iinfo(np.uint64).max, size=self.grid_shape,
+                                                          dtype=np.uint64, endpoint=True)
+        self.fast_forward = fast_forward
+        self.on_cycle = on_cycle
+        self.hash = 0
+
+        # generation each recent hash was first seen at, the oldest are forgotten first
+        self._history = history
+        self._seen = OrderedDict()
+
+        # recent frames, to confirm a cycle cell by cell and to replay it
+        self._max_period = max_period
+        self._frames = deque(maxlen=1)
+        self._hashes = deque(maxlen=1)
+
+        # the rules the history was recorded under
+        self._signature = None
+
+        # period of a repeat too long for the stored frames, reported once but never taken for a cycle,
+        # since a hash alone can not tell it from two grids that hash the same
+        self.unconfirmed_period = None
+
+        # frames of the current cycle in the order they repeat, and the next one to replay
+        self.period = None
+        self._cycle = None
+        self._cycle_hashes = None
+        self._cycle_index = 0
+
+        self.events = []
+        self.generations_skipped = 0
+
+    def _cell_hashes(self, ys, xs, states):
+        states = states.astype(np.uint64)
+        return np.where(states != 0, self._keys[ys, xs] * (np.uint64(2) * states - np.uint64(1)), np.uint64(0))
+
+    def _xor(self, values):
+        return int(np.bitwise_xor.reduce(values, initial=np.uint64(0)))
+
+    def full_hash(self, grid):
+        ys, xs = np.nonzero(grid)
+        return self._xor(self._cell_hashes(ys, xs, grid[ys, xs]))
+
+    def reset(self, grid, generation, signature=None):
+        # after the grid was edited, the hash is computed from scratch and the history forgotten
+        self.hash = self.full_hash(grid)
+        self._forget(grid)
+        self.observe(grid, generation, signature)
+
+    def _forget(self, grid):
+        self._seen.clear()
+        # frames are kept within a memory budget, big grids confirm and replay shorter cycles
+        frame_count = max(1, min(self._max_period, Settings.CYCLE_FRAME_MEMORY // max(grid.nbytes, 1)))
+        self._frames = deque(maxlen=frame_count)
+        self._hashes = deque(maxlen=frame_count)
+        self.unconfirmed_period = None
+        self.period = None
+        self._cycle = None
+
+    def update(self, previous_grid, grid, changed, generation, signature=None):
+        # changed is the boolean mask of the cells that differ between previous_grid and grid
+        ys, xs = np.nonzero(changed)
+        if len(ys):
+            self.hash ^= self._xor(self._cell_hashes(ys, xs, previous_grid[ys, xs]))
+            self.hash ^= self._xor(self._cell_hashes(ys, xs, grid[ys, xs]))
+        self.observe(grid, generation, signature)
+
+    def observe(self, grid, generation, signature=None):
+        # a signature of None means the rules depend on more than the grid, e.g. sand velocities
+        if signature is None or signature != self._signature:
+            self._signature = signature
+            self._forget(grid)
+            if signature is None:
+                return
+        if self.period is not None:
+            return
+
+        first_generation = self._seen.get(self.hash)
+        if first_generation is not None:
+            self._found_cycle(grid, generation, first_generation)
+
+        self._seen[self.hash] = generation
+        self._seen.move_to_end(self.hash)
+        if len(self._seen) > self._history:
+            self._seen.popitem(last=False)
+        self._frames.append(grid.copy())
+        self._hashes.append(self.hash)
+
+    def _found_cycle(self, grid, generation, first_generation):
+        period = generation - first_generation
+        if period <= len(self._frames):
+            if not np.array_equal(self._frames[-period], grid):
+                # two grids with the same hash, not a cycle
+                return
+            self.period = period
+            # the frames after the first occurrence, ending with the current grid, repeat from here on
+            start = len(self._frames) - period + 1
+            self._cycle = list(self._frames)[start:] + [grid.copy()]
+            self._cycle_hashes = list(self._hashes)[start:] + [self.hash]
+            self._cycle_index = 0
+        elif period == self.unconfirmed_period:
+            # every generation of a long cycle matches again, it was reported when the first one did
+            return
+        else:
+            # detection goes on, a shorter cycle can still be confirmed later
+            self.unconfirmed_period = period
+
+        event = {'generation': generation, 'period': period, 'first_generation': first_generation,
+                 'confirmed': self.period is not None}
+        self.events.append(event)
+        if self.on_cycle is not None:
+            self.on_cycle(event)
+
+    def in_cycle(self, signature):
+        return self.fast_forward and self._cycle is not None and signature == self._signature
+
+    def next_frame(self, out=None):
+        # the next generation of the cycle, copied so edits to the grid do not change the cycle
+        frame = self._cycle[self._cycle_index]
+        self.hash = self._cycle_hashes[self._cycle_index]
+        self._cycle_index = (self._cycle_index + 1) % len(self._cycle)
+        self.generations_skipped += 1
+        if out is None:
+            return frame.copy()
+        np.copyto(out, frame, casting='unsafe')
+        return out
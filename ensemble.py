@@ -0,0 +1,121 @@
+import itertools
+import numpy as np
+from config.settings import Settings
+from rules import Rule
+import modes
+
+
+class Ensemble:
+    # K grids of the same shape stacked into one (K, height, width) array and stepped together,
+    # each member with its own rule, counting neighbours in the Moore neighbourhood with zero filled edges
+
+    def __init__(self, grids, rules, max_period=Settings.ENSEMBLE_MAX_PERIOD):
+        self.grids = np.ascontiguousarray(grids, dtype=np.uint8)
+        self.size, self.height, self.width = self.grids.shape
+        if isinstance(rules, (str, tuple, Rule)):
+            rules = [rules] * self.size
+        if len(rules) != self.size:
+            raise ValueError(f"expected {self.size} rules, got {len(rules)}")
+        self.rules = [self.parse_rule(rule) for rule in rules]
+        self.generation = 0
+
+        # the lookup tables of all members side by side, member k starts at row k * states
+        self._states = max(rule.states for rule in self.rules)
+        self._tables = np.stack([rule.table[:self._states] for rule in self.rules]).ravel()
+        self._member_offsets = (np.arange(self.size, dtype=np.int32) * self._states * 9)[:, None, None]
+
+        # buffers reused by every step
+        self._alive = np.zeros((self.size, self.height + 2, self.width + 2), dtype=np.uint8)
+        self._counts = np.zeros(self.grids.shape, dtype=np.uint8)
+        self._index = np.zeros(self.grids.shape, dtype=np.int32)
+        self._next = np.zeros_like(self.grids)
+
+        # the last max_period generations, to find members that settled into a still life or an oscillation
+        self.max_period = max_period
+        self._previous = np.zeros((max_period,) + self.grids.shape, dtype=np.uint8)
+        self.settled_at = np.full(self.size, -1, dtype=np.int64)
+        self.period = np.zeros(self.size, dtype=np.int64)
+
+        self.populations = [self.population()]
+
+    @staticmethod
+    def parse_rule(rule):
+        # preset names, rulestrings, rule triples and rules
+        if isinstance(rule, str) and rule in modes.CellularAutomataMode.Presets:
+            rule = modes.CellularAutomataMode.Presets[rule]
+        return Rule.parse(rule)
+
+    @classmethod
+    def sweep(cls, grid_shape, rules, life_chances=(Settings.INITIAL_LIFE_CHANCE,), repeats=1, seed=None):
+        # one member for every combination of rule, life chance and repeat, returns the ensemble and the combinations
+        members = list(itertools.product(rules, life_chances, range(repeats)))
+        generator = np.random.default_rng(seed)
+        chances = np.array([life_chance for _, life_chance, _ in members], dtype=np.float32)[:, None, None]
+        grids = generator.random((len(members),) + tuple(grid_shape), dtype=np.float32) < chances
+        return cls(grids, [rule for rule, _, _ in members]), members
+
+    @property
+    def settled(self):
+        return self.settled_at >= 0
+
+    def population(self):
+        # live cells of every member, dying states of generations rules do not count
+        return np.count_nonzero(self.grids == 1, axis=(1, 2))
+
+    def step(self):
+        # live neighbours of every cell, summed from the eight shifted copies of the padded live cells
+        alive, counts = self._alive, self._counts
+        np.equal(self.grids, 1, out=alive[:, 1:-1, 1:-1])
+        counts.fill(0)
+        for dy in range(3):
+            for dx in range(3):
+                if dy != 1 or dx != 1:
+                    counts += alive[:, dy:dy + self.height, dx:dx + self.width]
+
+        # one gather over the tables of all members
+        index = self._index
+        np.multiply(self.grids, 9, out=index, dtype=np.int32)
+        index += counts
+        index += self._member_offsets
+        np.take(self._tables, index, out=self._next)
+
+        # keep the generation being replaced, the oldest kept generation is overwritten
+        self._previous[self.generation % self.max_period] = self.grids
+        self.grids, self._next = self._next, self.grids
+        self.generation += 1
+        self._find_settled()
+        self.populations.append(self.population())
+
+    def _find_settled(self):
+        # a member settled when its grid equals one of the last max_period generations
+        unsettled = np.flatnonzero(~self.settled)
+        if not len(unsettled):
+            return
+        for period in range(1, min(self.max_period, self.generation) + 1):
+            slot = (self.generation - period) % self.max_period
+            same = (self._previous[slot, unsettled] == self.grids[unsettled]).all(axis=(1, 2))
+            found = unsettled[same]
+            self.settled_at[found] = self.generation - period
+            self.period[found] = period
+            unsettled = unsettled[~same]
+            if not len(unsettled):
+                break
+
+    def run(self, steps, stop_when_settled=True):
+        for _ in range(steps):
+            self.step()
+            if stop_when_settled and self.settled.all():
+                break
+        return self
+
+    def statistics(self):
+        # one dictionary per member
+        populations = np.array(self.populations)
+        return [{
+            'rule': self.rules[member].rulestring,
+            'population': int(populations[-1, member]),
+            'initial_population': int(populations[0, member]),
+            'max_population': int(populations[:, member].max()),
+            'settled_at': int(self.settled_at[member]) if self.settled_at[member] >= 0 else None,
+            'period': int(self.period[member]) if self.settled_at[member] >= 0 else None,
+        } for member in range(self.size)]
@@ -0,0 +1,306 @@
+import os
+import queue
+import struct
+import subprocess
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+from config.settings import Settings
+from palette import Palette
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def render_indices(grid, scale=1):
+    # palette indices of an image of the grid, every cell a scale x scale square
+    # grid row 0 is drawn at the bottom of the window, images start with their top row
+    grid = grid.view(np.uint8) if grid.dtype == bool else grid
+    image = grid[::-1]
+    if scale > 1:
+        height, width = image.shape
+        # one copy, every cell broadcast over its square
+        image = np.broadcast_to(image[:, None, :, None], (height, scale, width, scale))
+        return image.reshape(height * scale, width * scale).astype(np.uint8, copy=False)
+    return np.ascontiguousarray(image, dtype=np.uint8)
+
+
+def render_rgba(grid, colors, scale=1):
+    return np.take(colors, render_indices(grid, scale), axis=0)
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def encode_png(indices, colors, compression_level=Settings.EXPORT_COMPRESSION_LEVEL):
+    # an 8 bit palette PNG, so the image is one byte per pixel like the indices
+    # zlib releases the GIL while it compresses, so several frames encode in parallel on threads
+    height, width = indices.shape
+    rows = np.zeros((height, width + 1), dtype=np.uint8)
+    # every row starts with filter type 0, the bytes as they are
+    rows[:, 1:] = indices
+    chunks = [
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)),
+        _png_chunk(b'PLTE', colors[:, :3].tobytes()),
+    ]
+    if (colors[:, 3] != 0xFF).any():
+        chunks.append(_png_chunk(b'tRNS', colors[:, 3].tobytes()))
+    chunks.append(_png_chunk(b'IDAT', zlib.compress(rows.tobytes(), compression_level)))
+    chunks.append(_png_chunk(b'IEND', b''))
+    return PNG_SIGNATURE + b''.join(chunks)
+
+
+def lzw_encode(data, min_code_size=8):
+    # GIF flavoured LZW of a byte string, variable length codes of up to 12 bits packed least significant bit first
+    clear_code = 1 << min_code_size
+    end_code = clear_code + 1
+    table = {}
+    next_code = end_code + 1
+    code_size = min_code_size + 1
+
+    if not data:
+        # an empty image is just the clear and end codes
+        return bytes(((end_code << code_size | clear_code) >> shift) & 0xFF for shift in range(0, 2 * code_size, 8))
+
+    out = bytearray()
+    bits, bit_count = clear_code, code_size
+    prefix = data[0]
+    for byte in data[1:]:
+        # codes are keyed by the code of the prefix string and the byte that extends it
+        key = (prefix << 8) | byte
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        bits |= prefix << bit_count
+        bit_count += code_size
+        if next_code < 4096:
+            table[key] = next_code
+            # decoders widen their codes once the table reaches the next power of two
+            if next_code == 1 << code_size:
+                code_size += 1
+            next_code += 1
+        else:
+            # the table is full, it starts over
+            bits |= clear_code << bit_count
+            bit_count += code_size
+            table.clear()
+            next_code = end_code + 1
+            code_size = min_code_size + 1
+        while bit_count >= 8:
+            out.append(bits & 0xFF)
+            bits >>= 8
+            bit_count -= 8
+        prefix = byte
+
+    bits |= prefix << bit_count
+    bit_count += code_size
+    bits |= end_code << bit_count
+    bit_count += code_size
+    while bit_count > 0:
+        out.append(bits & 0xFF)
+        bits >>= 8
+        bit_count -= 8
+    return bytes(out)
+
+
+def encode_gif_frame(indices, colors, delay):
+    # a frame with its own 256 colour table, so every frame can have another palette
+    # delay is in hundredths of a second
+    height, width = indices.shape
+    control = b'\x21\xf9\x04' + struct.pack('<BHBB', 0, delay, 0, 0)
+    descriptor = b'\x2c' + struct.pack('<HHHHB', 0, 0, width, height, 0x87)
+    data = lzw_encode(indices.tobytes())
+    # the image data follows in sub-blocks of at most 255 bytes, ended by an empty one
+    blocks = b''.join(bytes((len(data[i:i + 255]),)) + data[i:i + 255] for i in range(0, len(data), 255))
+    return control + descriptor + colors[:, :3].tobytes() + b'\x08' + blocks + b'\x00'
+
+
+class PngWriter:
+    # one PNG file per frame, the path pattern is filled in with the frame number as {index}
+    # and the time it is written as {time}, e.g. "frame_{index:06d}.png"
+
+    def __init__(self, pattern, compression_level=Settings.EXPORT_COMPRESSION_LEVEL):
+        self.pattern = pattern
+        self.compression_level = compression_level
+        self.index = 0
+        self.last_path = None
+        directory = os.path.dirname(pattern)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def encode(self, indices, colors):
+        return encode_png(indices, colors, self.compression_level)
+
+    def write(self, data):
+        self.last_path = self.pattern.format(index=self.index, time=datetime.now())
+        with open(self.last_path, 'wb') as file:
+            file.write(data)
+        self.index += 1
+
+    def close(self):
+        pass
+
+
+class GifWriter:
+    # an animated GIF, looping forever, frames are appended as they are written
+
+    def __init__(self, path, image_shape, frame_rate=Settings.EXPORT_FRAME_RATE):
+        height, width = image_shape
+        # GIF delays are hundredths of a second, so frame rates above 100 play at 100
+        self.delay = max(round(100 / frame_rate), 1)
+        self._file = open(path, 'wb')
+        self._file.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0, 0, 0))
+        self._file.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+
+    def encode(self, indices, colors):
+        return encode_gif_frame(indices, colors, self.delay)
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.write(b'\x3b')
+        self._file.close()
+        self._file = None
+
+
+class PipeWriter:
+    # raw RGBA frames piped to the standard input of an encoder, e.g. ffmpeg writing a video
+
+    def __init__(self, path, image_shape, frame_rate=Settings.EXPORT_FRAME_RATE,
+                 command=Settings.EXPORT_ENCODER_COMMAND):
+        height, width = image_shape
+        self.command = [part.format(width=width, height=height, fps=frame_rate, path=path) for part in command]
+        self._process = subprocess.Popen(self.command, stdin=subprocess.PIPE)
+
+    def encode(self, indices, colors):
+        return np.take(colors, indices, axis=0).tobytes()
+
+    def write(self, data):
+        self._process.stdin.write(data)
+
+    def close(self):
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            # the encoder exited early, its exit code tells why
+            pass
+        returncode = self._process.wait()
+        self._process = None
+        if returncode:
+            raise RuntimeError(f"'{self.command[0]}' exited with code {returncode}")
+
+
+def open_writer(path, image_shape, frame_rate=Settings.EXPORT_FRAME_RATE, command=Settings.EXPORT_ENCODER_COMMAND):
+    # PNG files for .png paths, an animated GIF for .gif, anything else is piped to the encoder command
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.png':
+        return PngWriter(path)
+    if extension == '.gif':
+        return GifWriter(path, image_shape, frame_rate)
+    return PipeWriter(path, image_shape, frame_rate, command)
+
+
+class FrameExporter:
+    # renders frames from grids and a palette and encodes them on a pool of threads, then writes them in order
+    # on one writer thread, record() only copies the grid, so it can be called for every generation
+    # at most max_pending frames are in flight, record() waits for a free slot beyond that, so a slow encoder
+    # slows the producer down instead of queueing frames without bound
+
+    def __init__(self, writer, palette=None, scale=Settings.EXPORT_SCALE, channel=None, every=1,
+                 workers=Settings.EXPORT_WORKERS, max_pending=Settings.EXPORT_QUEUE_SIZE):
+        self.writer = writer
+        # colours are read from the palette when a frame is recorded, so palette changes show up in the export
+        self.palette = palette or Palette(Settings.CELL_STATES[0].color, Settings.CELL_STATES[1].color)
+        self.scale = scale
+        # channel of channels.CellChannels the recorded grids hold, None for cell states
+        self.channel = channel
+        # only every n-th generation is exported
+        self.every = every
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+        self._slots = threading.Semaphore(max_pending)
+        # futures of the encoded frames, in the order they were recorded
+        self._pending = queue.Queue()
+        self._writer_thread = threading.Thread(target=self._write_frames, name='export writer', daemon=True)
+        self._writer_thread.start()
+
+        self.frames_recorded = 0
+        self.frames_written = 0
+        self.bytes_written = 0
+        # seconds record() spent waiting for the encoders
+        self.waited = 0.0
+        # the first error of an encoder or the writer, raised once, by the next record() or by close()
+        self.error = None
+        self._error_raised = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def record(self, generation, grid):
+        if self.error is not None:
+            self._error_raised = True
+            raise self.error
+        if generation % self.every:
+            return
+
+        start = time.perf_counter()
+        self._slots.acquire()
+        self.waited += time.perf_counter() - start
+
+        # the grid and the colours are copied now, the caller goes on changing both
+        grid = np.array(grid, dtype=np.uint8)
+        colors = self.palette.lut(self.channel).copy()
+        self._pending.put(self._pool.submit(self._encode, grid, colors))
+        self.frames_recorded += 1
+
+    def _encode(self, grid, colors):
+        return self.writer.encode(render_indices(grid, self.scale), colors)
+
+    def _write_frames(self):
+        while True:
+            future = self._pending.get()
+            if future is None:
+                return
+            try:
+                # after an error the remaining frames are dropped, but their slots are still freed
+                if self.error is None:
+                    data = future.result()
+                    self.writer.write(data)
+                    self.frames_written += 1
+                    self.bytes_written += len(data)
+            except Exception as error:
+                self.error = error
+            finally:
+                self._slots.release()
+
+    def close(self):
+        # waits until every recorded frame is written
+        if self._writer_thread is None:
+            return
+        self._pending.put(None)
+        self._writer_thread.join()
+        self._writer_thread = None
+        self._pool.shutdown()
+        try:
+            self.writer.close()
+        except Exception as error:
+            if self.error is None:
+                self.error = error
+        if self.error is not None and not self._error_raised:
+            self._error_raised = True
+            raise self.error
@@ -10,4 +10,13 @@ class GuiManager:
                                                 font_size=20,
                                                 x=self._pyglet_window.width // 2, y=25,
                                                 anchor_x='center', anchor_y='bottom',
-                                                batch=pyglet_batch)
\ No newline at end of file
+                                                batch=pyglet_batch)
+
+    def new_profiler_overlay(self, pyglet_batch):
+        return pyglet.text.Label('',
+                                                font_name='Courier New',
+                                                font_size=10,
+                                                x=self._pyglet_window.width - 10, y=self._pyglet_window.height - 10,
+                                                width=320, multiline=True,
+                                                anchor_x='right', anchor_y='top',
+                                                batch=pyglet_batch)
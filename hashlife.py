@@ -0,0 +1,298 @@
+from collections import OrderedDict
+import numpy as np
+
+
+class Node:
+    # a square of 2^level cells, split into four quadrants of 2^(level - 1) cells
+    # "north" is the first half of the rows and "west" the first half of the columns, as in a numpy array
+    __slots__ = ('nw', 'ne', 'sw', 'se', 'level', 'population')
+
+    def __init__(self, nw, ne, sw, se, level, population):
+        self.nw, self.ne, self.sw, self.se = nw, ne, sw, se
+        self.level = level
+        self.population = population
+
+
+class HashLife:
+    # the dense array of a node is cached up to this level (16x16 cells)
+    DENSE_CACHE_LEVEL = 4
+
+    def __init__(self, birth=(3,), survival=(2, 3), max_nodes=4_000_000, max_cache=2_000_000):
+        if 0 in birth:
+            raise ValueError("rules where cells are born with 0 neighbours cannot run on an unbounded world")
+        self.birth = frozenset(birth)
+        self.survival = frozenset(survival)
+
+        # canonical node table, every distinct square exists exactly once
+        self._nodes = {}
+        self.max_nodes = max_nodes
+        # the table is collected during a jump once it grows past this many nodes, see collect
+        self._collect_at = max_nodes
+        # squares and results of the successor calls still running, kept as roots when collecting
+        self._in_flight = []
+
+        # memoized successors, evicted least recently used first
+        self._results = OrderedDict()
+        self.max_cache = max_cache
+        self._dense = {}
+
+        self.off = Node(None, None, None, None, 0, 0)
+        self.on = Node(None, None, None, None, 0, 1)
+        self._empty = [self.off]
+
+        # the root is centred on the origin, covering [-2^(level - 1), 2^(level - 1)) on both axes
+        self.root = self.empty(3)
+        self.generation = 0
+
+        # the sixteen 2x2 nodes, indexed by their cells as bits (nw, ne, sw, se)
+        self._level1 = [self.join(self._leaf(code, 0), self._leaf(code, 1), self._leaf(code, 2), self._leaf(code, 3))
+                        for code in range(16)]
+        self._level1_codes = {node: code for code, node in enumerate(self._level1)}
+        self._base_table = self._build_base_table()
+
+    @classmethod
+    def from_limits(cls, underpopulation_limit, overpopulation_limit, reproduction_requirement, **kwargs):
+        return cls(birth=[reproduction_requirement],
+                   survival=range(underpopulation_limit, overpopulation_limit + 1), **kwargs)
+
+    def _leaf(self, code, bit):
+        return self.on if (code >> bit) & 1 else self.off
+
+    def _build_base_table(self):
+        # centre 2x2 after one generation for every 4x4 square, indexed by the codes of its four 2x2 quadrants
+        codes = np.arange(1 << 16)
+        cells = np.zeros((codes.size, 4, 4), dtype=np.uint8)
+        for quadrant in range(4):
+            for bit in range(4):
+                y = (quadrant // 2) * 2 + bit // 2
+                x = (quadrant % 2) * 2 + bit % 2
+                cells[:, y, x] = (codes >> (quadrant * 4 + bit)) & 1
+
+        padded = np.zeros((codes.size, 6, 6), dtype=np.uint8)
+        padded[:, 1:5, 1:5] = cells
+        count = sum(padded[:, 1 + dy:5 + dy, 1 + dx:5 + dx]
+                    for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx)
+
+        births = np.isin(count, list(self.birth))
+        survivals = np.isin(count, list(self.survival))
+        alive = np.where(cells == 1, survivals, births)
+        return (alive[:, 1, 1] | (alive[:, 1, 2] << 1) | (alive[:, 2, 1] << 2) | (alive[:, 2, 2] << 3)).astype(np.uint8)
+
+    # node construction
+
+    def join(self, nw, ne, sw, se):
+        key = (nw, ne, sw, se)
+        node = self._nodes.get(key)
+        if node is None:
+            node = Node(nw, ne, sw, se, nw.level + 1,
+                        nw.population + ne.population + sw.population + se.population)
+            self._nodes[key] = node
+        return node
+
+    def empty(self, level):
+        while len(self._empty) <= level:
+            smaller = self._empty[-1]
+            self._empty.append(self.join(smaller, smaller, smaller, smaller))
+        return self._empty[level]
+
+    def expand(self, node):
+        # surround a node with empty space, keeping it centred
+        border = self.empty(node.level - 1)
+        return self.join(self.join(border, border, border, node.nw),
+                         self.join(border, border, node.ne, border),
+                         self.join(border, node.sw, border, border),
+                         self.join(node.se, border, border, border))
+
+    def centre(self, node):
+        return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    @property
+    def node_count(self):
+        return len(self._nodes)
+
+    @property
+    def population(self):
+        return self.root.population
+
+    # evolution
+
+    def _life_4x4(self, node):
+        # advance the centre 2x2 of a 4x4 node by one generation
+        codes = self._level1_codes
+        index = codes[node.nw] | (codes[node.ne] << 4) | (codes[node.sw] << 8) | (codes[node.se] << 12)
+        return self._level1[self._base_table[index]]
+
+    def successor(self, node, exponent):
+        # the centre of a node (level - 1) after 2^exponent generations, exponent <= level - 2
+        if node.population == 0:
+            return node.nw
+
+        exponent = min(exponent, node.level - 2)
+        key = (node, exponent)
+        result = self._results.get(key)
+        if result is not None:
+            self._results.move_to_end(key)
+            return result
+
+        if node.level == 2:
+            result = self._life_4x4(node)
+        else:
+            # the table may be collected between the sub-jumps, so everything this call still needs is a root
+            in_flight = self._in_flight
+            mark = len(in_flight)
+            in_flight.append(node)
+            if len(self._nodes) > self._collect_at:
+                self.collect()
+
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            # nine overlapping sub-squares, each advanced half way (or not at all when going slower)
+            half = min(exponent, node.level - 3)
+            c1, c2, c3, c4, c5, c6, c7, c8, c9 = self._successors(
+                (nw, self.join(nw.ne, ne.nw, nw.se, ne.sw), ne,
+                 self.join(nw.sw, nw.se, sw.nw, sw.ne), self.join(nw.se, ne.sw, sw.ne, se.nw),
+                 self.join(ne.sw, ne.se, se.nw, se.ne),
+                 sw, self.join(sw.ne, se.nw, sw.se, se.sw), se), half)
+
+            if exponent < node.level - 2:
+                result = self.join(self.join(c1.se, c2.sw, c4.ne, c5.nw),
+                                   self.join(c2.se, c3.sw, c5.ne, c6.nw),
+                                   self.join(c4.se, c5.sw, c7.ne, c8.nw),
+                                   self.join(c5.se, c6.sw, c8.ne, c9.nw))
+            else:
+                result = self.join(*self._successors(
+                    (self.join(c1, c2, c4, c5), self.join(c2, c3, c5, c6),
+                     self.join(c4, c5, c7, c8), self.join(c5, c6, c8, c9)), half))
+            del in_flight[mark:]
+
+        self._results[key] = result
+        if len(self._results) > self.max_cache:
+            self._results.popitem(last=False)
+        return result
+
+    def _successors(self, squares, exponent):
+        # the successors of several squares, all of them rooted until the calling successor returns
+        self._in_flight.extend(squares)
+        results = []
+        for square in squares:
+            result = self.successor(square, exponent)
+            self._in_flight.append(result)
+            results.append(result)
+        return results
+
+    def _is_padded(self, node):
+        # true when every live cell is inside the centre quarter of the node
+        inner = (node.nw.se.population + node.ne.sw.population +
+                 node.sw.ne.population + node.se.nw.population)
+        return inner == node.population
+
+    def jump(self, exponent):
+        # advance the world by 2^exponent generations
+        # a jump interrupted earlier may have left squares rooted
+        del self._in_flight[:]
+        root = self.root
+        while root.level < exponent + 2 or not self._is_padded(root):
+            root = self.expand(root)
+        self.root = self.successor(self.expand(root), exponent)
+        self.generation += 1 << exponent
+
+        if len(self._nodes) > self.max_nodes:
+            self.collect()
+
+    def advance(self, generations):
+        # any number of generations, as a sum of power of two jumps
+        exponent = 0
+        while generations:
+            if generations & 1:
+                self.jump(exponent)
+            generations >>= 1
+            exponent += 1
+
+    def collect(self):
+        # drop every node neither the root nor a running successor call uses, along with the memoized results
+        # a jump needing more than max_nodes to itself collects again only once its table has doubled
+        self._results.clear()
+        self._dense.clear()
+        live = {}
+        stack = [self.root] + self._empty[1:] + self._level1 + self._in_flight
+        while stack:
+            node = stack.pop()
+            if node.level == 0:
+                continue
+            key = (node.nw, node.ne, node.sw, node.se)
+            if key in live:
+                continue
+            live[key] = node
+            stack.extend(key)
+        self._nodes = live
+        self._collect_at = max(self.max_nodes, 2 * len(live))
+
+    # conversion to and from dense grids
+
+    def from_array(self, grid):
+        # import a dense grid, cell (row, column) becomes world position (x=column, y=row)
+        height, width = grid.shape
+        level = 1
+        while (1 << (level - 1)) < max(height, width):
+            level += 1
+        offset = 1 << (level - 1)
+
+        cells = np.zeros((1 << level, 1 << level), dtype=np.uint8)
+        cells[offset:offset + height, offset:offset + width] = grid.astype(bool)
+
+        # build level 1 nodes from 2x2 blocks, then join unique quadruples one level at a time
+        nodes = self._level1
+        ids = cells[0::2, 0::2] | (cells[0::2, 1::2] << 1) | (cells[1::2, 0::2] << 2) | (cells[1::2, 1::2] << 3)
+        ids = ids.astype(np.int64)
+
+        while ids.shape[0] > 1:
+            quads = np.stack([ids[0::2, 0::2], ids[0::2, 1::2], ids[1::2, 0::2], ids[1::2, 1::2]], axis=-1)
+            unique, inverse = np.unique(quads.reshape(-1, 4), axis=0, return_inverse=True)
+            nodes = [self.join(nodes[a], nodes[b], nodes[c], nodes[d]) for a, b, c, d in unique]
+            ids = inverse.reshape(quads.shape[:2])
+
+        self.root = nodes[ids[0, 0]]
+        self.generation = 0
+
+    def to_array(self, node):
+        size = 1 << node.level
+        if node.population == 0:
+            return np.zeros((size, size), dtype=bool)
+        if node.level == 0:
+            return np.ones((1, 1), dtype=bool)
+
+        cached = self._dense.get(node)
+        if cached is not None:
+            return cached
+
+        result = np.block([[self.to_array(node.nw), self.to_array(node.ne)],
+                           [self.to_array(node.sw), self.to_array(node.se)]])
+        if node.level <= self.DENSE_CACHE_LEVEL:
+            self._dense[node] = result
+        return result
+
+    def window(self, x, y, width, height):
+        # dense view of the world, row j of the result is world y + j
+        result = np.zeros((height, width), dtype=bool)
+        half = 1 << (self.root.level - 1)
+        self._fill_window(self.root, -half, -half, x, y, result)
+        return result
+
+    def _fill_window(self, node, node_x, node_y, x, y, result):
+        size = 1 << node.level
+        height, width = result.shape
+        left, right = max(node_x, x), min(node_x + size, x + width)
+        bottom, top = max(node_y, y), min(node_y + size, y + height)
+        if node.population == 0 or left >= right or bottom >= top:
+            return
+
+        if node.level <= self.DENSE_CACHE_LEVEL:
+            cells = self.to_array(node)
+            result[bottom - y:top - y, left - x:right - x] = cells[bottom - node_y:top - node_y,
+                                                                   left - node_x:right - node_x]
+            return
+
+        half = size >> 1
+        self._fill_window(node.nw, node_x, node_y, x, y, result)
+        self._fill_window(node.ne, node_x + half, node_y, x, y, result)
+        self._fill_window(node.sw, node_x, node_y + half, x, y, result)
+        self._fill_window(node.se, node_x + half, node_y + half, x, y, result)
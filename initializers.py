@@ -0,0 +1,280 @@
+import re
+import numpy as np
+from config.settings import Settings
+
+# every generator builds rows y0 to y1 of a grid from the seed alone, so a grid generated in chunks
+# is the same as one generated at once, and the same seed always gives the same grid
+
+# random numbers for uniform grids are drawn in blocks of about this many cells, each with its own stream
+UNIFORM_BLOCK_CELLS = 1 << 20
+
+# points of a noise landscape sampled to find the level that gives the asked density
+NOISE_THRESHOLD_SAMPLES = 1 << 16
+
+# splitmix64 constants
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _hash(seed, *values):
+    # a well mixed 64 bit hash of the seed and integer arrays, e.g. lattice coordinates
+    h = np.full(np.broadcast_shapes(*(np.shape(value) for value in values)), np.uint64(seed), dtype=np.uint64)
+    # the arithmetic is modulo 2**64 on purpose
+    with np.errstate(over='ignore'):
+        for value in values:
+            h = h ^ np.asarray(value).astype(np.uint64)
+            h = h + _GOLDEN
+            h = (h ^ (h >> np.uint64(30))) * _MIX_1
+            h = (h ^ (h >> np.uint64(27))) * _MIX_2
+            h = h ^ (h >> np.uint64(31))
+    return h
+
+
+def _unit(h):
+    # hashes to floats in [0, 1)
+    return (h >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+def _coordinates(shape, y0, y1):
+    return np.arange(y0, y1)[:, None], np.arange(shape[1])[None, :]
+
+
+def uniform(shape, y0, y1, seed, life_chance=Settings.INITIAL_LIFE_CHANCE):
+    # each cell is alive with probability life_chance
+    height, width = shape
+    block_rows = max(1, UNIFORM_BLOCK_CELLS // width)
+    rows = []
+    for block in range(y0 // block_rows, -(-y1 // block_rows)):
+        block_y0 = block * block_rows
+        block_y1 = min(block_y0 + block_rows, height)
+        values = np.random.default_rng([seed, block]).random((block_y1 - block_y0, width), dtype=np.float32)
+        rows.append(values[max(y0, block_y0) - block_y0:min(y1, block_y1) - block_y0])
+    return np.concatenate(rows) < life_chance
+
+
+def _smoothstep(t):
+    return t * t * (3 - 2 * t)
+
+
+def _fade(t):
+    return t * t * t * (t * (t * 6 - 15) + 10)
+
+
+def _value_octave(seed, y, x, scale):
+    gy, gx = y / scale, x / scale
+    iy, ix = np.floor(gy).astype(np.int64), np.floor(gx).astype(np.int64)
+    fy, fx = _smoothstep(gy - iy), _smoothstep(gx - ix)
+    corner = lambda dy, dx: _unit(_hash(seed, iy + dy, ix + dx))
+    top = corner(0, 0) * (1 - fx) + corner(0, 1) * fx
+    bottom = corner(1, 0) * (1 - fx) + corner(1, 1) * fx
+    return top * (1 - fy) + bottom * fy
+
+
+def _perlin_octave(seed, y, x, scale):
+    gy, gx = y / scale, x / scale
+    iy, ix = np.floor(gy).astype(np.int64), np.floor(gx).astype(np.int64)
+    fy, fx = gy - iy, gx - ix
+
+    def corner(dy, dx):
+        # dot product of a random unit gradient with the offset from the lattice point
+        angle = 2 * np.pi * _unit(_hash(seed, iy + dy, ix + dx))
+        return np.cos(angle) * (fx - dx) + np.sin(angle) * (fy - dy)
+
+    uy, ux = _fade(fy), _fade(fx)
+    top = corner(0, 0) * (1 - ux) + corner(0, 1) * ux
+    bottom = corner(1, 0) * (1 - ux) + corner(1, 1) * ux
+    # gradient noise lies within +-sqrt(1/2), scaled to [0, 1]
+    return (top * (1 - uy) + bottom * uy) * np.sqrt(0.5) + 0.5
+
+
+def _fractal(octave, y, x, seed, scale, octaves):
+    total = 0.0
+    amplitude, amplitudes = 1.0, 0.0
+    for index in range(octaves):
+        total = total + amplitude * octave(seed + index, y, x, scale / (1 << index))
+        amplitudes += amplitude
+        amplitude /= 2
+    return total / amplitudes
+
+
+def _noise(octave, shape, y0, y1, seed, life_chance, scale, octaves):
+    # octaves average out towards 0.5, so the level cells are alive above is the 1 - life_chance quantile
+    # of a fixed sample of the whole landscape, which every chunk computes alike
+    sample = np.arange(NOISE_THRESHOLD_SAMPLES)
+    sample_y = (_unit(_hash(seed, sample, 0)) * shape[0]).astype(np.int64)
+    sample_x = (_unit(_hash(seed, sample, 1)) * shape[1]).astype(np.int64)
+    level = np.quantile(_fractal(octave, sample_y, sample_x, seed, scale, octaves), 1 - life_chance)
+    y, x = _coordinates(shape, y0, y1)
+    return _fractal(octave, y, x, seed, scale, octaves) > level
+
+
+def value_noise(shape, y0, y1, seed, life_chance=Settings.INITIAL_LIFE_CHANCE, scale=16.0, octaves=3):
+    # smooth random landscape, cells are alive where it is highest
+    return _noise(_value_octave, shape, y0, y1, seed, life_chance, scale, octaves)
+
+
+def perlin(shape, y0, y1, seed, life_chance=Settings.INITIAL_LIFE_CHANCE, scale=24.0, octaves=4):
+    # gradient noise has fewer grid aligned artefacts than value noise
+    return _noise(_perlin_octave, shape, y0, y1, seed, life_chance, scale, octaves)
+
+
+def blobs(shape, y0, y1, seed, blob_chance=0.3, min_radius=3, max_radius=12, fill=0.6):
+    # discs of random cells, at most one centred in each square of a lattice of side 2 * max_radius
+    spacing = 2 * max_radius
+    y, x = _coordinates(shape, y0, y1)
+    cell_y, cell_x = y // spacing, x // spacing
+    inside = np.zeros((y1 - y0, shape[1]), dtype=bool)
+
+    # a disc can only reach into the lattice squares next to its own
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            lattice_y, lattice_x = cell_y + dy, cell_x + dx
+            h = _hash(seed, lattice_y, lattice_x)
+            present = _unit(_hash(seed, h, 0)) < blob_chance
+            centre_y = (lattice_y + _unit(_hash(seed, h, 1))) * spacing
+            centre_x = (lattice_x + _unit(_hash(seed, h, 2))) * spacing
+            radius = min_radius + _unit(_hash(seed, h, 3)) * (max_radius - min_radius)
+            inside |= present & ((y - centre_y) ** 2 + (x - centre_x) ** 2 <= radius ** 2)
+
+    return inside & (_unit(_hash(seed + 1, y, x)) < fill)
+
+
+def patterns(shape, y0, y1, seed, pattern_chance=0.3, names=None, spacing=48):
+    # patterns from the library stamped in random places and orientations, at most one per lattice square
+    names = sorted(PATTERNS) if names is None else list(names)
+    library = [parse_rle(PATTERNS[name])[0] for name in names]
+    spacing = max(spacing, max(max(cells.shape) for cells in library) + 2)
+    grid = np.zeros((y1 - y0, shape[1]), dtype=bool)
+
+    lattice_y = np.arange(y0 // spacing, -(-y1 // spacing))[:, None]
+    lattice_x = np.arange(-(-shape[1] // spacing))[None, :]
+    h = _hash(seed, lattice_y, lattice_x)
+    chosen_y, chosen_x = np.nonzero(_unit(_hash(seed, h, 0)) < pattern_chance)
+
+    for ly, lx in zip(lattice_y[chosen_y, 0], lattice_x[0, chosen_x]):
+        cell_hash = h[ly - lattice_y[0, 0], lx]
+        cells = library[int(_hash(seed, cell_hash, 1) % np.uint64(len(library)))]
+        # one of the eight rotations and reflections
+        orientation = int(_hash(seed, cell_hash, 2) % np.uint64(8))
+        cells = np.rot90(cells, orientation % 4)
+        if orientation >= 4:
+            cells = cells[:, ::-1]
+
+        top = int(ly * spacing + _unit(_hash(seed, cell_hash, 3)) * (spacing - cells.shape[0]))
+        left = int(lx * spacing + _unit(_hash(seed, cell_hash, 4)) * (spacing - cells.shape[1]))
+        stamp(grid, cells, top - y0, left)
+    return grid
+
+
+def rle(shape, y0, y1, seed, path=None, text=None, top=None, left=None):
+    # a pattern from an RLE file or string, centred unless a position is given
+    cells, _ = read_rle(path) if path is not None else parse_rle(text)
+    # RLE rows run top to bottom, grid row 0 is drawn at the bottom of the window
+    cells = cells[::-1]
+    top = (shape[0] - cells.shape[0]) // 2 if top is None else top
+    left = (shape[1] - cells.shape[1]) // 2 if left is None else left
+    grid = np.zeros((y1 - y0, shape[1]), dtype=cells.dtype)
+    stamp(grid, cells, top - y0, left)
+    return grid
+
+
+def stamp(grid, cells, top, left):
+    # copies the live cells of a pattern into the grid at (top, left), clipped to the grid
+    grid_y0, grid_x0 = max(top, 0), max(left, 0)
+    grid_y1 = min(top + cells.shape[0], grid.shape[0])
+    grid_x1 = min(left + cells.shape[1], grid.shape[1])
+    if grid_y0 >= grid_y1 or grid_x0 >= grid_x1:
+        return grid
+    window = cells[grid_y0 - top:grid_y1 - top, grid_x0 - left:grid_x1 - left]
+    target = grid[grid_y0:grid_y1, grid_x0:grid_x1]
+    np.copyto(target, window, where=window != 0, casting='unsafe')
+    return grid
+
+
+_RLE_HEADER = re.compile(r'^\s*x\s*=\s*(\d+)\s*,\s*y\s*=\s*(\d+)(?:\s*,\s*rule\s*=\s*(\S+))?', re.IGNORECASE)
+_RLE_TOKEN = re.compile(r'(\d*)([bo$!.A-X])')
+
+
+def parse_rle(text):
+    # returns the cells as an array and the rule of the header, if any
+    # b and . are dead cells, o is a live cell, A to X are states 1 to 24, $ ends a row and ! the pattern
+    width = height = 0
+    rule = None
+    body = []
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        header = _RLE_HEADER.match(line)
+        if header:
+            width, height, rule = int(header.group(1)), int(header.group(2)), header.group(3)
+        else:
+            body.append(line.strip())
+
+    rows, row = [], []
+    for count, token in _RLE_TOKEN.findall(''.join(body)):
+        count = int(count) if count else 1
+        if token == '!':
+            break
+        if token == '$':
+            rows.append(row)
+            rows.extend([] for _ in range(count - 1))
+            row = []
+        else:
+            state = 0 if token in 'b.' else 1 if token == 'o' else ord(token) - ord('A') + 1
+            row.extend([state] * count)
+    rows.append(row)
+
+    width = max(width, max(len(row) for row in rows))
+    height = max(height, len(rows))
+    cells = np.zeros((height, width), dtype=np.uint8)
+    for y, row in enumerate(rows):
+        cells[y, :len(row)] = row
+    return (cells.astype(bool) if cells.max(initial=0) <= 1 else cells), rule
+
+
+def read_rle(path):
+    with open(path) as file:
+        return parse_rle(file.read())
+
+
+# pattern library in RLE
+PATTERNS = {
+    'glider': 'bo$2bo$3o!',
+    'blinker': '3o!',
+    'lwss': 'bo2bo$o4b$o3bo$4o!',
+    'r_pentomino': 'b2o$2ob$bo!',
+    'acorn': 'bo5b$3bo3b$2o2b3o!',
+    'diehard': '6bob$2o6b$bo3b3o!',
+    'pulsar': '2b3o3b3o2b2$o4bobo4bo$o4bobo4bo$o4bobo4bo$2b3o3b3o2b2$2b3o3b3o2b$o4bobo4bo$o4bobo4bo$o4bobo4bo2$'
+              '2b3o3b3o!',
+    'gosper_glider_gun': '24bo$22bobo$12b2o6b2o12b2o$11bo3bo4b2o12b2o$2o8bo5bo3b2o$2o8bo3bob2o4bobo$10bo5bo7bo$'
+                         '11bo3bo$12b2o!',
+}
+
+GENERATORS = {
+    'uniform': uniform,
+    'noise': value_noise,
+    'perlin': perlin,
+    'blobs': blobs,
+    'patterns': patterns,
+    'rle': rle,
+}
+
+
+def new_seed():
+    # a random seed, to be reported so the grid can be made again
+    return int(np.random.SeedSequence().entropy % (1 << 63))
+
+
+def chunks(name, shape, seed, chunk_rows=None, **params):
+    # yields (y0, rows) for bands of about Settings.INIT_CHUNK_CELLS cells
+    generator = GENERATORS[name]
+    chunk_rows = chunk_rows or max(1, Settings.INIT_CHUNK_CELLS // shape[1])
+    for y0 in range(0, shape[0], chunk_rows):
+        y1 = min(y0 + chunk_rows, shape[0])
+        yield y0, generator(shape, y0, y1, seed, **params)
+
+
+def generate(name, shape, seed, chunk_rows=None, **params):
+    return np.concatenate([rows for _, rows in chunks(name, shape, seed, chunk_rows, **params)])
@@ -0,0 +1,331 @@
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+from scipy.ndimage import convolve
+from scipy.signal import convolve2d, fftconvolve
+from config.settings import Settings
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+class CompiledKernel:
+    # a convolution kernel analysed once, so the cheapest way to count neighbours with it can be picked
+
+    # rough cost of one cell for each counting strategy, in units of one multiply-add of a direct convolution
+    BOX_COST = 10
+    SAT_BASE_COST = 8
+    SAT_RECTANGLE_COST = 1.5
+    FFT_BASE_COST = 4
+    FFT_LOG_COST = 0.6
+    SLICE_BASE_COST = 1
+    SLICE_ENTRY_COST = 0.5
+    NDIMAGE_COST = 0.5
+    NUMBA_COST = 0.2
+
+    def __init__(self, kernel):
+        self.kernel = np.asarray(kernel).astype(np.int64)
+        self.height, self.width = self.kernel.shape
+        self.size = int(np.count_nonzero(self.kernel))
+
+        # convolve2d 'same' output starts this far into the 'full' output
+        self.origin_y = (self.height - 1) // 2
+        self.origin_x = (self.width - 1) // 2
+
+        self.rectangles = self._rectangles()
+        self.is_box, self.box_centre = self._box()
+
+    def _rectangles(self):
+        # the kernel as weighted rectangles of equal values: (weight, i0, i1, j0, j1), rows i0:i1, columns j0:j1
+        runs = []
+        for i, row in enumerate(self.kernel):
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], row, [0]))) != 0)
+            for start, stop in zip(edges[:-1], edges[1:]):
+                if row[start] != 0:
+                    runs.append([int(row[start]), i, i + 1, int(start), int(stop)])
+
+        # stack identical runs of consecutive rows into taller rectangles
+        rectangles = []
+        for run in runs:
+            previous = rectangles[-1] if rectangles else None
+            if previous and previous[0] == run[0] and previous[2] == run[1] and previous[3:] == run[3:]:
+                previous[2] = run[2]
+            else:
+                rectangles.append(run)
+        return [tuple(rectangle) for rectangle in rectangles]
+
+    def _box(self):
+        # a full box of ones, optionally without its centre cell
+        if self.height % 2 == 0 or self.width % 2 == 0:
+            return False, 0
+        centre = self.kernel[self.origin_y, self.origin_x]
+        others = self.kernel.copy()
+        others[self.origin_y, self.origin_x] = 1
+        return bool(np.all(others == 1) and centre in (0, 1)), int(centre)
+
+    def costs(self, grid_shape, extended=False):
+        costs = {
+            'direct': self.height * self.width,
+            'sat': self.SAT_BASE_COST + self.SAT_RECTANGLE_COST * len(self.rectangles),
+            'fft': self.FFT_BASE_COST + self.FFT_LOG_COST * np.log2(max(int(np.prod(grid_shape)), 2)),
+        }
+        if self.is_box:
+            costs['box'] = self.BOX_COST
+        # strategies added since the estimates above were tuned are only used to order and prune autotuning
+        if extended:
+            costs['slices'] = self.SLICE_BASE_COST + self.SLICE_ENTRY_COST * self.size
+            costs['ndimage'] = self.NDIMAGE_COST * self.height * self.width
+            costs['numba'] = self.NUMBA_COST * self.height * self.width
+        return costs
+
+    def choose_strategy(self, grid_shape):
+        costs = self.costs(grid_shape)
+        return min(costs, key=costs.get)
+
+
+# compiled kernels by kernel contents
+_compiled_kernels = {}
+
+
+def compile_kernel(kernel):
+    kernel = np.asarray(kernel)
+    key = (kernel.shape, kernel.astype(np.int64).tobytes())
+    compiled = _compiled_kernels.get(key)
+    if compiled is None:
+        compiled = _compiled_kernels[key] = CompiledKernel(kernel)
+    return compiled
+
+
+def count_neighbours(grid, kernel, strategy=None, mode=None):
+    # same counts as convolve2d(grid, kernel, mode='same', boundary='fill', fillvalue=0), as integers
+    # with a mode name the strategy is the one autotuned for that mode, grid shape and kernel
+    compiled = kernel if isinstance(kernel, CompiledKernel) else compile_kernel(kernel)
+    if strategy is None:
+        strategy = Settings.COUNT_STRATEGY
+    if strategy is None and mode is not None and Settings.AUTOTUNE:
+        strategy = autotuner.choose(mode, grid, compiled)
+    if strategy is None:
+        strategy = compiled.choose_strategy(grid.shape)
+    return STRATEGIES[strategy](grid, compiled)
+
+
+def count_direct(grid, compiled):
+    return convolve2d(grid, compiled.kernel, mode='same', boundary='fill', fillvalue=0)
+
+
+def count_fft(grid, compiled):
+    counts = fftconvolve(grid.astype(np.float64), compiled.kernel.astype(np.float64), mode='same')
+    return np.rint(counts).astype(np.int64)
+
+
+def count_box(grid, compiled):
+    # separable sliding sums, one along the rows and one along the columns
+    radius_y, radius_x = compiled.height // 2, compiled.width // 2
+    counts = _sliding_sum(_sliding_sum(grid.astype(np.int64), radius_y, axis=0), radius_x, axis=1)
+    if compiled.box_centre == 0:
+        counts -= grid
+    return counts
+
+
+def _sliding_sum(values, radius, axis):
+    length = values.shape[axis]
+    pad = [(0, 0), (0, 0)]
+    pad[axis] = (radius + 1, radius)
+    cumulative = np.cumsum(np.pad(values, pad), axis=axis)
+    upper = np.take(cumulative, np.arange(2 * radius + 1, 2 * radius + 1 + length), axis=axis)
+    lower = np.take(cumulative, np.arange(length), axis=axis)
+    return upper - lower
+
+
+def count_sat(grid, compiled):
+    # summed-area table, every rectangle of the kernel costs four lookups per cell
+    height, width = grid.shape
+    pad_y, pad_x = compiled.height, compiled.width
+    table = np.zeros((height + 2 * pad_y + 1, width + 2 * pad_x + 1), dtype=np.int64)
+    table[pad_y + 1:pad_y + 1 + height, pad_x + 1:pad_x + 1 + width] = grid
+    np.cumsum(table, axis=0, out=table)
+    np.cumsum(table, axis=1, out=table)
+
+    counts = np.zeros((height, width), dtype=np.int64)
+    for weight, i0, i1, j0, j1 in compiled.rectangles:
+        # kernel rows i0:i1 read grid rows y + origin - i, so the rectangle is flipped
+        top, bottom = compiled.origin_y - i1 + 1 + pad_y, compiled.origin_y - i0 + 1 + pad_y
+        left, right = compiled.origin_x - j1 + 1 + pad_x, compiled.origin_x - j0 + 1 + pad_x
+        counts += weight * (table[bottom:bottom + height, right:right + width]
+                            - table[top:top + height, right:right + width]
+                            - table[bottom:bottom + height, left:left + width]
+                            + table[top:top + height, left:left + width])
+    return counts
+
+
+def count_ndimage(grid, compiled):
+    # kernels of even size are centred differently by ndimage, they use the other strategies
+    return convolve(grid.astype(np.int32), compiled.kernel.astype(np.int32), mode='constant', cval=0)
+
+
+def count_slices(grid, compiled):
+    # one weighted sum of shifted views of the zero padded grid per non zero kernel entry
+    height, width = grid.shape
+    padded = np.zeros((height + compiled.height - 1, width + compiled.width - 1), dtype=np.int32)
+    top, left = compiled.height - 1 - compiled.origin_y, compiled.width - 1 - compiled.origin_x
+    padded[top:top + height, left:left + width] = grid
+    counts = np.zeros((height, width), dtype=np.int32)
+    for i, j in zip(*np.nonzero(compiled.kernel)):
+        # kernel entry (i, j) reads the cell origin - i rows and origin - j columns away
+        dy, dx = compiled.height - 1 - i, compiled.width - 1 - j
+        view = padded[dy:dy + height, dx:dx + width]
+        weight = int(compiled.kernel[i, j])
+        if weight == 1:
+            counts += view
+        else:
+            counts += weight * view
+    return counts
+
+
+if numba is not None:
+    @numba.njit(cache=True, parallel=True)
+    def _count_numba(grid, kernel, origin_y, origin_x):
+        height, width = grid.shape
+        kernel_height, kernel_width = kernel.shape
+        counts = np.zeros((height, width), dtype=np.int32)
+        for y in numba.prange(height):
+            for x in range(width):
+                total = 0
+                for i in range(kernel_height):
+                    source_y = y + origin_y - i
+                    if 0 <= source_y < height:
+                        for j in range(kernel_width):
+                            source_x = x + origin_x - j
+                            if 0 <= source_x < width:
+                                total += kernel[i, j] * grid[source_y, source_x]
+                counts[y, x] = total
+        return counts
+
+
+def count_numba(grid, compiled):
+    return _count_numba(grid.view(np.uint8) if grid.dtype == bool else grid, compiled.kernel.astype(np.int32),
+                        compiled.origin_y, compiled.origin_x)
+
+
+STRATEGIES = {
+    'direct': count_direct,
+    'box': count_box,
+    'sat': count_sat,
+    'fft': count_fft,
+    'ndimage': count_ndimage,
+    'slices': count_slices,
+}
+if numba is not None:
+    STRATEGIES['numba'] = count_numba
+
+
+def available_strategies(compiled):
+    strategies = [name for name in STRATEGIES if name != 'box' or compiled.is_box]
+    if compiled.height % 2 == 0 or compiled.width % 2 == 0:
+        strategies.remove('ndimage')
+    return strategies
+
+
+class Autotuner:
+    # times every strategy on the first grid counted for a (mode, grid shape, kernel) and keeps the fastest,
+    # choices are saved to a JSON file so later runs skip the timing, or only kept in memory when path is None
+
+    def __init__(self, path=Settings.AUTOTUNE_CACHE, repeats=Settings.AUTOTUNE_REPEATS,
+                 min_cells=Settings.AUTOTUNE_MIN_CELLS, cost_ratio=Settings.AUTOTUNE_COST_RATIO):
+        self.path = path
+        self.repeats = repeats
+        self.min_cells = min_cells
+        self.cost_ratio = cost_ratio
+        self._choices = None if path is not None else {}
+        self._save_failed = False
+        # worker threads step bands of the same grid at once
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(mode, grid_shape, compiled):
+        kernel = ','.join(str(value) for value in compiled.kernel.ravel())
+        return f"{mode}/{grid_shape[0]}x{grid_shape[1]}/{compiled.height}x{compiled.width}:{kernel}"
+
+    def choose(self, mode, grid, compiled):
+        # small grids are counted in microseconds, timing them costs more than it saves
+        if grid.size < self.min_cells:
+            return None
+        key = self.key(mode, grid.shape, compiled)
+        with self._lock:
+            if self._choices is None:
+                self._choices = self._load()
+            strategy = self._choices.get(key)
+            if strategy in STRATEGIES:
+                return strategy
+            strategy = self._choices[key] = self.tune(grid, compiled)
+            if self.path is not None:
+                self._save()
+            return strategy
+
+    def tune(self, grid, compiled):
+        # strategies estimated to cost far more than the cheapest are not timed at all,
+        # the cheapest estimate is timed first and its counts are the ones the others must match
+        costs = compiled.costs(grid.shape, extended=True)
+        strategies = sorted(available_strategies(compiled), key=costs.get)
+        cheapest = costs[strategies[0]]
+        expected = None
+        timings = {}
+        for strategy in strategies:
+            if costs[strategy] > self.cost_ratio * cheapest:
+                break
+            count = STRATEGIES[strategy]
+            # the first call checks the counts, and compiles numba functions outside the timing
+            start = time.perf_counter()
+            counts = count(grid, compiled)
+            first = time.perf_counter() - start
+            if expected is None:
+                expected = counts
+            elif not np.array_equal(counts, expected):
+                continue
+
+            best = first
+            # a strategy much slower than the best so far is not worth timing again
+            if not timings or first < 2 * min(timings.values()):
+                for _ in range(self.repeats):
+                    start = time.perf_counter()
+                    count(grid, compiled)
+                    best = min(best, time.perf_counter() - start)
+            timings[strategy] = best
+        return min(timings, key=timings.get)
+
+    def _load(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        # written to a temporary file first, so other processes never read half a file
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temporary = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, 'w') as file:
+                json.dump(self._choices, file, indent=2, sort_keys=True)
+            os.replace(temporary, self.path)
+        except OSError as error:
+            # a read only directory only costs tuning again next time, it is reported once
+            if not self._save_failed:
+                self._save_failed = True
+                print(f"could not save the autotuned strategies to {self.path}: {error}", file=sys.stderr)
+
+    def forget(self):
+        with self._lock:
+            self._choices = {}
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+autotuner = Autotuner()
@@ -0,0 +1,71 @@
+import numpy as np
+from config.settings import Settings
+
+
+class LodPyramid:
+    # downsampled copies of the grid for drawing it zoomed out, level k has one cell per 2^k x 2^k cells
+    # level 0 is the grid itself, the others are rebuilt from the rows changed since they were last drawn
+    # "max" pooling keeps the highest state of every block, "mean" stores the share of live cells as 0 to 255
+
+    Poolings = ("max", "mean")
+
+    def __init__(self, grid_shape, levels=Settings.LOD_LEVELS, pooling=Settings.LOD_POOLING):
+        if pooling not in self.Poolings:
+            raise ValueError(f"unknown pooling '{pooling}', expected one of {self.Poolings}")
+        self.grid_height, self.grid_width = grid_shape
+        self.pooling = pooling
+        self.levels = [None]
+        height, width = self.grid_height, self.grid_width
+        for _ in range(levels):
+            height, width = -(-height // 2), -(-width // 2)
+            self.levels.append(np.zeros((height, width), dtype=np.uint8))
+
+        # grid rows changed since each level was last rebuilt, (first, last) with last exclusive
+        self._pending = [(0, self.grid_height)] * len(self.levels)
+
+    @property
+    def coverage(self):
+        # levels above 0 hold live cell shares rather than states
+        return self.pooling == "mean"
+
+    def mark(self, first_row, last_row):
+        if first_row >= last_row:
+            return
+        for level, (first, last) in enumerate(self._pending):
+            if first < last:
+                self._pending[level] = (min(first, first_row), max(last, last_row))
+            else:
+                self._pending[level] = (first_row, last_row)
+
+    def mark_all(self):
+        self._pending = [(0, self.grid_height)] * len(self.levels)
+
+    def refresh(self, grid, level):
+        # brings levels 1 to level up to date, returns the array of the level
+        self.levels[0] = grid
+        for index in range(1, level + 1):
+            first, last = self._pending[index]
+            if first < last:
+                scale = 1 << index
+                self._pool(self.levels[index - 1], self.levels[index], first // scale, -(-last // scale), index == 1)
+                self._pending[index] = (0, 0)
+        return self.levels[level]
+
+    def _pool(self, source, target, first, last, from_grid):
+        # target rows first to last from the 2x2 blocks of source rows 2 * first to 2 * last
+        band = source[2 * first:2 * last]
+        if self.pooling == "mean" and from_grid:
+            band = np.where(band == 1, np.uint16(255), np.uint16(0))
+        else:
+            band = band.astype(np.uint16)
+
+        # odd edges are padded with dead cells
+        rows, columns = last - first, target.shape[1]
+        if band.shape != (2 * rows, 2 * columns):
+            band = np.pad(band, ((0, 2 * rows - band.shape[0]), (0, 2 * columns - band.shape[1])))
+
+        blocks = band.reshape(rows, 2, columns, 2)
+        if self.pooling == "max":
+            target[first:last] = blocks.max(axis=(1, 3))
+        else:
+            target[first:last] = (blocks.sum(axis=(1, 3)) + 2) // 4
@@ -1,18 +1,36 @@
+import os
+import sys
 from datetime import datetime
 import numpy as np
 import pyglet
 from pyglet.window import mouse as mouse
 from neighbourhoods import Neighbourhood
+from brush import Brush
+from camera import Camera
+from channels import CellChannels
 from config.settings import Settings
 from config.input import Controls
 from direction import Direction as dir
+import export
 from gui import GuiManager
+from recording import Player
+from renderer import GridRenderer
+from simulation import Simulation
+from worker import SimulationWorker
 import modes
 
 
 class CellularAutomataWindow(pyglet.window.Window):
-
-    def __init__(self):
+    # mode selection keys and the simulation modes they switch to
+    MODE_KEYS = {
+        Controls.CA_MODE        : 'ca',
+        Controls.SAND_MODE      : 'sand',
+        Controls.EXPAND_MODE    : 'expand',
+        Controls.ZEBRA_MODE     : 'zebra',
+        Controls.TRAIL_MODE     : 'trail'
+    }
+
+    def __init__(self, replay_path=None):
         super().__init__()
 
         self._gui_manager = GuiManager(self)
@@ -23,10 +41,15 @@ class CellularAutomataWindow(pyglet.window.Window):
         self._current_mouse_grid_y = None
         self._current_mouse_grid_x = None
         self._current_mouse_x = None
-        self._brush = Neighbourhood.get_neighbourhood(Neighbourhood.ExMoore)
-
-        self._data_grid = None
-        self._visual_grid = None
+        # the brush as a mask of unique cells, strokes sweep it along the path of the mouse
+        self._brush = Brush.from_neighbourhood(Neighbourhood.ExMoore)
+        # cell the last stroke ended on and the generation it was painted in, None before the first stamp
+        self._stroke_end = None
+        self._stroke_generation = None
+        # state painted while the button is held
+        self._brush_state = True
+
+        self._renderer = None
         self.width = Settings.WINDOW_WIDTH
         self.height = Settings.WINDOW_HEIGHT
         self._grid_width = Settings.GRID_WIDTH
@@ -43,25 +66,50 @@ class CellularAutomataWindow(pyglet.window.Window):
         self._paused = False
         self._clear_screen_pressed = False
 
-        # modes
-        self._modes = {
-            Controls.CA_MODE        : modes.CellularAutomataMode(),
-            Controls.SAND_MODE      : modes.SandMode(),
-            Controls.EXPAND_MODE    : modes.ExpandMode(),
-            Controls.ZEBRA_MODE     : modes.ZebraMode(),
-            Controls.TRAIL_MODE    : modes.SmoothMode()
-        }
-        self._mode = self._modes[Controls.CA_MODE]
-        self._neighbourhood = self._mode._neighbourhood
+        # the window is a viewer over a headless simulation, which owns the grid and the modes
+        self._simulation = Simulation(self._grid_height, self._grid_width, mode=self.MODE_KEYS[Controls.CA_MODE])
+        # tiles treat the edges as dead, so wrapped grids are always stepped whole
+        if Settings.ACTIVE_TILES and self._simulation.boundary == 'fill':
+            self._simulation.enable_tiles()
+        self._neighbourhood = self._simulation.mode.neighbourhood()
+        # cell age, activity and velocity are tracked so they can be drawn instead of the cell states
+        if Settings.CELL_CHANNELS:
+            self._simulation.enable_channels()
+
+        # when replaying, frames come from the recording instead of the simulation
+        self._player = Player(replay_path) if replay_path else None
+        if self._player is not None:
+            self._player.seek(0)
+            self._player.apply(self._simulation)
+
+        # grids that settle into a still life or an oscillation are replayed instead of recomputed
+        self._cycle_events_shown = 0
+        if Settings.CYCLE_DETECTION and self._player is None:
+            self._simulation.enable_cycle_detection()
+
+        # the simulation steps on a worker thread unless replaying, the window draws the frames it publishes
+        self._worker = None
+        if Settings.BACKGROUND_SIMULATION and self._player is None:
+            self._worker = SimulationWorker(self._simulation)
+            self._frame = np.zeros((self._grid_height, self._grid_width), dtype=np.uint8)
+            self._frame_sequence = -1
+
+        # screenshots are rendered from the grid and encoded in the background, created on the first one
+        self._screenshots = None
+
+        # the simulation times its steps with the same profiler, so they nest inside the window stages
+        self._profiler = self._simulation.profiler
+
+        # the camera decides which cells are drawn and where, and which cell is under the mouse
+        self._camera = Camera((self._grid_height, self._grid_width),
+                              viewport=(Settings.WINDOW_MARGIN[dir.Left], Settings.WINDOW_MARGIN[dir.Bottom],
+                                        Settings.VISUAL_GRID_WIDTH, Settings.VISUAL_GRID_HEIGHT))
+        self._camera.zoom_to(min(Settings.CELL_WIDTH, self._camera.fit_zoom()))
 
         # grid
-        self.initialize_data_grid()
         self.initialize_visual_grid()
         self.velocity_map = {}
 
-        # array for tracking cells changed by click, used in updating visual grid
-        self._cells_changed_by_click = np.empty((0, 2), dtype=int)
-
         # current color values
         self._r = 0
         self._g = 0
@@ -81,6 +129,8 @@ class CellularAutomataWindow(pyglet.window.Window):
 
         #debug command display
         self._command_label = self._gui_manager.new_command_display(self._batch)
+        self._profiler_overlay = self._gui_manager.new_profiler_overlay(self._batch)
+        self._profiler_overlay.visible = self._profiler.enabled
         color_square_size = 10
         fg_label_x_pos = 25
         fg_square_x_pos = fg_label_x_pos + color_square_size
@@ -124,6 +174,8 @@ class CellularAutomataWindow(pyglet.window.Window):
         self._b = (self._b + self._db) % 255
         self._alive_color = (self._r, self._g, self._b, 255)
         self._fg_color_square.color = self._alive_color
+        self._renderer.set_alive_color(self._alive_color)
+        self.annotate_recording()
 
     def bg_color_to_inverse_fg(self):
         self._dead_color = (
@@ -133,84 +185,213 @@ class CellularAutomataWindow(pyglet.window.Window):
             255
         )
         self._bg_color_square.color = self._dead_color
+        self._renderer.set_dead_color(self._dead_color)
+        self.annotate_recording()
 
 
+    def start(self):
+        # with a worker the window only draws, at the visual frame rate
+        if self._worker is not None:
+            self._worker.start()
+            pyglet.clock.schedule_interval(self.update, interval=1 / Settings.VISUAL_FRAME_RATE)
+        else:
+            pyglet.clock.schedule_interval(self.update, interval=1 / Settings.SIMULATION_FRAME_RATE)
+
+    def on_simulation(self, function, *args):
+        # changes to the simulation run on the worker between two steps, or straight away without one
+        if self._worker is not None:
+            self._worker.submit(function, *args)
+        else:
+            function(*args)
+
     def update(self, dt):
-        self.update_data()
-        if self._clear_screen_pressed:
-            self.clear_screen()
-            self._clear_screen_pressed = False
-        if self._color_rotation_active:
-            self.rotate_to_next_color()
-            if self._inverse_background_color_active:
-                self.bg_color_to_inverse_fg()
-        self.update_visuals()
+        with self._profiler.stage('update'):
+            if self._worker is None:
+                with self._profiler.stage('update_data'):
+                    self.update_data()
+            if self._clear_screen_pressed:
+                self.clear_screen()
+                self._clear_screen_pressed = False
+            if self._color_rotation_active:
+                self.rotate_to_next_color()
+                if self._inverse_background_color_active:
+                    self.bg_color_to_inverse_fg()
+            with self._profiler.stage('update_visuals'):
+                self.update_visuals()
+        self._profiler.end_frame()
+        self.update_profiler_overlay()
+        self.update_cycle_display()
+
+    def update_cycle_display(self):
+        # cycles are found on the simulation thread, they are shown here
+        cycles = self._simulation.cycles
+        if cycles is None or len(cycles.events) == self._cycle_events_shown:
+            return
+        self._cycle_events_shown = len(cycles.events)
+        event = cycles.events[-1]
+        period = event['period']
+        if not event['confirmed']:
+            # too long to compare against the stored frames, it may be two grids that hash the same
+            self._command_label.text = f'POSSIBLE CYCLE OF PERIOD {period}'
+        else:
+            self._command_label.text = 'STEADY STATE' if period == 1 else f'CYCLE OF PERIOD {period}'
 
     def update_data(self):
         # update data grid every frame
-        self._data_grid = self._mode.update(self._data_grid)
-
-    def update_visuals(self):
-        changed_cells = np.unique(np.vstack([self._mode.changed_cells, self._cells_changed_by_click]), axis=0)
-
-        if changed_cells.size > 0:
-            # Update only the cells in the changed_cells set
-            for y, x in changed_cells:
-                self._visual_grid[y, x].color = self._alive_color if self._data_grid[y, x] else self._dead_color
+        if self._player is not None:
+            self.seek_replay(self._player.position + 1)
+        else:
+            self._simulation.step()
+
+    def seek_replay(self, frame):
+        frame = min(max(frame, 0), len(self._player) - 1)
+        self._player.seek(frame)
+        meta = self._player.apply(self._simulation)
+        if 'alive_color' in meta:
+            self._alive_color, self._dead_color = tuple(meta['alive_color']), tuple(meta['dead_color'])
+            self._fg_color_square.color = self._alive_color
+            self._bg_color_square.color = self._dead_color
+            self._renderer.set_colors(self._alive_color, self._dead_color)
+
+    def toggle_recording(self):
+        if self._simulation.recorder is not None:
+            self.on_simulation(self._simulation.stop_recording)
+            return False
+        os.makedirs(Settings.RECORDING_DIRECTORY, exist_ok=True)
+        now = datetime.now().strftime("%d%m%Y_%H-%M-%S")
+        self.annotate_recording()
+        self.on_simulation(self._simulation.start_recording,
+                           os.path.join(Settings.RECORDING_DIRECTORY, "recording_" + now + ".carec"))
+        return True
 
-        # Reset the click changes after updating
-        self._cells_changed_by_click = np.empty((0, 2), dtype=int)
+    def annotate_recording(self):
+        # colours are recorded with every generation, so replays look the same
+        self._simulation.annotations = {'alive_color': list(self._alive_color), 'dead_color': list(self._dead_color)}
 
-    def initialize_data_grid(self):
-        self._data_grid = np.random.randint(0, len(Settings.CELL_STATES),
-                                            size=(Settings.GRID_HEIGHT, Settings.GRID_WIDTH))
-        np.random.randint(0, 3)
-        for y in range(Settings.GRID_HEIGHT):
-            for x in range(Settings.GRID_WIDTH):
-                # set cell as alive if random float falls between 0 and INITIAL_LIFE_CHANCE
-                self._data_grid[y][x] = np.random.rand() < Settings.INITIAL_LIFE_CHANCE
+    def update_visuals(self):
+        # only the rows holding changes since the last frame are repainted through the palette and uploaded
+        self.sync_state_count()
+        if self._worker is not None:
+            # the newest published generation, the changed rows of any skipped ones are included
+            with self._profiler.stage('consume'):
+                self._frame_sequence, _, row_span = self._worker.ring.read_latest(self._frame, self._frame_sequence)
+            data_grid = self._frame
+        elif self._renderer.channel is not None:
+            # channels change wherever cells are alive or fading
+            row_span = None
+            data_grid = self._simulation.frame(self._renderer.channel)
+        else:
+            row_span = self._simulation.changes.row_span()
+            data_grid = self._simulation.data_grid
+
+        first_row, last_row = self._renderer.dirty_rows(row_span)
+        with self._profiler.stage('palette'):
+            self._renderer.fill(data_grid, first_row, last_row)
+        with self._profiler.stage('upload'):
+            self._renderer.upload()
+
+        # Reset the changes after updating, the worker resets its own when publishing
+        if self._worker is None:
+            self._simulation.changes.clear()
+
+    def next_channel(self):
+        # cycles through the cell states and every cell channel
+        channels = (None,) + CellChannels.Names
+        channel = channels[(channels.index(self._renderer.channel) + 1) % len(channels)]
+        self._renderer.set_channel(channel)
+        if self._worker is not None:
+            self._worker.submit(self._worker.set_channel, channel)
+        else:
+            self.update_visuals()
+        return channel
+
+    def sync_state_count(self):
+        # dying states of generations rules get their own colors
+        states = self._simulation.get_mode('ca').rule.states
+        if states != self._renderer.palette.states:
+            self._renderer.set_state_count(states)
+
+    def update_profiler_overlay(self):
+        # the text is only rebuilt every few frames, laying out a label costs more than the timers
+        if self._profiler.enabled and self._profiler.frame % Settings.PROFILER_OVERLAY_INTERVAL == 0:
+            self._profiler_overlay.text = self._profiler.summary_text()
+
+    def toggle_profiler(self):
+        self._profiler.toggle()
+        self._profiler_overlay.visible = self._profiler.enabled
+        if not self._profiler.enabled:
+            self._profiler_overlay.text = ''
+
+    def export_profile(self):
+        os.makedirs(Settings.PROFILE_DIRECTORY, exist_ok=True)
+        now = datetime.now().strftime("%d%m%Y_%H-%M-%S")
+        base_path = os.path.join(Settings.PROFILE_DIRECTORY, "profile_" + now)
+        self._profiler.export_csv(base_path + ".csv")
+        self._profiler.export_chrome_trace(base_path + ".json")
 
     def initialize_visual_grid(self):
-        self._visual_grid = np.empty((Settings.GRID_HEIGHT, Settings.GRID_WIDTH), dtype=object)
-
-        adjusted_y_values = np.arange(stop=Settings.VISUAL_GRID_HEIGHT + Settings.CELL_HEIGHT,
-                                      step=Settings.CELL_HEIGHT) + Settings.WINDOW_MARGIN[dir.Top]
-        adjusted_x_values = np.arange(stop=Settings.VISUAL_GRID_WIDTH + Settings.CELL_WIDTH, step=Settings.CELL_WIDTH) + \
-                            Settings.WINDOW_MARGIN[dir.Left]
-
-        for y in range(Settings.GRID_HEIGHT):
-            y_pos_in_window = adjusted_y_values[y]
-            for x in range(Settings.GRID_WIDTH):
-                x_pos_in_window = adjusted_x_values[x]
-                cell_state = self._data_grid[y, x]
-                color = self._alive_color if cell_state else self._dead_color
-                cell = pyglet.shapes.Rectangle(x=x_pos_in_window, y=y_pos_in_window,
-                                               width=Settings.CELL_WIDTH, height=Settings.CELL_HEIGHT,
-                                               color=color, batch=self._batch)
-                self._visual_grid[y][x] = cell
+        self._renderer = GridRenderer(self._camera, batch=self._batch)
+        self._renderer.set_colors(self._alive_color, self._dead_color)
+        self._renderer.draw_grid(self._simulation.data_grid)
 
     def on_draw(self):
-        self.clear()
-        self._batch.draw()
+        with self._profiler.stage('draw'):
+            self.clear()
+            self._batch.draw()
+
+    def on_close(self):
+        if self._worker is not None:
+            self._worker.stop()
+        # an open recording is only readable once its index is written, exports once their frames are
+        self._simulation.stop_recording()
+        self._simulation.stop_export()
+        if self._screenshots is not None:
+            self._screenshots.close()
+        super().on_close()
 
     def on_mouse_press(self, x, y, button, modifiers):
+        # the middle button pans the camera instead of painting
+        if button == mouse.MIDDLE:
+            return
         self.mouse_held = True
         self.update_cached_mouse_position(x, y)
+        self._stroke_end = None
 
         # Unschedule any existing task before scheduling a new one
         pyglet.clock.unschedule(self.apply_click_effect)
 
         # Determine the new cell state based on the button pressed
-        new_cell_state = button == mouse.LEFT
-        pyglet.clock.schedule_interval(self.apply_click_effect, 1 / Settings.SIMULATION_FRAME_RATE, new_cell_state)
+        self._brush_state = button == mouse.LEFT
+        self.apply_click_effect(0, self._brush_state)
+        # holding the button keeps painting, e.g. to pour sand
+        pyglet.clock.schedule_interval(self.apply_click_effect, 1 / Settings.SIMULATION_FRAME_RATE,
+                                       self._brush_state)
 
     def on_mouse_drag(self, x, y, dx, dy, buttons, modifiers):
+        if buttons & mouse.MIDDLE:
+            self._camera.pan(dx, dy)
+            self.camera_moved()
+        if self.mouse_held:
+            # the stroke is painted as the mouse moves, from where the last one ended
+            self.update_cached_mouse_position(x, y)
+            self.apply_click_effect(0, self._brush_state)
+
+    def on_mouse_scroll(self, x, y, scroll_x, scroll_y):
+        self._camera.zoom_at(x, y, Settings.CAMERA_ZOOM_STEP ** scroll_y)
+        self.camera_moved()
+
+    def camera_moved(self):
+        # the renderer redraws the new view on the next update, which does not come while paused
         if self.mouse_held:
-            if (abs(self._current_mouse_x - x) >= Settings.CELL_WIDTH or abs(
-                    self._current_mouse_y - y) >= Settings.CELL_HEIGHT):
-                self.update_cached_mouse_position(x, y)
+            # the cell under the mouse jumped, a stroke to it would cross cells the mouse never passed
+            self.update_cached_mouse_position(self._current_mouse_x, self._current_mouse_y)
+            self._stroke_end = None
+        if self._paused and self._worker is None:
+            self.update_visuals()
 
     def on_mouse_release(self, x, y, button, modifiers):
+        if button == mouse.MIDDLE:
+            return
         self.mouse_held = False
         pyglet.clock.unschedule(self.apply_click_effect)
 
@@ -219,17 +400,28 @@ class CellularAutomataWindow(pyglet.window.Window):
         self._current_mouse_grid_x, self._current_mouse_grid_y = self.mouse_to_grid_pos(x, y)
 
     def apply_click_effect(self, dt, new_cell_state):
-        for dx, dy in self._brush:
-            nx, ny = self._current_mouse_grid_x + dx, self._current_mouse_grid_y + dy
-            if self.in_grid(nx, ny):
-                self._data_grid[ny][nx] = new_cell_state
-                self._cells_changed_by_click = np.vstack([self._cells_changed_by_click, [ny, nx]])
+        with self._profiler.stage('brush'):
+            self.paint_brush(new_cell_state)
 
-        if self._paused:
+        # the window keeps drawing while a worker is paused
+        if self._paused and self._worker is None:
             self.update_visuals()
 
+    def paint_brush(self, new_cell_state):
+        end = (self._current_mouse_grid_x, self._current_mouse_grid_y)
+        start = end if self._stroke_end is None else self._stroke_end
+
+        # stamping the same cells again before the simulation stepped changes nothing
+        generation = self._simulation.generation
+        if start == end == self._stroke_end and generation == self._stroke_generation:
+            return
+        self._stroke_end, self._stroke_generation = end, generation
+
+        # the simulation marks the painted cells as changed and wakes the tiles under the brush
+        self.on_simulation(self._simulation.paint_stroke, self._brush, *start, *end, new_cell_state)
+
     def in_grid(self, x, y):
-        return 0 <= x < self._grid_width and 0 <= y < self._grid_height
+        return self._simulation.in_grid(x, y)
 
     def on_key_press(self, symbol, modifiers):
 
@@ -251,8 +443,19 @@ class CellularAutomataWindow(pyglet.window.Window):
             # cellular automata mode only
             case Controls.NEXT_PRESET:
                 command_description = 'P - NEXT CELLULAR AUTOMATA PRESET'
-                if isinstance(self._mode, modes.CellularAutomataMode):
-                    self._mode.next_preset()
+                if isinstance(self._simulation.mode, modes.CellularAutomataMode):
+                    self.on_simulation(self._simulation.mode.next_preset)
+
+            case Controls.HASHLIFE_JUMP:
+                command_description = f'JUMP 2^{Settings.HASHLIFE_JUMP_EXPONENT} GENERATIONS'
+                if isinstance(self._simulation.mode, modes.CellularAutomataMode):
+                    if self._simulation.mode.rule.states > 2:
+                        command_description += ' (NOT SUPPORTED BY PRESET)'
+                    elif self._simulation.boundary == 'wrap':
+                        command_description += ' (NOT SUPPORTED WITH WRAPPED EDGES)'
+                    else:
+                        self.on_simulation(self._simulation.jump)
+                    self.update_visuals()
 
             # all modes
             case Controls.CLEAR_SCREEN:
@@ -261,6 +464,32 @@ class CellularAutomataWindow(pyglet.window.Window):
             case Controls.SCREENSHOT:
                 command_description = 'SCREENSHOT'
                 self.save_screenshot()
+            case Controls.TOGGLE_EXPORT:
+                command_description = 'EXPORT GIF (ON)' if self.toggle_export() else 'EXPORT GIF (OFF)'
+            case Controls.TOGGLE_PROFILER:
+                command_description = 'TOGGLE PROFILER'
+                self.toggle_profiler()
+            case Controls.EXPORT_PROFILE:
+                command_description = 'EXPORT PROFILE'
+                self.export_profile()
+            case Controls.TOGGLE_RECORDING:
+                command_description = 'RECORDING (ON)' if self.toggle_recording() else 'RECORDING (OFF)'
+            case Controls.RESET_CAMERA:
+                command_description = 'RESET CAMERA'
+                self._camera.fit()
+                self.camera_moved()
+            case Controls.NEXT_CHANNEL:
+                if Settings.CELL_CHANNELS:
+                    channel = self.next_channel()
+                    command_description = 'VIEW ' + ('CELL STATES' if channel is None else 'CELL ' + channel.upper())
+
+            # replay only
+            case Controls.REPLAY_BACK | Controls.REPLAY_FORWARD:
+                if self._player is not None:
+                    step = Settings.REPLAY_SEEK_STEP if symbol == Controls.REPLAY_FORWARD else -Settings.REPLAY_SEEK_STEP
+                    self.seek_replay(self._player.position + step)
+                    command_description = f'SEEK TO GENERATION {self._simulation.generation}'
+                    self.update_visuals()
             case Controls.TOGGLE_PAUSE:
                 if not self._paused:
                     self.pause()
@@ -311,7 +540,9 @@ class CellularAutomataWindow(pyglet.window.Window):
 
         # if the button pressed was a mode button, check if we should apply only one frame, or 
         if mode_button_pressed:
-            if mod_key_held:
+            if self._simulation.boundary == 'wrap' and not self._simulation.get_mode(self.MODE_KEYS[symbol]).local:
+                command_description += ' (NOT SUPPORTED WITH WRAPPED EDGES)'
+            elif mod_key_held:
                 # modify description if ctrl is held
                 command_description = pyglet.window.key.symbol_string(Controls.MOD_KEY) + command_description + ' (ONE FRAME)'
                 self.apply_one_frame_from_mode(symbol)
@@ -321,56 +552,83 @@ class CellularAutomataWindow(pyglet.window.Window):
         self._command_label.text = command_description
 
 
-    @staticmethod
-    def save_screenshot():
+    def save_screenshot(self):
+        # the whole grid as drawn, without reading the window back, the PNG is encoded off this thread
+        if self._screenshots is None:
+            writer = export.PngWriter(os.path.join(Settings.SCREENSHOT_DIRECTORY, Settings.SCREENSHOT_NAME))
+            self._screenshots = export.FrameExporter(writer, palette=self._renderer.palette, workers=1)
+        self._screenshots.channel = self._renderer.channel
+        frame = self._frame if self._worker is not None else self._simulation.frame(self._renderer.channel)
+        self._screenshots.record(self._simulation.generation, frame)
+
+    def toggle_export(self):
+        # every generation goes to an animated GIF, encoded in the background while the simulation runs
+        if self._simulation.exporter is not None:
+            self.on_simulation(self._simulation.stop_export)
+            return False
+        os.makedirs(Settings.EXPORT_DIRECTORY, exist_ok=True)
         now = datetime.now().strftime("%d%m%Y_%H-%M-%S")
-        image_path = Settings.SCREENSHOT_DIRECTORY + "screenshot_" + now + ".png"
-        pyglet.image.get_buffer_manager().get_color_buffer().save(image_path)
+        image_shape = (self._grid_height * Settings.EXPORT_SCALE, self._grid_width * Settings.EXPORT_SCALE)
+        writer = export.GifWriter(os.path.join(Settings.EXPORT_DIRECTORY, "export_" + now + ".gif"), image_shape)
+        exporter = export.FrameExporter(writer, palette=self._renderer.palette, channel=self._renderer.channel)
+        self.on_simulation(self._simulation.start_export, exporter)
+        return True
 
     def advance_one_frame(self):
         if self._color_rotation_active:
             self.rotate_to_next_color()
-        self.update(0)
+        if self._worker is not None:
+            self._worker.submit(self._simulation.step)
+        else:
+            self.update(0)
 
     def apply_smoothing(self):
         # applying trail mode for a single frame has a smoothing effect
         self.apply_one_frame_from_mode(Controls.TRAIL_MODE)
 
     def apply_one_frame_from_mode(self, mode_key):
+        if self._worker is not None:
+            self._worker.submit(self._simulation.step_with_mode, self.MODE_KEYS[mode_key])
+            return
+
         # cache mode to switch back after update
-        cached_mode = self._mode
+        cached_mode = self._simulation.mode_name
 
-        # switch to trail mode and update one frame
-        self._mode = self._modes[mode_key]
+        # switch to the given mode and update one frame
+        self._simulation.change_mode(self.MODE_KEYS[mode_key])
         self.update(0)
 
         # switch back to original mode
-        self._mode = cached_mode
+        self._simulation.change_mode(cached_mode)
 
     def change_mode(self, mode_key):
-        self._mode = self._modes[mode_key]
+        self.on_simulation(self._simulation.change_mode, self.MODE_KEYS[mode_key])
 
     def clear_screen(self):
-        self._data_grid = np.zeros_like(self._data_grid, dtype=bool)
-        self._mode.changed_cells = np.argwhere(self._data_grid == False)
+        self.on_simulation(self._simulation.clear)
 
     def pause(self):
         self.running = False
-        pyglet.clock.unschedule(self.update)
         self._paused = True
+        if self._worker is not None:
+            self._worker.paused = True
+        else:
+            pyglet.clock.unschedule(self.update)
 
     def resume(self):
         self.running = True
-        pyglet.clock.schedule(self.update)
         self._paused = False
+        if self._worker is not None:
+            self._worker.paused = False
+        else:
+            pyglet.clock.schedule(self.update)
 
     def mouse_to_grid_pos(self, mouse_x, mouse_y):
-        grid_x = (mouse_x - Settings.WINDOW_MARGIN[dir.Left]) // Settings.CELL_WIDTH
-        grid_y = (mouse_y - Settings.WINDOW_MARGIN[dir.Top]) // Settings.CELL_HEIGHT
-        return grid_x, grid_y
+        return self._camera.screen_to_grid(mouse_x, mouse_y)
 
 
 if __name__ == '__main__':
-    window = CellularAutomataWindow()
-    pyglet.clock.schedule_interval(window.update, interval=1 / Settings.SIMULATION_FRAME_RATE)
+    # an optional recording to replay instead of simulating
+    window = CellularAutomataWindow(sys.argv[1] if len(sys.argv) > 1 else None)
+    window.start()
     pyglet.app.run()
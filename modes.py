@@ -1,29 +1,125 @@
 from neighbourhoods import Neighbourhood
 from abc import ABC, abstractmethod
 import numpy as np
-from scipy.signal import convolve2d
 from config.settings import Settings
+from bitlife import BitPackedLife
+from rules import Rule
+from kernels import compile_kernel, count_neighbours
 
 
 # superclass ABC = AbstractBaseClass
 class Mode(ABC):
+    # steps a tile has to stay unchanged before it is put to sleep
+    settle_steps = 1
+    # local modes only look radius cells away, so any band or tile of a grid can be stepped on its own
+    local = True
+    # modes that count neighbours with their kernel and keep the cells counting more than this,
+    # and at most neighbour_limit when it is set
+    neighbour_threshold = None
+    neighbour_limit = None
+    # per cell velocities of modes that move cells, see channels.CellChannels
+    velocities = None
+    # cells hold states 0 to states - 1
+    states = 2
 
     def __init__(self, neighbourhood):
-        self._neighbourhood = Neighbourhood.get_neighbourhood(neighbourhood)
-        self.changed_cells = np.empty((0, 2), dtype=int)
+        # the offsets of the neighbourhood, each once
+        self._neighbourhood = Neighbourhood.get_offsets(neighbourhood)
+        self._kernel = None
+
+        # optional changes.ChangeMask, every step ORs the cells it changed into it
+        self.changes = None
+
+        # optional tiles.TileTracker, when set only tiles near a change are recomputed
+        self.tiles = None
+
+        # optional buffers.GridBuffers, when set the whole grid is stepped into its preallocated back buffer
+        self.buffers = None
 
     def neighbourhood(self):
         return self._neighbourhood
 
-    @abstractmethod
+    @property
+    def radius(self):
+        # how many cells away the rules of a mode look, used to size the halo around tiles
+        return max(self._kernel.shape) // 2
+
     def update(self, current_data_grid):
-        return current_data_grid
+        if self.tiles is None:
+            new_data_grid = self.step_grid(current_data_grid)
+        else:
+            new_data_grid = self.tiles.step(current_data_grid, self.step_grid, self.radius)
+        return self.record_update(current_data_grid, new_data_grid)
+
+    def step_grid(self, grid):
+        # the grid held by the buffers is stepped without allocating, tiles and bands of it step as usual
+        if self.buffers is not None and grid is self.buffers.grid:
+            return self.step_buffered(self.buffers)
+        return self.step(grid)
+
+    def step_buffered(self, buffers):
+        # writes the next generation of buffers.grid into buffers.next_grid and returns it
+        if self.neighbour_threshold is None:
+            np.copyto(buffers.next_grid, self.step(buffers.grid), casting='unsafe')
+            return buffers.next_grid
+
+        buffers.refresh_halo()
+        # grid values are counted as they are, up to 255 each
+        neighbor_count = self.count_buffered(buffers, buffers.padded, 0xFF)
+        np.greater(neighbor_count, self.neighbour_threshold, out=buffers.next_grid)
+        if self.neighbour_limit is not None:
+            below = buffers.scratch('below', np.uint8)
+            np.less_equal(neighbor_count, self.neighbour_limit, out=below)
+            np.bitwise_and(buffers.next_grid, below, out=buffers.next_grid)
+        return buffers.next_grid
+
+    def count_buffered(self, buffers, padded, max_value):
+        # neighbours of the cells inside the border of padded, into a reused array when the kernel fits the border
+        compiled = compile_kernel(self._kernel)
+        if buffers.fits(compiled):
+            return buffers.count(padded, compiled, max_value)
+
+        # bigger kernels are counted by an allocating strategy, on the wrapped border when it reaches far enough
+        halo = buffers.halo
+        grid = padded[halo:halo + buffers.shape[0], halo:halo + buffers.shape[1]]
+        if buffers.boundary == "wrap" and buffers.covers(compiled):
+            return self.count_neighbours(padded)[halo:halo + buffers.shape[0], halo:halo + buffers.shape[1]]
+        if buffers.boundary == "wrap":
+            reach = max(compiled.height, compiled.width)
+            wrapped = np.pad(grid, reach, mode='wrap')
+            return self.count_neighbours(wrapped)[reach:-reach, reach:-reach]
+        return self.count_neighbours(grid)
+
+    def record_update(self, current_data_grid, new_data_grid):
+        # track the cells changed by a step, however the step was computed
+        if self.changes is not None:
+            changed = self.changes.record_step(current_data_grid, new_data_grid)
+        elif self.tiles is not None:
+            changed = new_data_grid != current_data_grid
+        else:
+            return new_data_grid
+
+        if self.tiles is not None:
+            self.tiles.record_changes(changed, self.radius, self.settle_steps)
 
-    def reset_changed_cells(self):
-        self.changed_cells = np.empty((0, 2), dtype=int)
+        return new_data_grid
+
+    def __getstate__(self):
+        # modes are shipped to worker processes without their per frame change tracking
+        state = self.__dict__.copy()
+        state['changes'] = None
+        state['tiles'] = None
+        state['buffers'] = None
+        return state
+
+    def count_neighbours(self, grid):
+        # neighbours counted by the strategy autotuned for this mode, grid shape and kernel
+        return count_neighbours(grid, self._kernel, mode=type(self).__name__)
 
-    def add_to_changed_cells(self, new_changes):
-        self.changed_cells = np.unique(np.vstack([self.changed_cells, new_changes]), axis=0)
+    @abstractmethod
+    def step(self, current_data_grid):
+        # apply the rules of the mode once, without side effects, so any part of a grid can be stepped
+        return current_data_grid
 
     @property
     def get_neighbourhood(self):
@@ -31,29 +127,215 @@ class Mode(ABC):
 
 
 class SandMode(Mode):
+    # "rows" moves every particle of a row at once with array operations,
+    # "particle" walks each particle through the grid one at a time,
+    # "auto" picks one every step, rows pay a fixed cost per occupied row so they only win on crowded rows
+    Kernels = ("auto", "rows", "particle")
 
-    def __init__(self):
+    # a particle stopped by a fast landing only starts falling again on the step after
+    settle_steps = 2
+    # particles fall through rows that were already moved this step
+    local = False
+
+    def __init__(self, grid_shape=Settings.GRID_SIZE, kernel="auto"):
         super().__init__(Neighbourhood.ExMoore)
-        self.height, self.width = Settings.GRID_HEIGHT, Settings.GRID_WIDTH
-        self._y_vel_map = np.zeros((self.height, self.width), dtype=int)
+        self.height, self.width = grid_shape
+        # velocities only range from SAND_MAX_Y_VEL to 0, a byte per cell holds them
+        # a step writes the next map into the second one, then the two are swapped
+        self._y_vel_map = np.zeros((self.height, self.width), dtype=np.int8)
+        self._next_y_vel_map = np.zeros_like(self._y_vel_map)
         self.random_directions = np.random.choice(a=[1, -1], size=self.height)
         self.rand_idx = 0
         self.max_rand_idx = self.height - 1
         self.gravity = Settings.SAND_GRAVITY
+        if kernel not in self.Kernels:
+            raise ValueError(f"unknown kernel '{kernel}', expected one of {self.Kernels}")
+        self.kernel = kernel
+
+    @property
+    def radius(self):
+        # a particle can fall this many rows in one step
+        return abs(Settings.SAND_MAX_Y_VEL) + self.gravity
+
+    @property
+    def velocities(self):
+        return self._y_vel_map
 
     def update(self, current_grid):
-        new_data_grid = np.zeros_like(current_grid)
-        new_y_vel_map = np.zeros_like(self._y_vel_map)
+        # the grid held by the buffers is stepped into their back buffer, seen as booleans
+        buffered = self.buffers is not None and current_grid is self.buffers.grid
+        occupied = np.not_equal(current_grid, 0, out=self._grid_array('sand_occupied', bool))
+        new_data_grid = self.buffers.next_grid.view(bool) if buffered else np.zeros_like(occupied)
+
+        kernel = self.kernel
+        pinned = False
+        if kernel == "auto":
+            # rows pay a fixed cost for every row with loose particles and every fall step of its fastest one,
+            # particles pay for every particle, pinned or not
+            self._pinned(occupied, new_data_grid)
+            pinned = True
+            loose = np.greater(occupied, new_data_grid, out=self._grid_array('sand_loose', bool))
+            speeds = np.abs(self._y_vel_map, out=self._grid_array('sand_speeds', np.int8))
+            np.add(speeds, self.gravity, out=speeds, casting='unsafe')
+            np.multiply(speeds, loose, out=speeds)
+            row_steps = int(speeds.max(axis=1).sum())
+            crowded = np.count_nonzero(occupied) >= Settings.SAND_ROWS_MIN_PARTICLES_PER_ROW_STEP * row_steps
+            kernel = "rows" if crowded else "particle"
+
+        if kernel == "rows":
+            self.update_rows(occupied, new_data_grid, pinned)
+        else:
+            self.update_per_particle(current_grid, new_data_grid)
+
+        if buffered:
+            new_data_grid = self.buffers.next_grid
+        return self.record_update(current_grid, new_data_grid)
+
+    def _grid_array(self, name, dtype):
+        # grid sized working arrays are reused from the buffers, without them they are allocated every step
+        if self.buffers is not None and self.buffers.shape == (self.height, self.width):
+            return self.buffers.scratch(name, dtype)
+        return np.zeros((self.height, self.width), dtype=dtype)
+
+    def _swap_y_vel_maps(self):
+        self._y_vel_map, self._next_y_vel_map = self._next_y_vel_map, self._y_vel_map
+
+    def step(self, current_data_grid):
+        # sand carries velocities from step to step, so it can only be stepped as a whole
+        return self.update(current_data_grid)
+
+    def update_rows(self, occupied, new_data_grid, pinned=False):
+        # occupied marks the particles of the current grid, the next one is written into new_data_grid
+
+        # particles resting on a pile that cannot move are placed straight away, unless they already are
+        if not pinned:
+            self._pinned(occupied, new_data_grid)
+        new_y_vel_map = self._next_y_vel_map
+        new_y_vel_map.fill(0)
+        new_y_vel_map[0] = np.where(new_data_grid[0], np.maximum(self._y_vel_map[0] - self.gravity,
+                                                                 Settings.SAND_MAX_Y_VEL), 0)
+
+        # so are particles in sleeping tiles, which have not moved and have nothing moving near them
+        if self.tiles is not None:
+            self.tiles.count_step()
+            sleeping = np.greater(occupied, self.tiles.active_cells(), out=self._grid_array('sand_sleeping', bool))
+            np.greater(sleeping, new_data_grid, out=sleeping)
+            new_data_grid |= sleeping
+            new_y_vel_map[sleeping] = self._y_vel_map[sleeping]
+        loose = np.greater(occupied, new_data_grid, out=self._grid_array('sand_loose', bool))
+
+        # rows are settled from the bottom up, so every row falls through the rows already placed below it
+        for y in np.flatnonzero(loose.any(axis=1)):
+            start_x = np.flatnonzero(loose[y])
+            new_x = start_x.copy()
+            new_y = np.full(start_x.size, y)
+
+            velocity = self._y_vel_map[y, start_x] - self.gravity  # Apply gravity
+            step = np.zeros_like(velocity)
+            moving = step < np.abs(velocity)
+
+            # all particles of a row that are still moving are always in the same row
+            row = y
+            while row > 0 and moving.any():
+                idx = np.flatnonzero(moving)
+                x = new_x[idx]
+                below = new_data_grid[row - 1].copy()
+
+                can_move_down = ~below[x]
+                # Check diagonal movements
+                diagonal = ((x == start_x[idx]) & (velocity[idx] < -2)) | ~can_move_down
+
+                # straight moves never compete with each other, they claim their cells first
+                down = idx[~diagonal]
+                below[new_x[down]] = True
+                step[down] += 1
+
+                # most falling particles go straight down, the diagonal pass only runs for the ones that do not
+                if diagonal.any():
+                    direction = self._diagonal_directions(idx[diagonal], new_x, below, y)
+                    sliding = idx[diagonal][direction != 0]
+                    blocked = idx[diagonal][direction == 0]
+                    new_x[sliding] += direction[direction != 0]
+                    step[sliding] += 2
+
+                    velocity[blocked] = 0
+                    moving[blocked] = False
+                else:
+                    sliding = idx[:0]
+
+                row -= 1
+                new_y[down] = row
+                new_y[sliding] = row
+                moving &= step < np.abs(velocity)
+
+            # Update new grid and velocity map
+            new_data_grid[new_y, new_x] = True
+            new_y_vel_map[new_y, new_x] = np.maximum(velocity, Settings.SAND_MAX_Y_VEL)
+
+        np.random.shuffle(self.random_directions)
+        self._swap_y_vel_maps()
+        return new_data_grid
+
+    def _pinned(self, occupied, pinned):
+        # marks a particle in pinned when the cells below it and diagonally below it hold pinned particles
+        pinned.fill(False)
+        pinned[0] = occupied[0]
+        for y in range(1, self.height):
+            # nothing rests on a row without pinned particles, so every row above it is loose
+            if not pinned[y - 1].any():
+                break
+            support = pinned[y - 1].copy()
+            support[1:] &= pinned[y - 1, :-1]
+            support[:-1] &= pinned[y - 1, 1:]
+            pinned[y] = occupied[y] & support
+        return pinned
+
+    def _diagonal_directions(self, idx, new_x, below, y):
+        # returns -1, 1, or 0 (no free diagonal) for each particle, and marks the chosen cells in below
+        x = new_x[idx]
+        can_move_left = (x > 0) & ~below[np.maximum(x - 1, 0)]
+        can_move_right = (x < self.width - 1) & ~below[np.minimum(x + 1, self.width - 1)]
+
+        random_direction = self.random_directions[(y + self.rand_idx + np.arange(idx.size)) % self.height]
+        self.rand_idx += idx.size
+
+        direction = np.where(can_move_left & can_move_right, random_direction,
+                             np.where(can_move_left, -1, np.where(can_move_right, 1, 0)))
+
+        # two particles can only compete for a cell from opposite sides, a coin flip per cell picks the winner
+        targets = x + direction
+        claims = np.bincount(targets[direction != 0], minlength=self.width)
+        contested = (direction != 0) & (claims[targets] > 1)
+        if contested.any():
+            right_wins = np.random.rand(self.width) < 0.5
+            losers = np.flatnonzero(contested & ((direction == 1) != right_wins[targets]))
+
+            # losers try the other side once, if it is free and nobody else wants it
+            other = x[losers] - direction[losers]
+            free = (other >= 0) & (other < self.width)
+            free[free] = ~below[other[free]] & (claims[other[free]] == 0)
+            free[free] = np.bincount(other[free], minlength=self.width)[other[free]] == 1
+            direction[losers] = np.where(free, -direction[losers], 0)
+
+        moved = direction != 0
+        below[x[moved] + direction[moved]] = True
+
+        return direction
+
+    def update_per_particle(self, current_grid, new_data_grid):
+        new_data_grid.fill(False)
+        new_y_vel_map = self._next_y_vel_map
+        new_y_vel_map.fill(0)
 
         # Use vectorized operations to find living cells
         # allows us to speed up processing by only checking cells with sand in them
-        living_cells = np.argwhere(current_grid)
+        ys, xs = np.nonzero(current_grid)
 
         # Sort living cells in zigzag order based on their x-coordinates
         # This removes the directional bias introduced by checking side-to-side
-        living_cells = sorted(living_cells, key=lambda cell: (cell[0], cell[1] if cell[1] % 2 == 0 else -cell[1]))
+        order = np.lexsort((np.where(xs % 2 == 0, xs, -xs), ys))
 
-        for y, x in living_cells:
+        for y, x in zip(ys[order].tolist(), xs[order].tolist()):
             new_y, new_x = y, x  # Initialize new position as old position
 
             velocity = self._y_vel_map[y, x] - self.gravity  # Apply gravity
@@ -67,7 +349,7 @@ class SandMode(Mode):
                 else:
                     if (new_x == x and velocity < -2) or not can_move_down:  # Check diagonal movements
                         can_move_left = new_x > 0 and new_y > 0 and not new_data_grid[new_y - 1, new_x - 1]
-                        can_move_right = new_x < Settings.GRID_WIDTH - 1 and new_y > 0 and not new_data_grid[
+                        can_move_right = new_x < self.width - 1 and new_y > 0 and not new_data_grid[
                             new_y - 1, new_x + 1]
 
                         if can_move_left and can_move_right:
@@ -95,8 +377,7 @@ class SandMode(Mode):
             new_y_vel_map[new_y, new_x] = max(velocity, Settings.SAND_MAX_Y_VEL)
 
         np.random.shuffle(self.random_directions)
-        self.changed_cells = np.argwhere(current_grid != new_data_grid)
-        self._y_vel_map = new_y_vel_map
+        self._swap_y_vel_maps()
         return new_data_grid
 
 
@@ -104,21 +385,18 @@ class ZebraMode(Mode):
 
     def __init__(self):
         super().__init__(Neighbourhood.ExVon)
-        self.neighbour_threshold = 4
-
-    def update(self, current_data_grid):
-        # Define a 3x3 kernel for Moore neighborhood
-        kernel = self._neighbourhood
+        # 45 cells count, a band of counts instead of a threshold is what draws the stripes,
+        # crowded cells die like lonely ones so stripes stay thin and keep moving
+        self.neighbour_threshold = 9
+        self.neighbour_limit = 20
+        self._kernel = Neighbourhood.get_kernel(Neighbourhood.ExVon)
 
+    def step(self, current_data_grid):
         # Apply convolution to count neighbors
-        neighbor_count = convolve2d(current_data_grid, kernel, mode='same', boundary='fill', fillvalue=0)
+        neighbor_count = self.count_neighbours(current_data_grid)
 
         # Update the grid based on neighbor count
-        new_data_grid = (neighbor_count > self.neighbour_threshold)
-
-        self.changed_cells = np.argwhere(current_data_grid != new_data_grid)
-
-        return new_data_grid
+        return (neighbor_count > self.neighbour_threshold) & (neighbor_count <= self.neighbour_limit)
 
 
 class ExpandMode(Mode):
@@ -133,65 +411,130 @@ class ExpandMode(Mode):
             [1, 0, 1, 0, 1],
             [1, 1, 1, 1, 1]])
 
-    def update(self, current_data_grid):
+    def step(self, current_data_grid):
         # Apply convolution to count neighbors
-        neighbor_count = convolve2d(current_data_grid, self._kernel, mode='same', boundary='fill', fillvalue=0)
+        neighbor_count = self.count_neighbours(current_data_grid)
 
         # Update the grid based on neighbor count
-        new_data_grid = (neighbor_count > self.neighbour_threshold)
-
-        self.changed_cells = np.argwhere(current_data_grid != new_data_grid)
-
-        return new_data_grid
+        return neighbor_count > self.neighbour_threshold
 
 
 class CellularAutomataMode(Mode):
     # dictionary to store preset values.
-    # "preset name" : (overcrowding_limit, underpopulation_limit, reproduction_requirement) 
+    # "preset name" : rulestring in B/S notation, with /C for multi state "Generations" rules
+    # (underpopulation_limit, overpopulation_limit, reproduction_requirement) triples and Rule objects also work
     Presets = {
-        "Game of Life": (2, 3, 3),
-        "Draw": (2, 6, 4),
-        "Mold": (2, 4, 3),
-        "Berghain": (2, 3, 0),
-        "Berghain2": (1, 3, 1),
+        "Game of Life": "B3/S23",
+        "Draw": "B4/S23456",
+        "Mold": "B3/S234",
+        "Berghain": "B0/S23",
+        "Berghain2": "B1/S123",
+        "Brian's Brain": "B2/S/C3",
+        "Star Wars": "B2/S345/C4",
 
     }
 
-    def __init__(self):
+    # "convolve" counts neighbours with a 3x3 convolution, "bitpacked" stores 64 cells per word
+    Backends = ("convolve", "bitpacked")
+
+    def __init__(self, backend="convolve"):
         super().__init__(Neighbourhood.Moore)
+        self._rule = None
+        self._bit_engine = None
+        # the grid of the buffers packed 64 cells to a word, valid while their version is _words_version
+        self._words = None
+        self._words_version = None
+        # name of the loaded preset, None for rules loaded directly
+        self.preset_name = None
+        self.set_backend(backend)
         self._current_preset_index = -1
         self.next_preset()
-        self._kernel = np.array([[1, 1, 1],
-                                 [1, 0, 1],
-                                 [1, 1, 1]])
+        self._kernel = Neighbourhood.get_kernel(Neighbourhood.Moore)
 
-    def update(self, current_data_grid):
+    def set_backend(self, backend):
+        if backend not in self.Backends:
+            raise ValueError(f"unknown backend '{backend}', expected one of {self.Backends}")
+        self._backend = backend
 
-        # Apply convolution to count neighbors
-        neighbor_count = convolve2d(current_data_grid.astype(int), self._kernel, mode='same', boundary='fill',
-                                    fillvalue=0)
-
-        # Apply rules
-        born = (neighbor_count == self._reproduction_requirement) & ~current_data_grid
-
-        survive = ((neighbor_count >= self._underpopulation_limit) &
-                   (neighbor_count <= self._overpopulation_limit) &
-                   current_data_grid)
+    @property
+    def backend(self):
+        return self._backend
 
-        # Update grid based on rules
-        new_grid = np.where(born | survive, 1, 0)
+    @property
+    def rule(self):
+        return self._rule
 
-        # Find changed cells
-        self.changed_cells = np.argwhere(new_grid != current_data_grid)
+    @property
+    def states(self):
+        return self._rule.states
 
-        return new_grid
+    @property
+    def bit_engine(self):
+        # the engine stepping 64 cells to a word, None unless the backend and the rule use bit planes
+        return self._bit_engine if self._backend == "bitpacked" else None
+
+    def step(self, current_data_grid):
+        # bit planes only hold two states, generations rules always use the lookup table
+        if self.bit_engine is not None:
+            return self.bit_engine.step(current_data_grid)
+
+        states = current_data_grid.view(np.uint8) if current_data_grid.dtype == bool else current_data_grid
+
+        # Apply convolution to count live neighbors, dying cells do not count
+        neighbor_count = self.count_neighbours(states == 1)
+
+        # Apply rules, a single lookup of (state, neighbour count) per cell
+        return self._rule.apply(states, neighbor_count)
+
+    def step_buffered(self, buffers):
+        # bit planes have dead edges, wrapped grids use the lookup table too
+        if self.bit_engine is not None and buffers.boundary == "fill":
+            # the words stay packed from step to step, only the grid read by everything else is unpacked
+            width = buffers.shape[1]
+            words = self.bit_engine.step_packed(self.packed_grid(buffers), width)
+            np.copyto(buffers.next_grid, BitPackedLife.unpack(words, width))
+            # the simulation swaps the buffers to store the next grid, after which the words hold the front grid
+            self._words, self._words_version = words, buffers.version + 1
+            return buffers.next_grid
+
+        buffers.refresh_halo()
+        np.equal(buffers.padded, 1, out=buffers.alive)
+        neighbor_count = self.count_buffered(buffers, buffers.alive, 1)
+
+        # the lookup table flattened, cell value * 9 + neighbour count indexes it
+        index = buffers.index
+        np.multiply(buffers.grid, Rule.MAX_NEIGHBOURS + 1, out=index, dtype=index.dtype)
+        np.add(index, neighbor_count, out=index, casting='unsafe')
+        # np.take copies into a temporary unless out is contiguous, which the padded grid views are not
+        states = buffers.scratch('states', buffers.next_grid.dtype)
+        np.take(self._rule.table.ravel(), index, out=states, mode='clip')
+        np.copyto(buffers.next_grid, states)
+        return buffers.next_grid
+
+    def __getstate__(self):
+        # the packed words belong to the grid buffers, which are not shipped either
+        state = super().__getstate__()
+        state['_words'] = state['_words_version'] = None
+        return state
+
+    def packed_grid(self, buffers):
+        # the front grid of the buffers as words, packed again only when it changed since the last step
+        if self._words_version != buffers.version:
+            self._words = BitPackedLife.pack(buffers.grid == 1)
+            self._words_version = buffers.version
+        return self._words
+
+    def load_rule(self, rule):
+        self._rule = Rule.parse(rule)
+        self._bit_engine = BitPackedLife(self._rule.birth, self._rule.survival) if self._rule.states == 2 else None
+        self.preset_name = None
 
     def load_preset(self, preset_name):
         if preset_name not in self.Presets:
             preset_name = "Game of Life"
 
-        self._underpopulation_limit, self._overpopulation_limit, self._reproduction_requirement = self.Presets.get(
-            preset_name)
+        self.load_rule(self.Presets.get(preset_name))
+        self.preset_name = preset_name
 
     def next_preset(self):
         if self._current_preset_index >= len(list(self.Presets.keys())) or self._current_preset_index < 0:
@@ -213,7 +556,7 @@ class CellularAutomataMode(Mode):
             unique_name = f"{name}{i}"
             i += 1
 
-        self.Presets[name] = (self._underpopulation_limit, self._overpopulation_limit, self._reproduction_requirement)
+        self.Presets[unique_name] = self._rule
 
 
 class SmoothMode(Mode):
@@ -221,18 +564,11 @@ class SmoothMode(Mode):
     def __init__(self):
         super().__init__(Neighbourhood.Moore)
         self.neighbour_threshold = 5
-        self._kernel = np.array([
-            [1, 1, 1],
-            [1, 0, 1],
-            [1, 1, 1]])
+        self._kernel = Neighbourhood.get_kernel(Neighbourhood.Moore)
 
-    def update(self, current_data_grid):
+    def step(self, current_data_grid):
         # Apply convolution to count neighbors
-        neighbor_count = convolve2d(current_data_grid, self._kernel, mode='same', boundary='fill', fillvalue=0)
+        neighbor_count = self.count_neighbours(current_data_grid)
 
         # Update the grid based on neighbor count
-        new_data_grid = (neighbor_count > self.neighbour_threshold)
-
-        self.changed_cells = np.argwhere(current_data_grid != new_data_grid)
-
-        return new_data_grid
+        return neighbor_count > self.neighbour_threshold
@@ -51,6 +51,30 @@ class Neighbourhood:
 
         return result
 
+    @staticmethod
+    def get_offsets(nb):
+        # the neighbourhood without duplicate offsets
+        return Neighbourhood.compile(nb)[0]
+
+    @staticmethod
+    def get_kernel(nb):
+        # dense convolution kernel counting each offset once
+        return Neighbourhood.compile(nb)[1]
+
+    @staticmethod
+    def compile(nb):
+        key = (nb['name'], nb['range'], nb['shape'].tobytes())
+        if key not in Neighbourhood._neighbourhood_cache:
+            offsets = np.unique(Neighbourhood.get_neighbourhood(nb), axis=0)
+
+            # offsets are (dx, dy), convolution flips the kernel so kernel[r - dy, r - dx] reads offset (dx, dy)
+            radius = int(np.abs(offsets).max())
+            kernel = np.zeros((2 * radius + 1, 2 * radius + 1), dtype=int)
+            kernel[radius - offsets[:, 1], radius - offsets[:, 0]] = 1
+
+            Neighbourhood._neighbourhood_cache[key] = (offsets, kernel)
+        return Neighbourhood._neighbourhood_cache[key]
+
     @staticmethod
     def scale_neighbourhood(nb_shape, nb_scale):
         scaled_shape = []
@@ -0,0 +1,163 @@
+import json
+import os
+import numpy as np
+from bitlife import BitPackedLife
+from config.settings import Settings
+import initializers
+import modes
+
+# set bits of every byte value
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+class MappedGrid:
+    # a two state grid bit packed into a memory mapped file, laid out like BitPackedLife words:
+    # one row after the other, cell x of a row in bit x % 64 of little endian word x // 64
+
+    def __init__(self, path, height, width, create=False):
+        self.path = path
+        self.height = height
+        self.width = width
+        self.words_per_row = -(-width // BitPackedLife.WORD_BITS)
+        self.words = np.memmap(path, dtype='<u8', mode='w+' if create else 'r+', shape=(height, self.words_per_row))
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    def read_words(self, y0, y1):
+        return np.array(self.words[y0:y1], dtype=np.uint64)
+
+    def write_words(self, y0, words):
+        self.words[y0:y0 + len(words)] = words
+
+    def read_rows(self, y0, y1):
+        return BitPackedLife.unpack(self.read_words(y0, y1), self.width)
+
+    def write_rows(self, y0, grid):
+        self.write_words(y0, BitPackedLife.pack(grid.astype(bool, copy=False)))
+
+    def flush(self):
+        self.words.flush()
+
+    def close(self):
+        self.flush()
+        # the map is released with the last reference to it
+        self.words = None
+
+
+class OutOfCoreWorld:
+    # a world larger than memory, stepped one band of rows at a time from one mapped grid into another
+    # only the band being stepped, its halo rows and the band of results are held in memory at once
+
+    FRONT_FILE = 'front.bin'
+    BACK_FILE = 'back.bin'
+    INFO_FILE = 'world.json'
+
+    def __init__(self, directory, band_rows=None):
+        self.directory = directory
+        with open(os.path.join(directory, self.INFO_FILE)) as file:
+            info = json.load(file)
+        self.height = info['height']
+        self.width = info['width']
+        self.generation = info['generation']
+        # bands are sized by cell count, so wide worlds step fewer rows at once
+        self.band_rows = band_rows or max(1, Settings.OUT_OF_CORE_BAND_CELLS // self.width)
+
+        # the front file holds the current generation, it swaps with the back file after every step
+        self._grids = [MappedGrid(os.path.join(directory, name), self.height, self.width)
+                       for name in (info['front'], info['back'])]
+
+        self._bit_engines = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    @classmethod
+    def create(cls, directory, height, width, seed=None, band_rows=None, initializer='uniform', **params):
+        # the initial grid is generated band by band too, by one of the initializers generators
+        os.makedirs(directory, exist_ok=True)
+        for name in (cls.FRONT_FILE, cls.BACK_FILE):
+            MappedGrid(os.path.join(directory, name), height, width, create=True).close()
+
+        cls._write_info(directory, height, width, 0, cls.FRONT_FILE, cls.BACK_FILE)
+        world = cls(directory, band_rows)
+
+        seed = initializers.new_seed() if seed is None else seed
+        for y0, rows in initializers.chunks(initializer, (height, width), seed, world.band_rows, **params):
+            world.front.write_rows(y0, rows)
+        world.front.flush()
+        return world
+
+    @classmethod
+    def _write_info(cls, directory, height, width, generation, front, back):
+        with open(os.path.join(directory, cls.INFO_FILE), 'w') as file:
+            json.dump({'height': height, 'width': width, 'generation': generation, 'front': front, 'back': back}, file)
+
+    @property
+    def front(self):
+        return self._grids[0]
+
+    def bands(self):
+        for y0 in range(0, self.height, self.band_rows):
+            yield y0, min(y0 + self.band_rows, self.height)
+
+    def _bit_engine(self, mode):
+        # two state cellular automata rules run straight on the packed words, without unpacking the band
+        if not isinstance(mode, modes.CellularAutomataMode):
+            return None
+        rule = mode.rule
+        if rule.states > 2:
+            raise ValueError("out of core worlds store one bit per cell, multi state rules are not supported")
+        engine = self._bit_engines.get(rule.rulestring)
+        if engine is None:
+            engine = self._bit_engines[rule.rulestring] = BitPackedLife(rule.birth, rule.survival)
+        return engine
+
+    def step(self, mode):
+        # returns the bytes read from and written to the mapped files during this generation
+        if not mode.local:
+            raise ValueError(f"{type(mode).__name__} is not local, it can not be stepped in bands")
+        engine = self._bit_engine(mode)
+        radius = mode.radius
+        front, back = self._grids
+        bytes_read = bytes_written = 0
+
+        for y0, y1 in self.bands():
+            halo_y0, halo_y1 = max(y0 - radius, 0), min(y1 + radius, self.height)
+            words = front.read_words(halo_y0, halo_y1)
+            bytes_read += words.nbytes
+
+            if engine is not None:
+                stepped = engine.step_packed(words, self.width)
+            else:
+                stepped = BitPackedLife.pack(mode.step(BitPackedLife.unpack(words, self.width)).astype(bool, copy=False))
+            band = stepped[y0 - halo_y0:y1 - halo_y0]
+            back.write_words(y0, band)
+            bytes_written += band.nbytes
+
+        back.flush()
+        self._grids.reverse()
+        self.generation += 1
+        self._write_info(self.directory, self.height, self.width, self.generation,
+                         os.path.basename(self.front.path), os.path.basename(self._grids[1].path))
+
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+        return {'bytes_read': bytes_read, 'bytes_written': bytes_written}
+
+    def population(self):
+        population = 0
+        for y0, y1 in self.bands():
+            population += int(_POPCOUNT[self.front.read_words(y0, y1).view(np.uint8)].sum(dtype=np.int64))
+        return population
+
+    def window(self, y0, y1, x0, x1):
+        # a dense view of part of the world, e.g. for the viewer, only the words under it are read
+        first_word, last_word = x0 // BitPackedLife.WORD_BITS, -(-x1 // BitPackedLife.WORD_BITS)
+        words = np.array(self.front.words[y0:y1, first_word:last_word], dtype=np.uint64)
+        offset = x0 - first_word * BitPackedLife.WORD_BITS
+        return BitPackedLife.unpack(words, offset + x1 - x0)[:, offset:]
+
+    def close(self):
+        for grid in self._grids:
+            grid.close()
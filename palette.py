@@ -0,0 +1,85 @@
+import numpy as np
+from config.settings import Settings
+
+
+class Palette:
+    # number of entries in the palette, one per possible cell value
+    SIZE = 256
+
+    def __init__(self, alive_color=(255, 255, 255, 255), dead_color=(0, 0, 0, 255), states=2):
+        # palette maps a cell value to an RGBA color
+        # index 0 is the dead color, index 1 the alive color, dying states of generations rules fade
+        # from one to the other, and every other index is drawn as alive
+        self.colors = np.zeros((self.SIZE, 4), dtype=np.uint8)
+        # shares of live cells from 0 to 255, blended from the dead color to the alive color
+        self.coverage_colors = np.zeros((self.SIZE, 4), dtype=np.uint8)
+        # one palette per cell channel, blended from its color stops
+        self.gradients = {name: self.gradient(stops) for name, stops in Settings.CHANNEL_GRADIENTS.items()}
+        # bumped whenever a palette changes, so copies of it, e.g. on the GPU, know when to update
+        self.version = 0
+        self._alive_color = alive_color
+        self._dead_color = dead_color
+        self._states = states
+        self._update()
+
+    def set_colors(self, alive_color, dead_color):
+        self._alive_color, self._dead_color = alive_color, dead_color
+        self._update()
+
+    def set_alive_color(self, alive_color):
+        self._alive_color = alive_color
+        self._update()
+
+    def set_dead_color(self, dead_color):
+        self._dead_color = dead_color
+        self._update()
+
+    @property
+    def states(self):
+        return self._states
+
+    def set_state_count(self, states):
+        self._states = states
+        self._update()
+
+    def _update(self):
+        alive = np.array(self._alive_color, dtype=float)
+        dead = np.array(self._dead_color, dtype=float)
+        self.colors[0] = dead
+        self.colors[1:] = alive
+
+        # dying states step evenly from the alive color towards the dead color
+        dying = np.arange(2, self._states)
+        fade = ((dying - 1) / (self._states - 1))[:, None]
+        self.colors[dying] = np.round(alive + (dead - alive) * fade).astype(np.uint8)
+
+        share = (np.arange(self.SIZE) / (self.SIZE - 1))[:, None]
+        self.coverage_colors[:] = np.round(dead + (alive - dead) * share).astype(np.uint8)
+        self.version += 1
+
+    def set_gradient(self, name, stops):
+        self.gradients[name] = self.gradient(stops)
+        self.version += 1
+
+    @classmethod
+    def gradient(cls, stops):
+        # a palette from (value, RGBA color) stops, colors are blended linearly between them
+        values = [value for value, _ in stops]
+        colors = np.array([color for _, color in stops], dtype=float)
+        index = np.arange(cls.SIZE)
+        channels = [np.interp(index, values, colors[:, channel]) for channel in range(4)]
+        return np.round(np.stack(channels, axis=1)).astype(np.uint8)
+
+    def lut(self, channel=None, coverage=False):
+        # the palette cell values or channel values are looked up in
+        if channel is not None:
+            return self.gradients[channel]
+        return self.coverage_colors if coverage else self.colors
+
+    def apply(self, data_grid, out=None, coverage=False, channel=None):
+        # vectorized palette lookup, one RGBA color per cell, or per channel value
+        indices = data_grid.view(np.uint8) if data_grid.dtype == bool else data_grid
+        if out is None:
+            out = np.empty(data_grid.shape + (4,), dtype=np.uint8)
+        np.take(self.lut(channel, coverage), indices, axis=0, out=out, mode='clip')
+        return out
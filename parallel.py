@@ -0,0 +1,84 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+# front and back grids attached by each worker process
+_worker_memory = None
+_worker_grids = None
+
+
+def _attach_worker(names, shape, dtype):
+    global _worker_grids, _worker_memory
+    _worker_memory = [shared_memory.SharedMemory(name=name) for name in names]
+    _worker_grids = [np.ndarray(shape, dtype=dtype, buffer=memory.buf) for memory in _worker_memory]
+
+
+def _step_band(grids, mode, front_index, y0, y1):
+    # step rows y0 to y1 of the front grid into the back grid, reading radius rows of halo on both sides
+    front, back = grids[front_index], grids[1 - front_index]
+    radius = mode.radius
+    halo_y0, halo_y1 = max(y0 - radius, 0), min(y1 + radius, front.shape[0])
+    stepped = mode.step(front[halo_y0:halo_y1])
+    back[y0:y1] = stepped[y0 - halo_y0:y1 - halo_y0]
+
+
+def _step_band_in_worker(mode, front_index, y0, y1):
+    _step_band(_worker_grids, mode, front_index, y0, y1)
+
+
+class ParallelStepper:
+
+    def __init__(self, grid_shape, workers=None, use_processes=True, dtype=np.uint8):
+        self.grid_shape = grid_shape
+        self.workers = workers or os.cpu_count()
+        self.use_processes = use_processes
+
+        # double buffered grids in shared memory, workers read the front grid and write the back grid
+        size = int(np.prod(grid_shape)) * np.dtype(dtype).itemsize
+        self._memory = [shared_memory.SharedMemory(create=True, size=size) for _ in range(2)]
+        self._grids = [np.ndarray(grid_shape, dtype=dtype, buffer=memory.buf) for memory in self._memory]
+        self._front = 0
+
+        # one horizontal band of rows per worker
+        edges = np.linspace(0, grid_shape[0], self.workers + 1).astype(int)
+        self._bands = [(y0, y1) for y0, y1 in zip(edges[:-1], edges[1:]) if y1 > y0]
+
+        if use_processes:
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_attach_worker,
+                                             initargs=([memory.name for memory in self._memory], grid_shape, dtype))
+        else:
+            self._pool = ThreadPoolExecutor(self.workers)
+
+    @property
+    def grid(self):
+        # the current generation, only valid until the next step
+        return self._grids[self._front]
+
+    def load(self, grid):
+        self._grids[self._front][:] = grid
+
+    def step(self, mode, grid=None):
+        if not mode.local:
+            raise ValueError(f"{type(mode).__name__} cannot be stepped in bands")
+
+        # the grid only needs copying in when it is not already the front buffer
+        if grid is not None and not np.shares_memory(grid, self.grid):
+            self.load(grid)
+
+        if self.use_processes:
+            futures = [self._pool.submit(_step_band_in_worker, mode, self._front, y0, y1) for y0, y1 in self._bands]
+        else:
+            futures = [self._pool.submit(_step_band, self._grids, mode, self._front, y0, y1) for y0, y1 in self._bands]
+        for future in futures:
+            future.result()
+
+        self._front = 1 - self._front
+        return self.grid
+
+    def close(self):
+        self._pool.shutdown()
+        self._grids = None
+        for memory in self._memory:
+            memory.close()
+            memory.unlink()
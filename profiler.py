@@ -0,0 +1,124 @@
+import csv
+import json
+import threading
+import time
+from collections import defaultdict, deque
+import numpy as np
+from config.settings import Settings
+
+
+class _Stage:
+    # timer for one stage, reused between frames so timing a stage does not allocate
+    __slots__ = ('_profiler', '_name', '_start')
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profiler.record(self._name, self._start, time.perf_counter_ns() - self._start)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class FrameProfiler:
+
+    def __init__(self, enabled=True, window=Settings.PROFILER_WINDOW, trace_capacity=Settings.PROFILER_TRACE_CAPACITY):
+        self.enabled = enabled
+        self.frame = 0
+
+        # rolling durations per stage, in nanoseconds
+        self._window = window
+        self._durations = defaultdict(lambda: deque(maxlen=self._window))
+
+        # raw (frame, stage, start, duration) events for export, oldest dropped first
+        self._events = deque(maxlen=trace_capacity)
+        self._stages = {}
+        self._origin = time.perf_counter_ns()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NO_STAGE
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _Stage(self, name)
+        return stage
+
+    def record(self, name, start, duration):
+        # stages may be timed from several threads, e.g. the simulation worker and the window
+        self._durations[name].append(duration)
+        self._events.append((self.frame, name, start, duration, threading.get_native_id()))
+
+    def end_frame(self):
+        self.frame += 1
+
+    def toggle(self):
+        self.enabled = not self.enabled
+
+    def reset(self):
+        self._durations.clear()
+        self._events.clear()
+        self.frame = 0
+
+    def percentiles(self, name, percentiles=(50, 90, 99)):
+        # the worker thread records while the window reads, so the deques are copied before reading them
+        durations = list(self._durations.get(name, ()))
+        if not durations:
+            return {}
+        milliseconds = np.percentile(np.array(durations, dtype=np.int64) / 1e6, percentiles)
+        return {f"p{percentile}": value for percentile, value in zip(percentiles, milliseconds)}
+
+    def summary(self):
+        # stages are added by the worker thread, a snapshot of the names is iterated
+        return {name: self.percentiles(name) for name in list(self._durations)}
+
+    def summary_text(self):
+        lines = [f"{'stage':<16}{'p50':>8}{'p90':>8}{'p99':>8}  ms"]
+        for name, values in self.summary().items():
+            lines.append(f"{name:<16}{values['p50']:>8.2f}{values['p90']:>8.2f}{values['p99']:>8.2f}")
+        return '\n'.join(lines)
+
+    def export_csv(self, path):
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['frame', 'stage', 'start_ms', 'duration_ms', 'thread'])
+            for frame, name, start, duration, thread in list(self._events):
+                writer.writerow([frame, name, f"{(start - self._origin) / 1e6:.4f}", f"{duration / 1e6:.4f}", thread])
+
+    def export_chrome_trace(self, path):
+        # complete ("X") events in microseconds, viewable in chrome://tracing or Perfetto
+        events = [{
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self._origin) / 1e3,
+            'dur': duration / 1e3,
+            'pid': 0,
+            'tid': thread,
+            'args': {'frame': frame},
+        } for frame, name, start, duration, thread in list(self._events)]
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+    def export(self, path):
+        # the format follows the file extension, .csv or Chrome trace .json
+        if path.endswith('.csv'):
+            self.export_csv(path)
+        else:
+            self.export_chrome_trace(path)
@@ -0,0 +1,201 @@
+import json
+import mmap
+import struct
+import zlib
+import numpy as np
+from config.settings import Settings
+
+
+# file layout: MAGIC, one compressed record per frame, the frame index, the JSON header, then FOOTER
+MAGIC = b'CAREC001'
+FOOTER = struct.Struct('<QQQ8s')
+
+# one entry per frame, read straight out of the memory map by the player
+FRAME_INDEX = np.dtype([
+    ('generation', '<i8'),
+    ('offset', '<i8'),
+    ('length', '<i8'),
+    ('keyframe', 'u1'),
+    ('packed', 'u1'),
+    ('meta', '<i4'),
+])
+
+
+def encode(grid):
+    # two state grids are bit packed, 8 cells per byte, multi state grids keep a byte per cell
+    if grid.dtype == bool or grid.max(initial=0) <= 1:
+        return np.packbits(grid.astype(bool, copy=False), axis=1), True
+    return np.array(grid, dtype=np.uint8), False
+
+
+class Recorder:
+    # writes a keyframe every keyframe_interval frames and XOR deltas against the previous frame in between
+
+    def __init__(self, path, grid_shape, keyframe_interval=Settings.RECORDING_KEYFRAME_INTERVAL,
+                 compression_level=Settings.RECORDING_COMPRESSION_LEVEL):
+        self.path = path
+        self.shape = tuple(grid_shape)
+        self.keyframe_interval = keyframe_interval
+        self.compression_level = compression_level
+
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._frames = []
+        self._meta = []
+        self._previous = None
+        self._previous_packed = None
+        self.bytes_written = len(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @property
+    def frame_count(self):
+        return len(self._frames)
+
+    def record(self, generation, grid, meta=None):
+        if grid.shape != self.shape:
+            raise ValueError(f"expected a grid of shape {self.shape}, got {grid.shape}")
+        encoded, packed = encode(grid)
+
+        # a delta needs the previous frame in the same encoding
+        keyframe = (len(self._frames) % self.keyframe_interval == 0 or self._previous is None
+                    or packed != self._previous_packed)
+        payload = encoded if keyframe else np.bitwise_xor(encoded, self._previous)
+        data = zlib.compress(payload.tobytes(), self.compression_level)
+
+        # metadata is only stored again when it changes
+        meta = meta or {}
+        if not self._meta or self._meta[-1] != meta:
+            self._meta.append(dict(meta))
+
+        offset = self._file.tell()
+        self._file.write(data)
+        self.bytes_written += len(data)
+        self._frames.append((generation, offset, len(data), keyframe, packed, len(self._meta) - 1))
+        self._previous, self._previous_packed = encoded, packed
+
+    def close(self):
+        if self._file is None:
+            return
+        index = np.array(self._frames, dtype=FRAME_INDEX)
+        header = json.dumps({
+            'shape': self.shape,
+            'keyframe_interval': self.keyframe_interval,
+            'meta': self._meta,
+        }).encode()
+
+        index_offset = self._file.tell()
+        self._file.write(index.tobytes())
+        self._file.write(header)
+        self._file.write(FOOTER.pack(index_offset, len(index), len(header), MAGIC))
+        self._file.close()
+        self._file = None
+
+
+class Player:
+    # seeks by decoding the nearest keyframe before a frame, then applying the deltas after it
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"'{path}' is not a recording")
+
+        index_offset, frame_count, header_length, magic = FOOTER.unpack_from(self._map, len(self._map) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is an unfinished recording")
+
+        self.frames = np.frombuffer(self._map, dtype=FRAME_INDEX, count=frame_count, offset=index_offset)
+        header_offset = index_offset + self.frames.nbytes
+        header = json.loads(bytes(self._map[header_offset:header_offset + header_length]))
+        self.shape = tuple(header['shape'])
+        self.keyframe_interval = header['keyframe_interval']
+        self._meta = header['meta']
+        self._keyframes = np.flatnonzero(self.frames['keyframe'])
+
+        # the last decoded frame, so playing forward applies a single delta per frame
+        self.position = -1
+        self._encoded = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self.frames)
+
+    def close(self):
+        # views into the map have to be released before it can close
+        self.frames = None
+        self._map.close()
+        self._file.close()
+
+    def _payload(self, frame):
+        entry = self.frames[frame]
+        start = int(entry['offset'])
+        raw = zlib.decompress(self._map[start:start + int(entry['length'])])
+        return np.frombuffer(raw, dtype=np.uint8).reshape(self._encoded_shape(entry['packed']))
+
+    def _encoded_shape(self, packed):
+        return (self.shape[0], -(-self.shape[1] // 8)) if packed else self.shape
+
+    def seek(self, frame):
+        if not 0 <= frame < len(self.frames):
+            raise IndexError(f"frame {frame} is outside of the recording of {len(self.frames)} frames")
+
+        # keep going from the current frame unless a keyframe lies between it and the target
+        keyframe = self._keyframes[np.searchsorted(self._keyframes, frame, side='right') - 1]
+        if not keyframe <= self.position <= frame:
+            self._encoded = self._payload(keyframe).copy()
+            self.position = int(keyframe)
+
+        for delta in range(self.position + 1, frame + 1):
+            np.bitwise_xor(self._encoded, self._payload(delta), out=self._encoded)
+        self.position = frame
+
+    def seek_generation(self, generation):
+        # the last frame recorded at or before the generation
+        frame = int(np.searchsorted(self.frames['generation'], generation, side='right')) - 1
+        self.seek(max(frame, 0))
+
+    def grid(self):
+        if self.frames[self.position]['packed']:
+            return np.unpackbits(self._encoded, axis=1, count=self.shape[1]).astype(bool)
+        return self._encoded.copy()
+
+    def meta(self):
+        return self._meta[int(self.frames[self.position]['meta'])]
+
+    def generation(self):
+        return int(self.frames[self.position]['generation'])
+
+    def frame(self, frame):
+        # (generation, grid, meta) of a frame
+        self.seek(frame)
+        return self.generation(), self.grid(), self.meta()
+
+    def play(self, start=0, stop=None):
+        for frame in range(start, len(self.frames) if stop is None else stop):
+            yield self.frame(frame)
+
+    def apply(self, simulation):
+        # load the current frame into a simulation, along with its mode and rule
+        meta = self.meta()
+        ca_mode = simulation.get_mode('ca')
+        if meta.get('preset') and meta['preset'] != ca_mode.preset_name:
+            ca_mode.load_preset(meta['preset'])
+        elif 'rule' in meta and meta['rule'] != ca_mode.rule.rulestring:
+            ca_mode.load_rule(meta['rule'])
+        if meta.get('mode', simulation.mode_name) != simulation.mode_name:
+            simulation.change_mode(meta['mode'])
+        simulation.load(self.grid(), self.generation())
+        return meta
@@ -0,0 +1,196 @@
+import numpy as np
+import pyglet
+from pyglet import gl
+from config.settings import Settings
+from lod import LodPyramid
+from palette import Palette
+
+
+# the sprite shader with a palette lookup, the texture holds one cell value per texel and the palette
+# is a 256 texel wide texture, so changing colours only uploads the palette
+palette_fragment_source = """#version 150 core
+    in vec4 vertex_colors;
+    in vec3 texture_coords;
+    out vec4 final_colors;
+
+    uniform sampler2D sprite_texture;
+    uniform sampler2D palette;
+
+    void main()
+    {
+        // cell values are stored as normalized bytes
+        int index = int(round(texture(sprite_texture, texture_coords.xy).r * 255.0));
+        final_colors = texelFetch(palette, ivec2(index, 0), 0) * vertex_colors;
+    }
+"""
+
+
+class ViewportGroup(pyglet.graphics.Group):
+    # clips drawing to the viewport, cells at its edges are only partly visible
+
+    def __init__(self, camera, order=0, parent=None):
+        super().__init__(order, parent)
+        self._camera = camera
+
+    def set_state(self):
+        gl.glEnable(gl.GL_SCISSOR_TEST)
+        gl.glScissor(int(self._camera.viewport_x), int(self._camera.viewport_y),
+                     int(self._camera.viewport_width), int(self._camera.viewport_height))
+
+    def unset_state(self):
+        gl.glDisable(gl.GL_SCISSOR_TEST)
+
+
+class PaletteGroup(pyglet.graphics.Group):
+    # binds the palette texture to the texture unit the palette shader reads it from
+
+    UNIT = 1
+
+    def __init__(self, palette_texture, order=0, parent=None):
+        super().__init__(order, parent)
+        self._palette_texture = palette_texture
+
+    def set_state(self):
+        gl.glActiveTexture(gl.GL_TEXTURE0 + self.UNIT)
+        gl.glBindTexture(self._palette_texture.target, self._palette_texture.id)
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+
+
+class GridRenderer:
+    # draws the part of the grid the camera sees, zoomed out views come from a level of detail pyramid
+    # the texture only holds the visible cells, so its size depends on the viewport and not on the grid
+    # it holds cell values, or the values of a cell channel, and the GPU looks their colors up in the palette
+
+    def __init__(self, camera, batch=None, lod_levels=Settings.LOD_LEVELS, pooling=Settings.LOD_POOLING):
+        self._camera = camera
+        self._grid_height, self._grid_width = camera.grid_height, camera.grid_width
+        self.palette = Palette()
+        self.lod = LodPyramid((self._grid_height, self._grid_width), lod_levels, pooling)
+
+        # cells of any level of detail covering the viewport, with a cell to spare on each side
+        texture_height = min(int(camera.viewport_height) + 4, self._grid_height)
+        texture_width = min(int(camera.viewport_width) + 4, self._grid_width)
+
+        # one texel per visible cell, row 0 is the bottom row of the view
+        self._indices = np.zeros((texture_height, texture_width), dtype=np.uint8)
+        # set when every cell has to be repainted, e.g. after switching channels
+        self._stale = True
+        # (level, y0, y1, x0, x1) of the cells in the texture, and the texture rows filled last
+        self._view = None
+        self._filled = (0, 0)
+        # channel of channels.CellChannels drawn instead of the cell states, None for the states
+        self.channel = None
+        # whether the cells in the texture are shares of live cells, and the palette uploaded last
+        self._coverage = False
+        self._uploaded = None
+
+        # keep cells as crisp squares when the texture is scaled up
+        self._texture = pyglet.image.Texture.create(texture_width, texture_height, internalformat=gl.GL_R8,
+                                                    min_filter=gl.GL_NEAREST, mag_filter=gl.GL_NEAREST,
+                                                    fmt=gl.GL_RED)
+        self._palette_texture = pyglet.image.Texture.create(Palette.SIZE, 1, min_filter=gl.GL_NEAREST,
+                                                            mag_filter=gl.GL_NEAREST)
+
+        program = gl.current_context.create_program((pyglet.sprite.vertex_source, 'vertex'),
+                                                    (palette_fragment_source, 'fragment'))
+        program.use()
+        program['palette'] = PaletteGroup.UNIT
+        program.stop()
+        group = PaletteGroup(self._palette_texture, parent=ViewportGroup(camera))
+        self._sprite = pyglet.sprite.Sprite(self._texture, batch=batch, group=group, program=program)
+
+    # colour changes only touch the palette, which is uploaded with the next frame
+    def set_colors(self, alive_color, dead_color):
+        self.palette.set_colors(alive_color, dead_color)
+
+    def set_alive_color(self, alive_color):
+        self.palette.set_alive_color(alive_color)
+
+    def set_dead_color(self, dead_color):
+        self.palette.set_dead_color(dead_color)
+
+    def set_state_count(self, states):
+        self.palette.set_state_count(states)
+
+    def set_channel(self, channel):
+        # the grids passed to fill are channel values from now on, or cell states for None
+        self.channel = channel
+        self._stale = True
+
+    def dirty_rows(self, row_span=None):
+        # (first, last) grid rows to repaint, every row after switching channels or a camera move,
+        # otherwise the rows holding changes
+        if row_span is None:
+            row_span = (0, self._grid_height)
+        self.lod.mark(*row_span)
+
+        view = self._camera.view(len(self.lod.levels) - 1)
+        if self._stale or view != self._view:
+            self._stale = False
+            self._view = view
+            self._place_sprite()
+            return 0, self._grid_height
+        return row_span
+
+    def _place_sprite(self):
+        level, y0, y1, x0, x1 = self._view
+        scale = 1 << level
+        self._sprite.image = self._texture.get_region(0, 0, max(x1 - x0, 1), max(y1 - y0, 1))
+        self._sprite.position = self._camera.grid_to_screen(x0 * scale, y0 * scale) + (0,)
+        self._sprite.scale = self._camera.zoom * scale
+
+    def fill(self, data_grid, first_row=0, last_row=None):
+        # copies the visible cells of grid rows first_row to last_row into the reusable index buffer
+        last_row = self._grid_height if last_row is None else last_row
+        if self._view is None:
+            self.dirty_rows()
+        level, y0, y1, x0, x1 = self._view
+        scale = 1 << level
+
+        # the rows of the level holding the changed grid rows, clipped to the view
+        first, last = max(first_row // scale, y0), min(-(-last_row // scale), y1)
+        self._filled = (first - y0, last - y0)
+        if first >= last:
+            return self._indices[:0]
+
+        out = self._indices[first - y0:last - y0, :x1 - x0]
+        if self.channel is not None:
+            # channel values change all over the grid every generation, zoomed out views sample every scale-th cell
+            self._coverage = False
+            np.copyto(out, data_grid[first * scale:last * scale:scale, x0 * scale:x1 * scale:scale])
+            return out
+
+        source = self.lod.refresh(data_grid, level) if level else data_grid
+        self._coverage = level > 0 and self.lod.coverage
+        np.copyto(out, source[first:last, x0:x1], casting='unsafe')
+        return out
+
+    def upload_palette(self):
+        # sends the palette of what the texture holds when it changed, 256 texels whatever the grid size
+        uploaded = (self.channel, self._coverage, self.palette.version)
+        if uploaded == self._uploaded:
+            return
+        self._uploaded = uploaded
+        colors = self.palette.lut(self.channel, self._coverage)
+        image = pyglet.image.ImageData(Palette.SIZE, 1, 'RGBA', colors.tobytes())
+        self._palette_texture.blit_into(image, 0, 0, 0)
+
+    def upload(self):
+        # sends the texture rows written by the last fill, and the palette when it changed
+        # fill maps the grid rows to the rows of the level drawn, so the band is known from it alone
+        self.upload_palette()
+        first, last = self._filled
+        if first >= last:
+            return
+        width = self._view[4] - self._view[3]
+        # only the band of changed rows is sent to the texture
+        band = pyglet.image.ImageData(width, last - first, 'R', self._indices[first:last].tobytes(),
+                                      pitch=self._indices.shape[1])
+        self._texture.blit_into(band, 0, first, 0)
+        self._filled = (0, 0)
+
+    def draw_grid(self, data_grid, row_span=None):
+        first_row, last_row = self.dirty_rows(row_span)
+        if first_row < last_row:
+            self.fill(data_grid, first_row, last_row)
+        self.upload()
@@ -0,0 +1,93 @@
+import re
+import numpy as np
+
+
+class Rule:
+    # outer totalistic rule for the Moore neighbourhood, with optional "Generations" dying states
+    # state 0 is dead, state 1 is alive, states 2 to states - 1 are dying and do not count as neighbours
+
+    # rows of the lookup table, one per possible cell value
+    TABLE_STATES = 256
+    MAX_NEIGHBOURS = 8
+
+    _BS_NOTATION = re.compile(r'^B([0-8]*)/?S([0-8]*)(?:/?[CG]?([0-9]+))?$', re.IGNORECASE)
+    _SB_NOTATION = re.compile(r'^([0-8]*)/([0-8]*)(?:/([0-9]+))?$')
+
+    # compiled rules by rulestring
+    _rule_cache = {}
+
+    def __init__(self, birth, survival, states=2):
+        if not 2 <= states <= self.TABLE_STATES:
+            raise ValueError(f"a rule needs between 2 and {self.TABLE_STATES} states, got {states}")
+        self.birth = frozenset(birth)
+        self.survival = frozenset(survival)
+        self.states = states
+        self.table = self._compile()
+
+    @classmethod
+    def parse(cls, rule):
+        # accepts a Rule, a "B3/S23", "B2/S/C3", "23/3" or "345/2/4" rulestring, or a
+        # (underpopulation_limit, overpopulation_limit, reproduction_requirement) preset triple
+        if isinstance(rule, Rule):
+            return rule
+        if isinstance(rule, tuple):
+            return cls.from_limits(*rule)
+
+        key = rule.strip()
+        cached = cls._rule_cache.get(key)
+        if cached is not None:
+            return cached
+
+        match = cls._BS_NOTATION.match(key)
+        if match:
+            birth, survival, states = match.groups()
+        else:
+            match = cls._SB_NOTATION.match(key)
+            if not match:
+                raise ValueError(f"invalid rulestring '{rule}'")
+            survival, birth, states = match.groups()
+
+        parsed = cls([int(count) for count in birth], [int(count) for count in survival],
+                     int(states) if states else 2)
+
+        # the same rule spelled differently shares one compiled table
+        parsed = cls._rule_cache.setdefault(parsed.rulestring, parsed)
+        cls._rule_cache[key] = parsed
+        return parsed
+
+    @classmethod
+    def from_limits(cls, underpopulation_limit, overpopulation_limit, reproduction_requirement):
+        survival = ''.join(str(count) for count in range(underpopulation_limit, overpopulation_limit + 1))
+        return cls.parse(f"B{reproduction_requirement}/S{survival}")
+
+    @property
+    def rulestring(self):
+        birth = ''.join(str(count) for count in sorted(self.birth))
+        survival = ''.join(str(count) for count in sorted(self.survival))
+        generations = f"/C{self.states}" if self.states > 2 else ''
+        return f"B{birth}/S{survival}{generations}"
+
+    def __repr__(self):
+        return f"Rule('{self.rulestring}')"
+
+    def _compile(self):
+        # table[state, live neighbour count] is the next state of a cell
+        table = np.zeros((self.TABLE_STATES, self.MAX_NEIGHBOURS + 1), dtype=np.uint8)
+        counts = np.arange(self.MAX_NEIGHBOURS + 1)
+        born = np.isin(counts, list(self.birth))
+        survives = np.isin(counts, list(self.survival))
+
+        # a live cell that does not survive starts dying, or dies straight away with two states
+        decay = 2 if self.states > 2 else 0
+        table[0] = np.where(born, 1, 0)
+        table[1] = np.where(survives, 1, decay)
+        for state in range(2, self.states):
+            table[state] = (state + 1) % self.states
+
+        # values past the last state behave like dead cells
+        table[self.states:] = table[0]
+        return table
+
+    def apply(self, states, neighbour_count):
+        # one gather over the neighbour counts
+        return self.table[states, neighbour_count]
@@ -0,0 +1,384 @@
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import struct
+import zlib
+from collections import OrderedDict
+import numpy as np
+from config.settings import Settings
+from brush import Brush
+from neighbourhoods import Neighbourhood
+from recording import encode
+from worker import SimulationWorker
+import modes
+
+
+# frames are sent as FRAME_HEADER followed by the zlib compressed payload
+# kind is b'K' for a keyframe, the grid itself, or b'D' for a delta, the XOR against the last frame sent to the client
+# packed grids hold 8 cells per byte like recordings, multi state grids a byte per cell
+FRAME_HEADER = struct.Struct('<cBqII')
+KEYFRAME, DELTA = b'K', b'D'
+# every other message is JSON, sent as a text frame over WebSockets or prefixed with b'J' over TCP
+JSON = b'J'
+
+# the length of every message over plain TCP, in both directions
+TCP_LENGTH = struct.Struct('>I')
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class StreamDecoder:
+    # rebuilds grids on the client side from the frames of a StreamServer
+
+    def __init__(self):
+        self.grid = None
+        self.generation = None
+        self._encoded = None
+
+    def apply(self, message):
+        kind, packed, generation, height, width = FRAME_HEADER.unpack_from(message)
+        payload = np.frombuffer(zlib.decompress(message[FRAME_HEADER.size:]), dtype=np.uint8)
+        payload = payload.reshape(height, -1)
+        if kind == KEYFRAME:
+            self._encoded = payload.copy()
+        elif self._encoded is None or self._encoded.shape != payload.shape:
+            raise ValueError("delta frame without the keyframe it is based on")
+        else:
+            np.bitwise_xor(self._encoded, payload, out=self._encoded)
+
+        self.grid = np.unpackbits(self._encoded, axis=1, count=width) if packed else self._encoded.copy()
+        self.generation = generation
+        return self.grid
+
+
+class TcpConnection:
+    # messages prefixed with their length, JSON commands in, frames and JSON out
+
+    def __init__(self, reader, writer, first_bytes):
+        self._reader = reader
+        self._writer = writer
+        # the bytes read to tell TCP from WebSocket clients are the length of the first message
+        self._first_bytes = first_bytes
+
+    def buffered(self):
+        return self._writer.transport.get_write_buffer_size()
+
+    def send_frame(self, message):
+        self._writer.write(TCP_LENGTH.pack(len(message)) + message)
+
+    def send_json(self, value):
+        data = JSON + json.dumps(value).encode()
+        self._writer.write(TCP_LENGTH.pack(len(data)) + data)
+
+    async def receive(self):
+        # the next JSON command, None once the client is gone
+        header = self._first_bytes or await self._reader.readexactly(TCP_LENGTH.size)
+        self._first_bytes = None
+        length, = TCP_LENGTH.unpack(header)
+        if length > Settings.STREAM_MAX_MESSAGE:
+            raise ValueError(f"message of {length} bytes is over the limit of {Settings.STREAM_MAX_MESSAGE}")
+        return json.loads(await self._reader.readexactly(length))
+
+    def close(self):
+        self._writer.close()
+
+
+class WebSocketConnection:
+    # a minimal RFC 6455 server side, binary frames out, text or binary JSON commands in, no extensions
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+
+    async def handshake(self, first_bytes):
+        request = first_bytes + await self._reader.readuntil(b'\r\n\r\n')
+        headers = {}
+        for line in request.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get(b'sec-websocket-key')
+        if key is None:
+            raise ValueError("not a WebSocket upgrade request")
+        accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest())
+        self._writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                           b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+
+    def buffered(self):
+        return self._writer.transport.get_write_buffer_size()
+
+    def _send(self, opcode, data):
+        length = len(data)
+        if length < 126:
+            header = struct.pack('>BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+        self._writer.write(header + data)
+
+    def send_frame(self, message):
+        self._send(0x2, message)
+
+    def send_json(self, value):
+        self._send(0x1, json.dumps(value).encode())
+
+    async def receive(self):
+        while True:
+            first, second = await self._reader.readexactly(2)
+            opcode, length = first & 0x0F, second & 0x7F
+            if length == 126:
+                length, = struct.unpack('>H', await self._reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack('>Q', await self._reader.readexactly(8))
+            if length > Settings.STREAM_MAX_MESSAGE:
+                raise ValueError(f"message of {length} bytes is over the limit of {Settings.STREAM_MAX_MESSAGE}")
+            if not second & 0x80:
+                raise ValueError("client frames have to be masked")
+            mask = np.frombuffer(await self._reader.readexactly(4), dtype=np.uint8)
+            payload = np.frombuffer(await self._reader.readexactly(length), dtype=np.uint8)
+            data = (payload ^ np.resize(mask, length)).tobytes()
+
+            if opcode == 0x8:
+                # the client closes, the close frame is echoed
+                self._send(0x8, data[:2])
+                return None
+            if opcode == 0x9:
+                self._send(0xA, data)
+            elif opcode in (0x1, 0x2):
+                if not first & 0x80:
+                    raise ValueError("fragmented messages are not supported")
+                return json.loads(data)
+
+    def close(self):
+        self._writer.close()
+
+
+class StreamClient:
+    # what the server knows about one subscriber, which frame it has and how fast it may get more
+
+    def __init__(self, connection, frame_rate):
+        self.connection = connection
+        self.frame_rate = frame_rate
+        # sequence of the last frame sent, deltas are based on it, None until the first keyframe
+        self.base = None
+        self.next_frame_time = 0.0
+        self.frames_sent = 0
+        self.keyframes_sent = 0
+        # frames held back because the client had not read the previous ones yet
+        self.frames_skipped = 0
+        self.bytes_sent = 0
+
+        # commands are limited with a token bucket, STREAM_COMMAND_RATE a second with bursts of STREAM_COMMAND_BURST
+        self._tokens = Settings.STREAM_COMMAND_BURST
+        self._tokens_time = None
+
+    def allow_command(self, now):
+        if self._tokens_time is not None:
+            elapsed = now - self._tokens_time
+            self._tokens = min(self._tokens + elapsed * Settings.STREAM_COMMAND_RATE, Settings.STREAM_COMMAND_BURST)
+        self._tokens_time = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class StreamServer:
+    # steps a simulation on a SimulationWorker and streams its frames to any number of TCP and WebSocket clients
+    # every client gets the newest frame at up to its own frame rate, as a delta against the last frame it got,
+    # clients that fall further behind than the history get a keyframe, clients that stop reading are skipped
+    # clients paint, change modes and presets with JSON commands, which run on the worker between two steps
+
+    def __init__(self, simulation, host=Settings.STREAM_HOST, port=Settings.STREAM_PORT,
+                 frame_rate=Settings.STREAM_FRAME_RATE):
+        self.simulation = simulation
+        self.host = host
+        self.port = port
+        self.frame_rate = frame_rate
+        self.worker = SimulationWorker(simulation)
+        self.clients = set()
+        # the same brush as the window, discs for clients that ask for a radius
+        self.brush = Brush.from_neighbourhood(Neighbourhood.ExMoore)
+        self._discs = {}
+
+        self._frame = np.zeros((simulation.grid_height, simulation.grid_width), dtype=np.uint8)
+        self._sequence = -1
+        # the last STREAM_HISTORY frames as (generation, encoded, packed) by sequence, the bases of deltas
+        self._history = OrderedDict()
+        self._meta = None
+        self._server = None
+
+    async def serve(self):
+        self._server = await asyncio.start_server(self._connect, self.host, self.port)
+        self.worker.start()
+        broadcast = asyncio.create_task(self._broadcast())
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            broadcast.cancel()
+            self.worker.stop()
+            for client in list(self.clients):
+                client.connection.close()
+
+    @property
+    def sockets(self):
+        return self._server.sockets if self._server is not None else []
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    async def _connect(self, reader, writer):
+        # WebSocket clients start with an HTTP upgrade request, anything else is plain TCP,
+        # as are clients that send nothing at first, viewers only listening never send a command
+        try:
+            try:
+                first_bytes = await asyncio.wait_for(reader.readexactly(4), Settings.STREAM_HANDSHAKE_TIMEOUT)
+            except asyncio.TimeoutError:
+                # the bytes that did arrive stay in the reader
+                first_bytes = None
+            if first_bytes == b'GET ':
+                connection = WebSocketConnection(reader, writer)
+                await connection.handshake(first_bytes)
+            else:
+                connection = TcpConnection(reader, writer, first_bytes)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+            writer.close()
+            return
+
+        client = StreamClient(connection, self.frame_rate)
+        connection.send_json({'type': 'hello', 'height': self.simulation.grid_height,
+                              'width': self.simulation.grid_width, 'modes': list(self.simulation.MODE_NAMES),
+                              **self.simulation.metadata()})
+        self.clients.add(client)
+        try:
+            while True:
+                command = await connection.receive()
+                if command is None:
+                    break
+                self._run_command(client, command)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.clients.discard(client)
+            connection.close()
+
+    def _run_command(self, client, command):
+        # commands as {"command": name, ...}, see the window for what they correspond to
+        if not isinstance(command, dict):
+            client.connection.send_json({'type': 'error', 'message': 'commands are JSON objects'})
+            return
+        if not client.allow_command(asyncio.get_running_loop().time()):
+            client.connection.send_json({'type': 'error', 'message': 'too many commands'})
+            return
+
+        name = command.get('command')
+        simulation = self.simulation
+        try:
+            if name == 'paint':
+                # a stroke from (x0, y0) to (x1, y1), the brush of the window unless a radius is given
+                # points off the grid are moved onto its edge, strokes never reach further than the grid
+                x0, y0 = self._clamp_point(command['x0'], command['y0'])
+                x1, y1 = self._clamp_point(command.get('x1', x0), command.get('y1', y0))
+                state = int(command.get('state', 1))
+                if not 0 <= state < simulation.mode.states:
+                    raise ValueError(f"state {state} is not one of the {simulation.mode.states} states of the mode")
+                brush = self._brush(command.get('radius'))
+                self.worker.submit(simulation.paint_stroke, brush, x0, y0, x1, y1, state)
+            elif name == 'mode':
+                if command.get('name') not in simulation.MODE_NAMES:
+                    raise ValueError(f"unknown mode {command.get('name')!r}")
+                if simulation.boundary == 'wrap' and not simulation.get_mode(command['name']).local:
+                    raise ValueError(f"mode {command['name']!r} does not work with wrapped edges")
+                self.worker.submit(simulation.change_mode, command['name'])
+            elif name == 'next_preset':
+                self.worker.submit(self._next_preset)
+            elif name == 'resync':
+                client.base = None
+            elif name == 'rate':
+                fps = float(command['fps'])
+                if not math.isfinite(fps):
+                    raise ValueError(f"frame rate {fps} is not a number of frames a second")
+                client.frame_rate = min(max(fps, 0.1), self.frame_rate)
+            else:
+                raise ValueError(f"unknown command {name!r}")
+        except (KeyError, TypeError, ValueError, OverflowError) as error:
+            client.connection.send_json({'type': 'error', 'message': str(error)})
+
+    def _clamp_point(self, x, y):
+        x = min(max(int(x), 0), self.simulation.grid_width - 1)
+        y = min(max(int(y), 0), self.simulation.grid_height - 1)
+        return x, y
+
+    def _brush(self, radius):
+        if radius is None:
+            return self.brush
+        radius = min(max(int(radius), 0), Settings.STREAM_MAX_BRUSH_RADIUS)
+        if radius not in self._discs:
+            self._discs[radius] = Brush.disc(radius)
+        return self._discs[radius]
+
+    def _next_preset(self):
+        # like the window, presets only change in cellular automata mode
+        if isinstance(self.simulation.mode, modes.CellularAutomataMode):
+            self.simulation.mode.next_preset()
+
+    async def _broadcast(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(1 / self.frame_rate)
+            sequence, generation, _ = self.worker.ring.read_latest(self._frame, self._sequence)
+            if sequence != self._sequence:
+                self._sequence = sequence
+                encoded, packed = encode(self._frame)
+                self._history[sequence] = (generation, encoded, packed)
+                while len(self._history) > Settings.STREAM_HISTORY:
+                    self._history.popitem(last=False)
+
+            meta = self.simulation.metadata()
+            if meta != self._meta:
+                self._meta = meta
+                for client in self.clients:
+                    client.connection.send_json({'type': 'meta', **meta})
+
+            # clients with the same base get the same message, it is only encoded once
+            messages = {}
+            now = loop.time()
+            for client in list(self.clients):
+                if client.base == self._sequence or now < client.next_frame_time:
+                    continue
+                if client.connection.buffered() > Settings.STREAM_MAX_BUFFER:
+                    client.frames_skipped += 1
+                    continue
+
+                base = client.base if self._can_delta(client.base) else None
+                if base not in messages:
+                    messages[base] = await loop.run_in_executor(None, self._encode_frame, base, self._sequence)
+                message = messages[base]
+                if client not in self.clients:
+                    continue
+                client.connection.send_frame(message)
+                client.base = self._sequence
+                client.next_frame_time = max(client.next_frame_time + 1 / client.frame_rate, now)
+                client.frames_sent += 1
+                client.keyframes_sent += base is None
+                client.bytes_sent += len(message)
+
+    def _can_delta(self, base):
+        # deltas need the base frame in the history, in the same encoding as the current frame
+        if base is None or base not in self._history:
+            return False
+        return self._history[base][2] == self._history[self._sequence][2]
+
+    def _encode_frame(self, base, sequence):
+        # runs on an executor thread, XOR and zlib release the GIL
+        generation, encoded, packed = self._history[sequence]
+        if base is None:
+            kind, payload = KEYFRAME, encoded
+        else:
+            kind, payload = DELTA, np.bitwise_xor(encoded, self._history[base][1])
+        header = FRAME_HEADER.pack(kind, packed, generation, self.simulation.grid_height,
+                                   self.simulation.grid_width)
+        return header + zlib.compress(payload.tobytes(), Settings.STREAM_COMPRESSION_LEVEL)
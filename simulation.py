@@ -0,0 +1,401 @@
+import time
+from config.settings import Settings
+from buffers import AllocationCounter, GridBuffers
+from changes import ChangeMask
+from channels import CellChannels
+from cycles import CycleDetector
+from hashlife import HashLife
+import initializers
+from tiles import TileTracker
+from parallel import ParallelStepper
+from recording import Recorder
+from profiler import FrameProfiler
+import modes
+
+
+class Simulation:
+    # mode names used by the command line and by viewers to select a mode
+    MODE_NAMES = {
+        'ca'        : modes.CellularAutomataMode,
+        'sand'      : modes.SandMode,
+        'zebra'     : modes.ZebraMode,
+        'expand'    : modes.ExpandMode,
+        'trail'     : modes.SmoothMode
+    }
+
+    def __init__(self, grid_height=Settings.GRID_HEIGHT, grid_width=Settings.GRID_WIDTH, mode='ca',
+                 life_chance=Settings.INITIAL_LIFE_CHANCE, ca_backend='convolve', seed=None,
+                 boundary=Settings.BOUNDARY):
+        self.grid_height = grid_height
+        self.grid_width = grid_width
+        self.generation = 0
+
+        self._modes = {}
+        for name, mode_class in self.MODE_NAMES.items():
+            if mode_class is modes.SandMode:
+                self._modes[name] = mode_class(grid_shape=(grid_height, grid_width))
+            elif mode_class is modes.CellularAutomataMode:
+                self._modes[name] = mode_class(backend=ca_backend)
+            else:
+                self._modes[name] = mode_class()
+
+        self._mode_name = mode
+        self._mode = self._modes[mode]
+        self._check_boundary(boundary, mode)
+        self.tiles = None
+        self._parallel = None
+
+        # all modes OR the cells they change into one mask, viewers read it and clear it
+        self.changes = ChangeMask((grid_height, grid_width))
+        for mode in self._modes.values():
+            mode.changes = self.changes
+
+        # the grid lives in one of two preallocated buffers, modes step from one into the other
+        # inside a border wide enough for the kernel of every mode that reads its neighbours through it
+        halo = max([Settings.GRID_HALO] + [mode.radius for mode in self._modes.values() if mode.local])
+        self.buffers = GridBuffers((grid_height, grid_width), halo=halo, boundary=boundary)
+        for mode in self._modes.values():
+            mode.buffers = self.buffers
+        # bytes allocated by each step, measured once started
+        self.allocations = AllocationCounter()
+
+        # optional channels.CellChannels, per cell age, activity and velocity updated by every step
+        self.channels = None
+
+        # optional cycles.CycleDetector, hashes every generation to find repeating grids
+        self.cycles = None
+
+        # optional recording.Recorder, every generation is written to it along with metadata()
+        self.recorder = None
+        # extra metadata recorded with every generation, e.g. the colours of a viewer
+        self.annotations = {}
+        # optional export.FrameExporter, every generation is rendered to an image with it
+        self.exporter = None
+
+        # disabled profilers hand out a shared no-op stage, so timing costs nothing until switched on
+        self.profiler = FrameProfiler(enabled=Settings.PROFILER_ENABLED)
+
+        # seed of the initial grid, reported so a run can be repeated
+        self.seed = None
+        self.randomize(life_chance, seed)
+
+    @property
+    def data_grid(self):
+        # the current generation, a view into the front buffer
+        return self.buffers.grid
+
+    @data_grid.setter
+    def data_grid(self, grid):
+        # a new generation is copied into the back buffer, which becomes the front
+        self.buffers.store(grid)
+
+    @property
+    def boundary(self):
+        return self.buffers.boundary
+
+    def set_boundary(self, boundary):
+        # wrapped grids are only stepped whole, tiles and bands would treat the edges as dead
+        if boundary == 'wrap' and (self.tiles is not None or self._parallel is not None):
+            raise ValueError("wrapped boundaries do not work with tiles or parallel stepping")
+        self._check_boundary(boundary, self._mode_name)
+        self.buffers.set_boundary(boundary)
+        self.wake_all()
+        self.reset_cycles()
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def mode_name(self):
+        return self._mode_name
+
+    def get_mode(self, name):
+        return self._modes[name]
+
+    def change_mode(self, name):
+        self._check_boundary(self.boundary, name)
+        self._mode_name = name
+        self._mode = self._modes[name]
+        # tiles asleep under one set of rules may not be stable under another
+        self.wake_all()
+
+    def _check_boundary(self, boundary, name):
+        # modes that are not local move cells across the grid on their own, sand falls onto the bottom edge
+        if boundary == 'wrap' and not self._modes[name].local:
+            raise ValueError(f"mode '{name}' does not work with wrapped boundaries")
+
+    def enable_tiles(self, tile_size=Settings.TILE_SIZE):
+        # all modes share one tracker, since they all step the same grid
+        if self.boundary == 'wrap':
+            raise ValueError("tiles do not work with wrapped boundaries")
+        self.tiles = TileTracker((self.grid_height, self.grid_width), tile_size)
+        for mode in self._modes.values():
+            mode.tiles = self.tiles
+
+    def disable_tiles(self):
+        self.tiles = None
+        for mode in self._modes.values():
+            mode.tiles = None
+
+    def tile_stats(self):
+        return self.tiles.stats() if self.tiles is not None else None
+
+    def notify_cells_changed(self, ys, xs):
+        # cells changed outside of a step, e.g. by a brush stroke, as arrays of row and column indices
+        self.buffers.edited()
+        self.changes.mark_cells(ys, xs)
+        if self.tiles is not None:
+            self.tiles.wake_cells(ys, xs)
+        self.reset_cycles()
+
+    def paint(self, ys, xs, state):
+        # set cells, e.g. under a brush, given as arrays of row and column indices
+        self.data_grid[ys, xs] = state
+        self.notify_cells_changed(ys, xs)
+
+    def paint_region(self, region, state):
+        # region is (top, left, mask) as given by a brush, the cells under the mask are set with one assignment
+        if region is None:
+            return
+        top, left, mask = region
+        height, width = mask.shape
+        self.data_grid[top:top + height, left:left + width][mask] = state
+        self.buffers.edited()
+        self.changes.record_window(top, left, mask)
+        if self.tiles is not None:
+            self.tiles.wake_region(top, top + height, left, left + width)
+        self.reset_cycles()
+
+    def paint_stroke(self, brush, x0, y0, x1, y1, state):
+        # the brush swept from cell (x0, y0) to cell (x1, y1), so fast strokes leave no gaps
+        self.paint_region(brush.stroke_region(self.data_grid.shape, x0, y0, x1, y1), state)
+
+    def wake_all(self):
+        if self.tiles is not None:
+            self.tiles.wake_all()
+
+    def step(self):
+        with self.profiler.stage('step'), self.allocations.measure():
+            signature = self.rule_signature()
+            if self.cycles is not None and self.cycles.in_cycle(signature):
+                # the grid repeats, so the next generation is taken from the cycle instead of being computed
+                new_grid = self.cycles.next_frame(out=self.buffers.next_grid)
+                self.changes.record_step(self.data_grid, new_grid)
+                self.data_grid = new_grid
+            else:
+                previous_grid = self.data_grid
+                if self._parallel is not None and self._mode.local:
+                    new_grid = self._parallel.step(self._mode, self.data_grid)
+                    self.data_grid = self._mode.record_update(self.data_grid, new_grid)
+                else:
+                    self.data_grid = self._mode.update(self.data_grid)
+                if self.cycles is not None:
+                    self.cycles.update(previous_grid, self.data_grid, self.changes.step_changes,
+                                       self.generation + 1, signature)
+            if self.channels is not None:
+                self.channels.update(self.data_grid, self.changes.step_changes, self._mode.velocities)
+        self.generation += 1
+        if self.recorder is not None:
+            self.recorder.record(self.generation, self.data_grid, self.metadata())
+        if self.exporter is not None:
+            self.exporter.record(self.generation, self.frame(self.exporter.channel))
+
+    def enable_channels(self):
+        if self.channels is None:
+            self.channels = CellChannels((self.grid_height, self.grid_width))
+
+    def disable_channels(self):
+        self.channels = None
+
+    def frame(self, channel=None):
+        # what viewers draw, the grid or one of the cell channels
+        if channel is None:
+            return self.data_grid
+        self.enable_channels()
+        return self.channels.layer(channel)
+
+    def rule_signature(self):
+        # cycles only repeat under the same rules, modes that keep state besides the grid never cycle safely
+        if not self._mode.local:
+            return None
+        return self._mode_name, self.get_mode('ca').rule.rulestring
+
+    def enable_cycle_detection(self, fast_forward=Settings.CYCLE_FAST_FORWARD, on_cycle=None):
+        self.cycles = CycleDetector((self.grid_height, self.grid_width), fast_forward, on_cycle)
+        self.reset_cycles()
+
+    def disable_cycle_detection(self):
+        self.cycles = None
+
+    def reset_cycles(self):
+        # the grid was edited, so the hash is recomputed and earlier generations can not repeat any more
+        if self.cycles is not None:
+            self.cycles.reset(self.data_grid, self.generation, self.rule_signature())
+
+    def enable_parallel(self, workers=None, use_processes=True):
+        # local modes are stepped in horizontal bands by a pool of workers, other modes stay serial
+        if self.boundary == 'wrap':
+            raise ValueError("parallel stepping does not work with wrapped boundaries")
+        self.disable_parallel()
+        self._parallel = ParallelStepper((self.grid_height, self.grid_width), workers, use_processes)
+
+    def disable_parallel(self):
+        if self._parallel is not None:
+            self._parallel.close()
+            self._parallel = None
+
+    def step_with_mode(self, name):
+        # apply the rules of another mode for a single generation, then switch back
+        cached_name = self._mode_name
+        self.change_mode(name)
+        self.step()
+        self.change_mode(cached_name)
+
+    def packed_engine(self):
+        # the bit packed engine when nothing looks at the grid between generations, so runs can stay packed
+        if not isinstance(self._mode, modes.CellularAutomataMode) or self._mode.bit_engine is None:
+            return None
+        if self.boundary != 'fill' or self.tiles is not None or self._parallel is not None:
+            return None
+        # every one of these reads each generation, or times each step
+        if any(consumer is not None for consumer in (self.cycles, self.channels, self.recorder, self.exporter)):
+            return None
+        if self.profiler.enabled or self.allocations.enabled:
+            return None
+        return self._mode.bit_engine
+
+    def run(self, steps, report_interval=None, report=print, stop_on_cycle=False):
+        # advance as fast as possible, returns the overall generations per second
+        start = time.perf_counter()
+        first_generation = self.generation
+        last_report = [start, self.generation]
+
+        def report_rate():
+            if report_interval and self.generation % report_interval == 0:
+                now = time.perf_counter()
+                rate = (self.generation - last_report[1]) / max(now - last_report[0], 1e-9)
+                report(f"generation {self.generation}: {rate:.1f} gen/s")
+                last_report[:] = now, self.generation
+
+        engine = self.packed_engine()
+        if engine is not None:
+            # the cells stay packed 64 to a word between reports and are only unpacked once at the end
+            previous_grid = self.data_grid.copy()
+            words = self._mode.packed_grid(self.buffers)
+            remaining = steps
+            while remaining:
+                generations = remaining
+                if report_interval:
+                    generations = min(remaining, report_interval - self.generation % report_interval)
+                words = engine.run_packed(words, self.grid_width, generations)
+                self.generation += generations
+                remaining -= generations
+                report_rate()
+            self.data_grid = engine.unpack(words, self.grid_width)
+            self.changes.record(self.data_grid != previous_grid)
+        else:
+            for _ in range(steps):
+                self.step()
+                self.profiler.end_frame()
+                if stop_on_cycle and self.cycles is not None and self.cycles.period is not None:
+                    break
+                report_rate()
+
+        elapsed = time.perf_counter() - start
+        return (self.generation - first_generation) / max(elapsed, 1e-9)
+
+    def jump(self, exponent=Settings.HASHLIFE_JUMP_EXPONENT):
+        # run the cellular automata rules 2^exponent generations ahead with hashlife
+        # the world is unbounded while jumping, cells that leave the grid are lost when it is copied back
+        if self.boundary == 'wrap':
+            raise ValueError("hashlife does not wrap around the edges")
+        rule = self.get_mode('ca').rule
+        if rule.states > 2:
+            raise ValueError("hashlife only runs two state rules")
+        hashlife = HashLife(rule.birth, rule.survival, max_nodes=Settings.HASHLIFE_MAX_NODES)
+        hashlife.from_array(self.data_grid)
+        hashlife.jump(exponent)
+
+        new_grid = hashlife.window(0, 0, self.grid_width, self.grid_height)
+        self.changes.record(new_grid != self.data_grid)
+        self.data_grid = new_grid
+        self.generation += 1 << exponent
+        self.wake_all()
+        self.reset_cycles()
+        return hashlife
+
+    def metadata(self):
+        ca_mode = self.get_mode('ca')
+        return {
+            'mode': self._mode_name,
+            'rule': ca_mode.rule.rulestring,
+            'preset': ca_mode.preset_name,
+            **self.annotations
+        }
+
+    def start_recording(self, path, keyframe_interval=Settings.RECORDING_KEYFRAME_INTERVAL):
+        # the current grid is the first frame
+        self.stop_recording()
+        self.recorder = Recorder(path, (self.grid_height, self.grid_width), keyframe_interval)
+        self.recorder.record(self.generation, self.data_grid, self.metadata())
+        return self.recorder
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def start_export(self, exporter):
+        # the current grid is the first frame
+        self.stop_export()
+        self.exporter = exporter
+        self.exporter.record(self.generation, self.frame(self.exporter.channel))
+        return self.exporter
+
+    def stop_export(self):
+        # waits for the frames still being encoded
+        if self.exporter is not None:
+            exporter, self.exporter = self.exporter, None
+            exporter.close()
+
+    def load(self, grid, generation=None):
+        # replace the grid, e.g. with a frame of a recording
+        changed = grid != self.data_grid
+        self.changes.record(changed)
+        self.data_grid = grid
+        if self.channels is not None:
+            # channels only follow consecutive frames, after a seek they start over
+            if generation is not None and generation != self.generation + 1:
+                self.channels.reset()
+            self.channels.update(self.data_grid, changed)
+        if generation is not None:
+            self.generation = generation
+        self.wake_all()
+        self.reset_cycles()
+
+    def randomize(self, life_chance=Settings.INITIAL_LIFE_CHANCE, seed=None):
+        # set each cell as alive with probability life_chance
+        self.initialize('uniform', seed, life_chance=life_chance)
+
+    def initialize(self, name='uniform', seed=None, **params):
+        # replace the grid with one from an initializers generator, the same seed always gives the same grid
+        self.seed = initializers.new_seed() if seed is None else seed
+        self.data_grid = initializers.generate(name, (self.grid_height, self.grid_width), self.seed, **params)
+        self.changes.mark_all()
+        if self.channels is not None:
+            self.channels.reset()
+        self.wake_all()
+        self.reset_cycles()
+
+    def clear(self):
+        self.changes.record(self.data_grid != 0)
+        # the back buffer is zeroed in place rather than replaced by a new array
+        self.data_grid = 0
+        if self.channels is not None:
+            self.channels.reset()
+        self.wake_all()
+        self.reset_cycles()
+
+    def in_grid(self, x, y):
+        return 0 <= x < self.grid_width and 0 <= y < self.grid_height
@@ -0,0 +1,112 @@
+import numpy as np
+from scipy.ndimage import binary_dilation
+from config.settings import Settings
+
+
+class TileTracker:
+
+    def __init__(self, grid_shape, tile_size=Settings.TILE_SIZE, settle_steps=1):
+        self.grid_height, self.grid_width = grid_shape
+        self.tile_size = tile_size
+        self.tiles_y = -(-self.grid_height // tile_size)
+        self.tiles_x = -(-self.grid_width // tile_size)
+
+        # number of steps each tile and its neighbours have gone without a change
+        # a tile sleeps once it has been quiet for settle_steps steps
+        self.settle_steps = settle_steps
+        self._quiet = np.zeros((self.tiles_y, self.tiles_x), dtype=np.int32)
+
+        # tiles a change can reach in one step, from the radius of the last mode that stepped
+        self._reach = 1
+
+        # running totals of recomputed and skipped tiles
+        self.tiles_computed = 0
+        self.tiles_skipped = 0
+
+    @property
+    def active(self):
+        return self._quiet < self.settle_steps
+
+    def active_cells(self):
+        # per cell view of the active tile bitmap
+        cells = np.repeat(np.repeat(self.active, self.tile_size, axis=0), self.tile_size, axis=1)
+        return cells[:self.grid_height, :self.grid_width]
+
+    def active_regions(self):
+        # horizontal runs of active tiles, as (y0, y1, x0, x1) cell ranges
+        active = self.active
+        for tile_y in range(self.tiles_y):
+            row = np.concatenate(([False], active[tile_y], [False]))
+            edges = np.flatnonzero(row[1:] != row[:-1])
+            y0 = tile_y * self.tile_size
+            y1 = min(y0 + self.tile_size, self.grid_height)
+            for start, stop in zip(edges[0::2], edges[1::2]):
+                yield y0, y1, start * self.tile_size, min(stop * self.tile_size, self.grid_width)
+
+    def step(self, grid, step, radius):
+        # apply a local rule to the active tiles only, reading radius cells of halo around each run of tiles
+        if self.active.sum() >= Settings.TILE_FULL_STEP_FRACTION * self.active.size:
+            # stepping the whole grid at once is cheaper than stitching most of it together
+            self.count_step(full=True)
+            return step(grid)
+
+        self.count_step()
+        new_grid = grid.copy()
+        for y0, y1, x0, x1 in self.active_regions():
+            halo_y0, halo_y1 = max(y0 - radius, 0), min(y1 + radius, self.grid_height)
+            halo_x0, halo_x1 = max(x0 - radius, 0), min(x1 + radius, self.grid_width)
+            region = step(grid[halo_y0:halo_y1, halo_x0:halo_x1])
+            new_grid[y0:y1, x0:x1] = region[y0 - halo_y0:y1 - halo_y0, x0 - halo_x0:x1 - halo_x0]
+        return new_grid
+
+    def count_step(self, full=False):
+        active_count = self.active.size if full else int(self.active.sum())
+        self.tiles_computed += active_count
+        self.tiles_skipped += self.active.size - active_count
+
+    def record_changes(self, changed, radius, settle_steps=1):
+        # changed is a boolean mask of the cells that changed this step
+        self._reach = max(1, -(-radius // self.tile_size))
+        self.settle_steps = settle_steps
+        touched = self._tiles_containing(changed)
+        self._quiet += 1
+        self._quiet[self._dilate(touched)] = 0
+
+    def wake(self, changed):
+        # wake the tiles around cells changed outside of a step, e.g. by a brush stroke
+        self._quiet[self._dilate(self._tiles_containing(changed))] = 0
+
+    def wake_cells(self, ys, xs):
+        # cells given as arrays of row and column indices
+        tiles = np.zeros_like(self._quiet, dtype=bool)
+        tiles[np.asarray(ys) // self.tile_size, np.asarray(xs) // self.tile_size] = True
+        self._quiet[self._dilate(tiles)] = 0
+
+    def wake_region(self, y0, y1, x0, x1):
+        # cells y0 to y1 and x0 to x1, end exclusive
+        tiles = np.zeros_like(self._quiet, dtype=bool)
+        tiles[y0 // self.tile_size:-(-y1 // self.tile_size), x0 // self.tile_size:-(-x1 // self.tile_size)] = True
+        self._quiet[self._dilate(tiles)] = 0
+
+    def wake_all(self):
+        self._quiet[:] = 0
+
+    def stats(self):
+        active_count = int(self.active.sum())
+        return {
+            'active': active_count,
+            'sleeping': self.active.size - active_count,
+            'total': self.active.size,
+            'active_fraction': active_count / self.active.size,
+            'tiles_computed': self.tiles_computed,
+            'tiles_skipped': self.tiles_skipped
+        }
+
+    def _tiles_containing(self, changed):
+        padded = np.zeros((self.tiles_y * self.tile_size, self.tiles_x * self.tile_size), dtype=bool)
+        padded[:self.grid_height, :self.grid_width] = changed
+        return padded.reshape(self.tiles_y, self.tile_size, self.tiles_x, self.tile_size).any(axis=(1, 3))
+
+    def _dilate(self, tiles):
+        structure = np.ones((2 * self._reach + 1, 2 * self._reach + 1), dtype=bool)
+        return binary_dilation(tiles, structure=structure)
@@ -0,0 +1,151 @@
+import sys
+import threading
+import time
+from collections import deque
+import numpy as np
+from config.settings import Settings
+
+
+class FrameRing:
+    # bounded ring of preallocated frames, written by one producer and read by one consumer
+    # frames are published by bumping a sequence number, so neither side ever waits for the other
+
+    def __init__(self, grid_shape, capacity=Settings.FRAME_RING_SIZE):
+        self.capacity = capacity
+        self.frames = np.zeros((capacity,) + tuple(grid_shape), dtype=np.uint8)
+        self.generations = np.zeros(capacity, dtype=np.int64)
+        # (first, last) rows changed by each frame, last exclusive
+        self.row_spans = np.zeros((capacity, 2), dtype=np.int64)
+
+        # number of frames published so far, the newest frame lives in slot (sequence - 1) % capacity
+        self.sequence = 0
+
+    def publish(self, grid, generation, row_span):
+        slot = self.sequence % self.capacity
+        np.copyto(self.frames[slot], grid, casting='unsafe')
+        self.generations[slot] = generation
+        self.row_spans[slot] = row_span
+        self.sequence += 1
+
+    def read_latest(self, out, since):
+        # copies the newest frame into out, returns (sequence, generation, row span changed since frame `since`)
+        # frames in between are dropped, their changed rows are coalesced into the returned span
+        while True:
+            sequence = self.sequence
+            if sequence == since:
+                return sequence, None, (0, 0)
+            slot = (sequence - 1) % self.capacity
+            np.copyto(out, self.frames[slot])
+            generation = int(self.generations[slot])
+
+            # the producer may have lapped the ring while the frame was copied, then it is read again
+            if self.sequence - sequence < self.capacity - 1:
+                break
+
+        skipped = sequence - since
+        if since < 0 or skipped >= self.capacity:
+            # the changes of some frames were overwritten already
+            return sequence, generation, (0, out.shape[0])
+        slots = np.arange(since, sequence) % self.capacity
+        spans = self.row_spans[slots]
+        spans = spans[spans[:, 0] < spans[:, 1]]
+        if not len(spans):
+            return sequence, generation, (0, 0)
+        return sequence, generation, (int(spans[:, 0].min()), int(spans[:, 1].max()))
+
+
+class SimulationWorker:
+    # steps a simulation on a background thread and publishes every generation into a FrameRing
+    # everything that changes the simulation from another thread goes through submit()
+
+    def __init__(self, simulation, capacity=Settings.FRAME_RING_SIZE):
+        self.simulation = simulation
+        self.ring = FrameRing((simulation.grid_height, simulation.grid_width), capacity)
+        self.paused = False
+        # cell channel published instead of the grid, None for the grid, changed with set_channel
+        self.channel = None
+        # commands that raised, and the last error
+        self.failed_commands = 0
+        self.last_error = None
+
+        # deque appends and pops are atomic, so commands are passed without a lock
+        self._commands = deque()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # the first frame is published before the first step, so the viewer has something to show
+        self._publish()
+
+    def frame_rate(self):
+        # generations per second for the current mode, 0 runs as fast as possible
+        if self.simulation.mode_name == 'sand':
+            return Settings.SAND_FRAME_RATE
+        return Settings.SIMULATION_FRAME_RATE
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='simulation', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # commands sent while stopping still apply
+        if self._run_commands():
+            self._publish()
+
+    def submit(self, function, *args):
+        # run function(*args) on the worker before its next step
+        self._commands.append((function, args))
+
+    def _run_commands(self):
+        ran = False
+        while self._commands:
+            function, args = self._commands.popleft()
+            # a failing command is reported and dropped, the simulation goes on stepping
+            try:
+                function(*args)
+            except Exception as error:
+                self.failed_commands += 1
+                self.last_error = error
+                print(f"command {getattr(function, '__name__', function)} failed: {error!r}", file=sys.stderr)
+            ran = True
+        return ran
+
+    def set_channel(self, channel):
+        # submitted like any other command, so the next frame is published in the new channel, every row of it
+        self.channel = channel
+        self.simulation.changes.mark_all()
+
+    def _publish(self):
+        changes = self.simulation.changes
+        # channels change wherever cells are alive or fading, so their frames cover every row
+        row_span = changes.row_span() if self.channel is None else (0, self.simulation.grid_height)
+        self.ring.publish(self.simulation.frame(self.channel), self.simulation.generation, row_span)
+        changes.clear()
+
+    def _run(self):
+        next_step = time.perf_counter()
+        while not self._stop.is_set():
+            changed = self._run_commands()
+            if not self.paused:
+                self.simulation.step()
+                changed = True
+            if changed:
+                self._publish()
+
+            # wait for the next generation, or a frame at the visual rate for commands while paused
+            frame_rate = self.frame_rate()
+            if self.paused:
+                time.sleep(1 / Settings.VISUAL_FRAME_RATE)
+                next_step = time.perf_counter()
+            elif frame_rate:
+                next_step += 1 / frame_rate
+                delay = next_step - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # a slow step does not build up a backlog of generations to catch up on
+                    next_step = time.perf_counter()